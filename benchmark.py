@@ -0,0 +1,465 @@
+"""Benchmark harness for the media tools in main.py.
+
+Generates deterministic test media with FFmpeg's lavfi sources, runs every tool through
+FastMCP's call_tool (the same dispatch path the server uses) and writes the results to JSON.
+
+    python benchmark.py                              # full run, writes benchmark_results.json
+    python benchmark.py --quick --tools trim_video   # smallest source only, one tool
+    python benchmark.py --baseline baseline.json     # compare and exit 1 on regressions
+
+Each case runs in its own worker process, so RUSAGE_CHILDREN reflects only the FFmpeg/FFprobe
+children of that case (CPU time and peak RSS).
+
+The *_url cases read their source from a local HTTP server with byte-range support, standing in
+for an object store, and report how many bytes were actually fetched; the *_mount cases pass a
+file:// path under MEDIA_MOUNT_ROOTS. The frame_stream case drives open_frame_stream, write_frames
+and close_frame_stream in sequence; the job cases drive submit_job, job_status, cancel_job and
+list_jobs.
+
+Every run starts without cached probes, indexes, proxies, thumbnail sheets or loudness
+measurements, so repeats measure the same work as the first run.
+"""
+import argparse
+import asyncio
+import base64
+import functools
+import http.server
+import json
+import os
+import platform
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from typing import List, Dict, Any
+
+# Source media: label -> (width, height, duration in seconds)
+SOURCES = {
+    "360p_5s": (640, 360, 5),
+    "720p_10s": (1280, 720, 10),
+    "1080p_10s": (1920, 1080, 10),
+}
+QUICK_SOURCES = ["360p_5s"]
+FRAME_RATE = 25
+
+# Frames sent per write_frames call by the frame_stream case
+FRAME_BATCH = 8
+
+# Benchmark cases: name -> (tool, output extension, arguments); {src}, {url}, {mount}, {audio},
+# {image}, {frames}, {frame_files} (a list) and {out} are filled in per source. The pseudo-tool
+# frame_stream sends {frame_files} through a frame stream; the pseudo-tool job runs an operation
+# as a background job and waits for it (or cancels it at once with "cancel").
+CASES = {
+    "trim_copy": ("trim_video", ".mp4", {"input_file": "{src}", "start_time": "1", "duration": "3", "output_file": "{out}"}),
+    "trim_accurate": ("trim_video", ".mp4", {"input_file": "{src}", "start_time": "1.3", "duration": "2.5", "output_file": "{out}", "accurate": True}),
+    "fade": ("fade_video", ".mp4", {"input_file": "{src}", "fade_in_duration": 1, "fade_out_duration": 1, "output_file": "{out}"}),
+    "concatenate": ("concatenate_videos", ".mp4", {"input_files": ["{src}", "{src}"], "output_file": "{out}"}),
+    "split": ("split_video", "_%03d.mp4", {"input_file": "{src}", "segment_duration": 2, "output_pattern": "{out}"}),
+    "extract_audio": ("extract_audio", ".mp3", {"video_file": "{src}", "output_audio_file": "{out}"}),
+    "merge_audio_video": ("merge_audio_video", ".mp4", {"video_file": "{src}", "audio_file": "{audio}", "output_file": "{out}"}),
+    "replace_audio": ("replace_audio_track", ".mp4", {"input_video": "{src}", "input_audio": "{audio}", "output_file": "{out}"}),
+    "video_to_images": ("video_to_images", "_%04d.jpg", {"input_file": "{src}", "output_pattern": "{out}", "frame_rate": 2}),
+    "images_to_video": ("images_to_video", ".mp4", {"input_pattern": "{frames}", "frame_rate": 5, "output_file": "{out}"}),
+    "images_to_video_files": ("images_to_video", ".mp4", {"input_pattern": "", "input_files": "{frame_files}", "frame_rate": 5, "output_file": "{out}"}),
+    "frame_stream": ("frame_stream", ".mp4", {"output_file": "{out}", "frame_rate": 5, "frames": "{frame_files}"}),
+    "overlay_image": ("overlay_image", ".mp4", {"input_video": "{src}", "input_image": "{image}", "position": "top-right", "output_file": "{out}"}),
+    "apply_overlay": ("apply_overlay", ".mp4", {"input_file": "{src}", "overlay_file": "{image}", "position": "center", "opacity": 0.5, "output_file": "{out}"}),
+    "transform_scale": ("transform_video", ".mp4", {"input_file": "{src}", "transformation": "scale", "params": {"width": 640, "height": -2}, "output_file": "{out}"}),
+    "color_curves": ("apply_color_curves", ".mp4", {"input_file": "{src}", "red_curve": "0/0 0.5/0.6 1/1", "green_curve": "0/0 1/1", "blue_curve": "0/0 0.5/0.4 1/1", "output_file": "{out}"}),
+    "set_fps": ("set_video_fps", ".mp4", {"input_file": "{src}", "fps": 15, "output_file": "{out}"}),
+    "noise": ("add_video_noise", ".mp4", {"input_file": "{src}", "noise_strength": 20, "noise_flags": "t+u", "output_file": "{out}"}),
+    "filter_template": ("apply_filter_template", ".mp4", {"input_file": "{src}", "template_name": "matrix", "output_file": "{out}"}),
+    "generate_proxy": ("generate_proxy", "", {"input_file": "{src}"}),
+    "filter_template_preview": ("apply_filter_template", ".mp4", {"input_file": "{src}", "template_name": "matrix", "output_file": "{out}", "preview": True}),
+    "filter_template_preview_webm": ("apply_filter_template", ".webm", {"input_file": "{src}", "template_name": "matrix", "output_file": "{out}", "preview": True}),
+    "filter_template_preview_image": ("apply_filter_template", ".jpg", {"input_file": "{src}", "template_name": "matrix", "output_file": "{out}", "preview": True}),
+    "color_curves_preview": ("apply_color_curves", ".mp4", {"input_file": "{src}", "red_curve": "0/0 0.5/0.6 1/1", "green_curve": "0/0 1/1", "blue_curve": "0/0 0.5/0.4 1/1", "output_file": "{out}", "preview": True}),
+    "apply_overlay_preview": ("apply_overlay", ".mp4", {"input_file": "{src}", "overlay_file": "{image}", "position": "center", "opacity": 0.5, "output_file": "{out}", "preview": True}),
+    "list_templates": ("list_filter_templates", "", {}),
+    "describe_template": ("describe_filter_template", "", {"template_name": "matrix"}),
+    "list_profiles": ("list_encoder_profiles", "", {}),
+    "output_cache_stats": ("get_output_cache_stats", "", {}),
+    "derived_cache_stats": ("get_derived_cache_stats", "", {}),
+    "extract_frames": ("extract_frames", "", {"input_file": "{src}", "max_frames": 8}),
+    "extract_frames_scenes": ("extract_frames", "", {"input_file": "{src}", "scene_threshold": 0.3, "max_frames": 8}),
+    "extract_frames_sheet": ("extract_frames", "", {"input_file": "{src}", "interval": 1, "contact_sheet": True}),
+    "query_media": ("query_media", "", {"query": "type=video height>=360", "sort": "-duration"}),
+    "batch_apply": ("batch_apply", "", {"operation": "trim_video", "params": {"start_time": "1", "duration": "2"},
+                                        "files": ["{src}", "{src}", "{src}", "{src}"], "output_name": "{out}_{{index}}.mp4"}),
+    "job": ("job", ".mp4", {"operation": "trim_video", "params": {"input_file": "{src}", "start_time": "1", "duration": "3", "output_file": "{out}"}}),
+    "job_cancel": ("job", ".mp4", {"operation": "fade_video", "params": {"input_file": "{src}", "fade_in_duration": 1, "fade_out_duration": 1, "output_file": "{out}"}, "cancel": True}),
+    "pipeline": ("run_pipeline", ".mp4", {"input_file": "{src}", "operations": [
+        {"op": "trim", "start_time": 0.5, "duration": 3},
+        {"op": "template", "name": "batman"},
+        {"op": "fade", "fade_in": 0.5, "fade_out": 0.5},
+    ], "output_file": "{out}"}),
+    "package_hls": ("package_stream", "", {"input_file": "{src}", "output_dir": "{out}", "ladder": [
+        {"height": 360, "bitrate": "800k"}, {"height": 240, "bitrate": "400k"}
+    ]}),
+    "package_hls_dash": ("package_stream", "", {"input_file": "{src}", "output_dir": "{out}", "formats": ["hls", "dash"], "ladder": [
+        {"height": 360, "bitrate": "800k"}, {"height": 240, "bitrate": "400k"}
+    ]}),
+    "process_audio": ("process_audio", ".mp4", {"input_file": "{src}", "output_file": "{out}"}),
+    "process_audio_music": ("process_audio", ".mp4", {"input_file": "{src}", "output_file": "{out}", "music_file": "{audio}"}),
+    "thumbnails": ("generate_thumbnails", "", {"input_file": "{src}", "output_name": "{out}", "interval": 1, "columns": 5, "rows": 5}),
+    "thumbnails_exact": ("generate_thumbnails", "", {"input_file": "{src}", "output_name": "{out}", "interval": 1, "columns": 5, "rows": 5, "snap_to_keyframes": False}),
+    "trim_copy_url": ("trim_video", ".mp4", {"input_file": "{url}", "start_time": "1", "duration": "3", "output_file": "{out}"}),
+    "trim_accurate_url": ("trim_video", ".mp4", {"input_file": "{url}", "start_time": "1.3", "duration": "2.5", "output_file": "{out}", "accurate": True}),
+    "fade_url": ("fade_video", ".mp4", {"input_file": "{url}", "fade_in_duration": 1, "fade_out_duration": 1, "output_file": "{out}"}),
+    "extract_audio_url": ("extract_audio", ".mp3", {"video_file": "{url}", "output_audio_file": "{out}"}),
+    "process_audio_url": ("process_audio", ".mp4", {"input_file": "{url}", "output_file": "{out}"}),
+    "thumbnails_url": ("generate_thumbnails", "", {"input_file": "{url}", "output_name": "{out}", "interval": 1, "columns": 5, "rows": 5}),
+    "package_hls_url": ("package_stream", "", {"input_file": "{url}", "output_dir": "{out}", "ladder": [{"height": 240, "bitrate": "400k"}]}),
+    "trim_copy_mount": ("trim_video", ".mp4", {"input_file": "{mount}", "start_time": "1", "duration": "3", "output_file": "{out}"}),
+}
+
+# Static file server with single byte ranges and keep-alive, standing in for an object store
+class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    bytes_sent = 0
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return None
+        stat = os.stat(path)
+        start, end = 0, stat.st_size - 1
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range", "").strip())
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), end) if match.group(2) else end
+            else:
+                start = max(stat.st_size - int(match.group(2)), 0)
+            if start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{stat.st_size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{stat.st_size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"')
+        self.send_header("Last-Modified", self.date_time_string(stat.st_mtime))
+        self.end_headers()
+        f = open(path, "rb")
+        f.seek(start)
+        self.remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        try:
+            while self.remaining > 0:
+                chunk = source.read(min(64 * 1024, self.remaining))
+                if not chunk:
+                    break
+                outputfile.write(chunk)
+                self.remaining -= len(chunk)
+                RangeRequestHandler.bytes_sent += len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            # FFmpeg dropped the connection to seek elsewhere
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+# Helper function to serve media_dir over HTTP from a background thread
+def start_media_server(media_dir: str) -> http.server.ThreadingHTTPServer:
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(RangeRequestHandler, directory=media_dir))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# Helper function to run FFmpeg for fixture generation
+def generate(args: List[str]) -> None:
+    subprocess.run(["ffmpeg", "-y", "-v", "error", *args], check=True)
+
+# Helper function to build the deterministic fixture set in media_dir
+def generate_media(media_dir: str, labels: List[str]) -> None:
+    """Creates testsrc/sine clips for each source label plus shared audio, overlay and frame fixtures."""
+    for label in labels:
+        width, height, duration = SOURCES[label]
+        generate([
+            "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={FRAME_RATE}:duration={duration}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={duration}",
+            "-c:v", "libx264", "-preset", "veryfast", "-g", str(FRAME_RATE * 2), "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-b:a", "128k", "-shortest", "-fflags", "+bitexact",
+            os.path.join(media_dir, f"src_{label}.mp4")
+        ])
+        generate([
+            "-f", "lavfi", "-i", f"testsrc=size={width}x{height}:rate=5:duration=4",
+            os.path.join(media_dir, f"frames_{label}_%04d.png")
+        ])
+    generate(["-f", "lavfi", "-i", "sine=frequency=660:sample_rate=48000:duration=12", "-c:a", "libmp3lame", os.path.join(media_dir, "audio.mp3")])
+    generate(["-f", "lavfi", "-i", "testsrc=size=200x120:rate=1:duration=1", "-frames:v", "1", os.path.join(media_dir, "overlay.png")])
+    filters_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "filters")
+    shutil.copytree(filters_dir, os.path.join(media_dir, "filters"), dirs_exist_ok=True)
+
+# Helper function to substitute fixture names into case arguments
+def fill(value: Any, names: Dict[str, Any]) -> Any:
+    if isinstance(value, str):
+        # A lone placeholder of a list-valued name becomes the list itself
+        if value.startswith("{") and value.endswith("}") and isinstance(names.get(value[1:-1]), list):
+            return names[value[1:-1]]
+        return value.format(**names)
+    if isinstance(value, list):
+        return [fill(v, names) for v in value]
+    if isinstance(value, dict):
+        return {k: fill(v, names) for k, v in value.items()}
+    return value
+
+# Helper function to measure an output file (or every file of an output pattern or directory)
+def measure_output(media_dir: str, stem: str) -> Dict[str, Any]:
+    outputs = []
+    for f in os.listdir(media_dir):
+        if not f.startswith(stem):
+            continue
+        path = os.path.join(media_dir, f)
+        if os.path.isdir(path):
+            outputs += [os.path.join(root, name) for root, _, names in os.walk(path) for name in names]
+        else:
+            outputs.append(path)
+    size = sum(os.path.getsize(f) for f in outputs)
+    duration = None
+    if len(outputs) == 1:
+        probe = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "json", outputs[0]],
+            capture_output=True, text=True
+        )
+        try:
+            duration = float(json.loads(probe.stdout)["format"]["duration"])
+        except (ValueError, KeyError, TypeError):
+            pass
+    for f in os.listdir(media_dir):
+        if f.startswith(stem):
+            path = os.path.join(media_dir, f)
+            shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+    return {
+        "output_files": len(outputs),
+        "output_bytes": size,
+        "output_duration": duration,
+        "output_bitrate": round(size * 8 / duration) if duration else None,
+    }
+
+# Helper function to send frame files through a frame stream, FRAME_BATCH at a time
+async def stream_frames(main, arguments: Dict[str, Any]) -> list:
+    """Returns the content of the close_frame_stream call, or of the first call that failed."""
+    frames = arguments.pop("frames")
+    content = await main.mcp.call_tool("open_frame_stream", arguments)
+    if content[0].text.startswith("Error"):
+        return content
+    stream_id = json.loads(content[0].text)["stream_id"]
+    for start in range(0, len(frames), FRAME_BATCH):
+        batch = []
+        for index in range(start, min(start + FRAME_BATCH, len(frames))):
+            with open(os.path.join(main.MEDIA_DIR, frames[index]), "rb") as f:
+                batch.append({"index": index, "data": base64.b64encode(f.read()).decode()})
+        content = await main.mcp.call_tool("write_frames", {"stream_id": stream_id, "frames": batch})
+        if content[0].text.startswith("Error"):
+            await main.mcp.call_tool("close_frame_stream", {"stream_id": stream_id, "abort": True})
+            return content
+    return await main.mcp.call_tool("close_frame_stream", {"stream_id": stream_id})
+
+# Helper function to run an operation as a background job and poll it to completion
+async def run_job(main, arguments: Dict[str, Any]) -> list:
+    """Returns the final job_status content, or an error if the job did not end as expected."""
+    cancel = arguments.pop("cancel", False)
+    content = await main.mcp.call_tool("submit_job", arguments)
+    if content[0].text.startswith("Error"):
+        return content
+    job_id = json.loads(content[0].text)["job_id"]
+    if cancel:
+        content = await main.mcp.call_tool("cancel_job", {"job_id": job_id})
+        if content[0].text.startswith("Error"):
+            return content
+    while True:
+        content = await main.mcp.call_tool("job_status", {"job_id": job_id})
+        job = json.loads(content[0].text)
+        if job["status"] not in ("queued", "running"):
+            break
+        await asyncio.sleep(0.05)
+    await main.mcp.call_tool("list_jobs", {})
+    expected = "cancelled" if cancel else "succeeded"
+    if job["status"] != expected:
+        return [types.SimpleNamespace(text=f"Error: job {job['status']}: {job.get('result')}")]
+    return content
+
+# Worker: run one case in this process and print its measurements as JSON
+def run_case(media_dir: str, media_url: str, case: str, label: str) -> Dict[str, Any]:
+    os.environ["MEDIA_DIR"] = media_dir
+    os.environ["MEDIA_MOUNT_ROOTS"] = media_dir
+    os.environ.setdefault("MEDIA_CACHE_DIR", os.path.join(media_dir, ".media_cache"))
+    # Every run must do the work; a cached output would measure a file copy
+    os.environ["MEDIA_OUTPUT_CACHE_MAX_BYTES"] = "0"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import main
+    # Probes, indexes, proxies, thumbnail sheets and loudness measurements have caches of their own
+    for directory in [main.THUMBNAIL_CACHE_DIR, main.INDEX_DIR, main.PROXY_DIR]:
+        shutil.rmtree(directory, ignore_errors=True)
+    db = main.get_probe_db()
+    db.execute("DELETE FROM probes")
+    db.execute("DELETE FROM loudness")
+    db.commit()
+
+    tool, extension, arguments = CASES[case]
+    stem = f"out_{case}_{label}"
+    names = {
+        "src": f"src_{label}.mp4",
+        "url": f"{media_url}/src_{label}.mp4",
+        "mount": "file://" + os.path.join(os.path.abspath(media_dir), f"src_{label}.mp4"),
+        "audio": "audio.mp3",
+        "image": "overlay.png",
+        "frames": f"frames_{label}_%04d.png",
+        "frame_files": sorted(f for f in os.listdir(media_dir) if f.startswith(f"frames_{label}_")),
+        "out": stem + extension,
+    }
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+    if tool == "frame_stream":
+        content = asyncio.run(stream_frames(main, fill(arguments, names)))
+    elif tool == "job":
+        content = asyncio.run(run_job(main, fill(arguments, names)))
+    else:
+        content = asyncio.run(main.mcp.call_tool(tool, fill(arguments, names)))
+    wall = time.perf_counter() - started
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    message = " ".join(getattr(item, "text", "") for item in content)
+    return {
+        "case": case,
+        "tool": tool,
+        "source": label,
+        "ok": not message.startswith("Error"),
+        "message": message[:500],
+        "wall_seconds": round(wall, 4),
+        "cpu_seconds": round((after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime), 4),
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        "peak_rss_kib": after.ru_maxrss // (1024 if sys.platform == "darwin" else 1),
+        **measure_output(media_dir, stem),
+    }
+
+# Helper function to run one case in a fresh worker process
+def spawn_case(media_dir: str, media_url: str, case: str, label: str) -> Dict[str, Any]:
+    bytes_before = RangeRequestHandler.bytes_sent
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", case, label, "--media-dir", media_dir, "--media-url", media_url],
+        capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        return {"case": case, "tool": CASES[case][0], "source": label, "ok": False, "message": proc.stderr[-500:]}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    if case.endswith("_url"):
+        result["remote_bytes_read"] = RangeRequestHandler.bytes_sent - bytes_before
+        result["source_bytes"] = os.path.getsize(os.path.join(media_dir, f"src_{label}.mp4"))
+    return result
+
+# Helper function to compare a run against a stored baseline
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], threshold: float) -> List[Dict[str, Any]]:
+    """Returns cases that now fail, or whose median wall time or CPU time grew by more than threshold (a fraction)."""
+    previous = {(r["case"], r["source"]): r for r in baseline if r.get("ok")}
+    regressions = []
+    for result in results:
+        old = previous.get((result["case"], result["source"]))
+        if old is None:
+            continue
+        if not result.get("ok"):
+            regressions.append({
+                "case": result["case"], "source": result["source"], "metric": "ok",
+                "baseline": True, "current": False, "change": "failed",
+            })
+            continue
+        for metric in ["wall_seconds", "cpu_seconds"]:
+            if old.get(metric) and result[metric] > old[metric] * (1 + threshold):
+                regressions.append({
+                    "case": result["case"], "source": result["source"], "metric": metric,
+                    "baseline": old[metric], "current": result[metric],
+                    "change": f"{(result[metric] / old[metric] - 1) * 100:+.1f}%",
+                })
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the media tools in main.py.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the results JSON")
+    parser.add_argument("--baseline", help="Results JSON from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown before a case counts as a regression")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; median wall and CPU times are reported")
+    parser.add_argument("--tools", nargs="*", help="Only run cases for these tools (or case names)")
+    parser.add_argument("--quick", action="store_true", help="Only use the smallest source")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated media directory")
+    parser.add_argument("--media-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--media-url", help=argparse.SUPPRESS)
+    parser.add_argument("--worker", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_case(args.media_dir, args.media_url, *args.worker)))
+        return 0
+
+    labels = QUICK_SOURCES if args.quick else list(SOURCES)
+    cases = [c for c in CASES if not args.tools or c in args.tools or CASES[c][0] in args.tools]
+    media_dir = args.media_dir or tempfile.mkdtemp(prefix="media-bench-")
+    print(f"Generating test media in {media_dir}")
+    generate_media(media_dir, labels)
+    server = start_media_server(media_dir)
+    media_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    results = []
+    try:
+        for label in labels:
+            for case in cases:
+                runs = [spawn_case(media_dir, media_url, case, label) for _ in range(args.repeat)]
+                ok_runs = sorted((r for r in runs if r["ok"]), key=lambda r: r["wall_seconds"])
+                result = ok_runs[len(ok_runs) // 2] if ok_runs else runs[-1]
+                if ok_runs:
+                    # Each timing is the median of its own samples, not the CPU time of the median-wall run
+                    cpu = sorted(r["cpu_seconds"] for r in ok_runs)
+                    result = {**result, "cpu_seconds": cpu[len(cpu) // 2]}
+                result["runs"] = [r.get("wall_seconds") for r in runs]
+                results.append(result)
+                if result["ok"]:
+                    remote = f" {result['remote_bytes_read']:>12} B of {result['source_bytes']} read" if "remote_bytes_read" in result else ""
+                    print(f"{case:22} {label:10} {result['wall_seconds']:8.3f}s wall {result['cpu_seconds']:8.3f}s cpu "
+                          f"{result['peak_rss_kib'] / 1024:8.1f} MiB {result['output_bytes']:>12} B{remote}")
+                else:
+                    print(f"{case:22} {label:10} FAILED: {result['message'][:120]}")
+    finally:
+        server.shutdown()
+        if not args.keep and not args.media_dir:
+            shutil.rmtree(media_dir, ignore_errors=True)
+
+    ffmpeg_version = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout.split("\n")[0]
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": ffmpeg_version,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report["baseline"] = args.baseline
+        report["regressions"] = compare(results, baseline["results"], args.threshold)
+        for r in report["regressions"]:
+            print(f"REGRESSION {r['case']} {r['source']} {r['metric']}: {r['baseline']} -> {r['current']} ({r['change']})")
+        exit_code = 1 if report["regressions"] else 0
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,56 @@
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import FastMCP, Image
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+import asyncio
+import base64
+import binascii
+import bisect
+import contextvars
+import fnmatch
+import functools
+import hashlib
+import http.server
+import inspect
+import itertools
 import json
+import logging
+import math
 import os
+import re
+import shutil
+import sqlite3
 import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from array import array
+from collections import OrderedDict, deque
 from typing import List, Dict, Any
 
+MEDIA_DIR = os.environ.get("MEDIA_DIR", "E:/project")
+# Server-owned state (job table, caches) lives here, out of the way of media listings
+CACHE_DIR = os.environ.get("MEDIA_CACHE_DIR", os.path.join(MEDIA_DIR, ".media_cache"))
+# Per-job scratch directories; may point at a fast local disk or tmpfs. On the same filesystem
+# as MEDIA_DIR finished outputs are hardlinked into place, elsewhere they are copied next to it first
+SCRATCH_DIR = os.environ.get("MEDIA_SCRATCH_DIR", os.path.join(CACHE_DIR, "scratch"))
+
+# Start background services once per process, whichever transport is in use
+@asynccontextmanager
+async def server_lifespan(server):
+    ensure_orphan_cleanup()
+    ensure_job_workers()
+    ensure_media_index()
+    ensure_template_registry()
+    ensure_metrics_endpoint()
+    ensure_frame_stream_reaper()
+    yield {}
+
 # Initialize the MCP server
-mcp = FastMCP("Media Manipulation Server")
-MEDIA_DIR = "E:/project"
+logger = logging.getLogger(__name__)
+mcp = FastMCP("Media Manipulation Server", lifespan=server_lifespan)
 
 # Valid extensions for video, audio, and image files
 VIDEO_EXTENSIONS = ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm']
@@ -32,80 +76,1394 @@ TRANSFORM_PARAMS = {
     "pad": ["width", "height", "x", "y"]
 }
 
-# Resource to list available media files
-@mcp.resource("directory://media")
-def get_media_files() -> str:
-    """Returns a JSON list of media files in the E:/project directory."""
-    files = os.listdir(MEDIA_DIR)
-    media_files = [f for f in files if f.lower().endswith(tuple(VIDEO_EXTENSIONS + AUDIO_EXTENSIONS + IMAGE_EXTENSIONS))]
-    return json.dumps(media_files)
+# Required parameters for each run_pipeline operation
+PIPELINE_OPERATIONS = {
+    "trim": ["start_time", "duration"],
+    "transform": ["transformation", "params"],
+    "color_curves": ["red", "green", "blue"],
+    "template": ["name"],
+    "fps": ["fps"],
+    "noise": ["strength", "flags"],
+    "fade": [],
+    "overlay": ["file", "position"]
+}
+# Accepted types of pipeline operation parameters (required and optional)
+PIPELINE_PARAM_TYPES = {
+    "start_time": (int, float, str), "duration": (int, float, str), "fps": (int, float), "strength": (int, float),
+    "fade_in": (int, float), "fade_out": (int, float), "opacity": (int, float),
+    "transformation": str, "params": dict, "red": str, "green": str, "blue": str,
+    "name": str, "overrides": dict, "flags": str, "file": str, "position": str
+}
 
-# Resource to get metadata for a specific file
-@mcp.resource("metadata://{filename}")
-def get_metadata(filename: str) -> str:
-    """Returns JSON metadata for the specified media file using ffprobe."""
-    file_path = os.path.join(MEDIA_DIR, filename)
-    if not os.path.exists(file_path):
-        return json.dumps({"error": "File not found"})
-    
+# Encoder profiles shared by every tool that encodes video; pick one with the profile parameter
+ENCODER_PROFILES = {
+    "draft": {"codec": "libx264", "preset": "ultrafast", "crf": 28, "tune": "fastdecode"},
+    "balanced": {"codec": "libx264", "preset": "medium", "crf": 23},
+    "archive": {"codec": "libx264", "preset": "slow", "crf": 18, "tune": "film"},
+    "x265-balanced": {"codec": "libx265", "preset": "medium", "crf": 28},
+    "x265-archive": {"codec": "libx265", "preset": "slow", "crf": 22},
+    "vp9-draft": {"codec": "libvpx-vp9", "preset": "realtime", "cpu_used": 8, "crf": 40},
+    "vp9-balanced": {"codec": "libvpx-vp9", "preset": "good", "cpu_used": 2, "crf": 32},
+    "av1-draft": {"codec": "libsvtav1", "preset": 10, "crf": 40},
+    "av1-balanced": {"codec": "libsvtav1", "preset": 6, "crf": 32}
+}
+DEFAULT_ENCODER_PROFILE = os.environ.get("MEDIA_ENCODER_PROFILE", "balanced")
+# Encoder threads per FFmpeg process; 0 lets the encoder decide
+ENCODER_THREADS = int(os.environ.get("MEDIA_ENCODER_THREADS", 0))
+# Containers each encoder can be written to
+CODEC_CONTAINERS = {
+    "libx264": ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv'],
+    "libx265": ['.mp4', '.mkv', '.mov'],
+    "libvpx-vp9": ['.webm', '.mkv', '.mp4'],
+    "libsvtav1": ['.webm', '.mkv', '.mp4']
+}
+# Profile used instead of a tool's default profile when its codec cannot go into the output container
+CONTAINER_DEFAULT_PROFILES = {".webm": "vp9-balanced"}
+
+# Upper bound on concurrent FFmpeg encodes; defaults to one per CPU core
+MAX_FFMPEG_PROCESSES = int(os.environ.get("MEDIA_MAX_FFMPEG_PROCESSES", os.cpu_count() or 1))
+# FFprobe runs are cheap, so they get their own larger pool instead of queueing behind encodes
+MAX_FFPROBE_PROCESSES = int(os.environ.get("MEDIA_MAX_FFPROBE_PROCESSES", 4 * (os.cpu_count() or 1)))
+# Frame-stream encodes are paced by whoever supplies the frames, so they are capped separately
+# instead of holding encode slots while they wait
+MAX_FRAME_STREAMS = int(os.environ.get("MEDIA_MAX_FRAME_STREAMS", MAX_FFMPEG_PROCESSES))
+ffmpeg_slots = asyncio.Semaphore(MAX_FFMPEG_PROCESSES)
+ffprobe_slots = asyncio.Semaphore(MAX_FFPROBE_PROCESSES)
+frame_stream_slots = asyncio.Semaphore(MAX_FRAME_STREAMS)
+
+# Helper function to run a subprocess without blocking the event loop
+async def run_process(cmd: List[str], slots: asyncio.Semaphore) -> subprocess.CompletedProcess:
+    """Runs a command once a slot is free, raising CalledProcessError on a non-zero exit."""
+    cmd = with_remote_options(cmd)
+    async with slots:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await proc.communicate()
+        except asyncio.CancelledError:
+            # Never leave an orphaned encoder running after the caller goes away
+            proc.kill()
+            await proc.wait()
+            raise
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+# Lines of FFmpeg stderr kept for error messages
+STDERR_TAIL_LINES = int(os.environ.get("MEDIA_STDERR_TAIL_LINES", 200))
+# Set while a background job runs so progress lands in the job table
+current_job_id = contextvars.ContextVar("current_job_id", default=None)
+in_batch = contextvars.ContextVar("in_batch", default=False)
+
+# Samples kept per tool for percentile estimates
+METRICS_WINDOW = int(os.environ.get("MEDIA_METRICS_WINDOW", 1000))
+# Serve Prometheus text metrics on this port when set (local-only unless the host is widened)
+METRICS_PORT = os.environ.get("MEDIA_METRICS_PORT")
+METRICS_HOST = os.environ.get("MEDIA_METRICS_HOST", "127.0.0.1")
+METRICS_STAGES = ["validate", "probe", "queue", "ffmpeg", "cache", "temp", "rename"]
+METRICS_STARTED = time.time()
+tool_metrics = {}
+metrics_server = None
+# Stage timings of the tool call running in this context
+current_call = contextvars.ContextVar("current_call", default=None)
+
+# Helper function to time one stage of the current tool call
+@contextmanager
+def span(stage: str):
+    """Adds the time spent inside the block to the current tool call's stage totals."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        call = current_call.get()
+        if call is not None:
+            call["stages"][stage] = call["stages"].get(stage, 0.0) + time.perf_counter() - started
+
+# Helper function to fold one finished tool call into the aggregates
+def record_call(key: str, seconds: float, ok: bool, call: Dict[str, Any]) -> None:
+    metrics = tool_metrics.get(key)
+    if metrics is None:
+        metrics = tool_metrics[key] = {
+            "calls": 0, "errors": 0, "total_seconds": 0.0, "child_cpu_seconds": 0.0, "child_peak_rss_kib": 0,
+            "durations": deque(maxlen=METRICS_WINDOW), "stages": {}, "stage_totals": {}
+        }
+    metrics["calls"] += 1
+    metrics["errors"] += 0 if ok else 1
+    # Percentiles use the sliding window; sums and counts are all-time so they stay consistent counters
+    metrics["total_seconds"] += seconds
+    metrics["durations"].append(seconds)
+    metrics["child_cpu_seconds"] += call["child_cpu_seconds"]
+    metrics["child_peak_rss_kib"] = max(metrics["child_peak_rss_kib"], call["child_peak_rss_kib"])
+    for stage, stage_seconds in call["stages"].items():
+        metrics["stages"].setdefault(stage, deque(maxlen=METRICS_WINDOW)).append(stage_seconds)
+        metrics["stage_totals"][stage] = metrics["stage_totals"].get(stage, 0.0) + stage_seconds
+
+# Decorator timing every stage of a tool call
+def instrumented(func):
+    """Records total and per-stage timings plus FFmpeg child usage per tool (and per template)."""
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        call = {"stages": {}, "child_cpu_seconds": 0.0, "child_peak_rss_kib": 0}
+        token = current_call.set(call)
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = await func(*args, **kwargs)
+            ok = not (isinstance(result, str) and result.startswith("Error"))
+            return result
+        finally:
+            current_call.reset(token)
+            seconds = time.perf_counter() - started
+            # Whatever the named stages do not cover is argument checking and command building
+            call["stages"]["validate"] = max(seconds - sum(call["stages"].values()), 0.0)
+            record_call(func.__name__, seconds, ok, call)
+            try:
+                template = signature.bind_partial(*args, **kwargs).arguments.get("template_name")
+            except TypeError:
+                template = None
+            if template:
+                # The name comes from the client; only registered templates get their own series
+                if not isinstance(template, str) or template not in template_registry.templates:
+                    template = "unknown"
+                record_call(f"{func.__name__}[{template}]", seconds, ok, call)
+    return wrapper
+
+# Helper function to summarise a list of samples
+def percentiles(samples) -> Dict[str, float]:
+    """Returns nearest-rank p50/p95/p99 of samples in seconds."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"p50": None, "p95": None, "p99": None}
+    pick = lambda q: round(ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))], 4)
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+# Helper function to snapshot the aggregates (also used from the Prometheus thread)
+def metrics_snapshot() -> Dict[str, Any]:
+    tools = {}
+    for key, metrics in list(tool_metrics.items()):
+        durations = list(metrics["durations"])
+        tools[key] = {
+            "calls": metrics["calls"],
+            "errors": metrics["errors"],
+            **percentiles(durations),
+            "sum_seconds": round(metrics["total_seconds"], 4),
+            "child_cpu_seconds": round(metrics["child_cpu_seconds"], 4),
+            "child_peak_rss_kib": metrics["child_peak_rss_kib"],
+            "stages": {
+                stage: {**percentiles(list(samples)), "sum_seconds": round(metrics["stage_totals"].get(stage, 0.0), 4)}
+                for stage, samples in list(metrics["stages"].items())
+            }
+        }
+    return {"uptime_seconds": round(time.time() - METRICS_STARTED, 1), "window": METRICS_WINDOW, "tools": tools}
+
+# Helper function to escape a Prometheus label value
+def prometheus_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# Helper function to render the aggregates in the Prometheus text format
+def prometheus_metrics() -> str:
+    lines = [
+        "# TYPE media_tool_duration_seconds summary",
+        "# TYPE media_tool_stage_seconds summary",
+        "# TYPE media_tool_calls_total counter",
+        "# TYPE media_tool_errors_total counter",
+        "# TYPE media_tool_child_cpu_seconds_total counter",
+    ]
+    for key, metrics in metrics_snapshot()["tools"].items():
+        tool, _, template = key.partition("[")
+        labels = f'tool="{prometheus_label(tool)}"' + (f',template="{prometheus_label(template[:-1])}"' if template else "")
+        for quantile, value in [("p50", "0.5"), ("p95", "0.95"), ("p99", "0.99")]:
+            if metrics[quantile] is not None:
+                lines.append(f'media_tool_duration_seconds{{{labels},quantile="{value}"}} {metrics[quantile]}')
+            for stage, stage_metrics in metrics["stages"].items():
+                if stage_metrics[quantile] is not None:
+                    lines.append(f'media_tool_stage_seconds{{{labels},stage="{prometheus_label(stage)}",quantile="{value}"}} {stage_metrics[quantile]}')
+        lines.append(f"media_tool_duration_seconds_sum{{{labels}}} {metrics['sum_seconds']}")
+        lines.append(f"media_tool_duration_seconds_count{{{labels}}} {metrics['calls']}")
+        lines.append(f"media_tool_calls_total{{{labels}}} {metrics['calls']}")
+        lines.append(f"media_tool_errors_total{{{labels}}} {metrics['errors']}")
+        lines.append(f"media_tool_child_cpu_seconds_total{{{labels}}} {metrics['child_cpu_seconds']}")
+    return "\n".join(lines) + "\n"
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = prometheus_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+# Helper function to start the optional Prometheus endpoint once
+def ensure_metrics_endpoint() -> None:
+    global metrics_server
+    if METRICS_PORT and metrics_server is None:
+        metrics_server = http.server.ThreadingHTTPServer((METRICS_HOST, int(METRICS_PORT)), MetricsHandler)
+        threading.Thread(target=metrics_server.serve_forever, daemon=True).start()
+
+# Resource exposing per-tool latency percentiles and stage breakdowns
+@mcp.resource("metrics://server")
+def get_server_metrics() -> str:
+    """Returns JSON p50/p95/p99 latencies per tool and template, broken down by stage."""
+    return json.dumps(metrics_snapshot())
+
+# Helper function to work out how much media an FFmpeg command will process
+async def get_command_duration(cmd: List[str]) -> float:
+    """Returns the expected output duration of an FFmpeg command from its first input, or 0.0 if unknown.
+
+    A concat demuxer list counts as the sum of the files it lists.
+    """
+    if "-i" not in cmd:
+        return 0.0
+    index = cmd.index("-i")
+    input_path = cmd[index + 1]
+    input_options = cmd[:index]
+    if any(option == "-f" and value == "concat" for option, value in zip(input_options, input_options[1:])):
+        try:
+            parts = read_concat_list(input_path)
+        except OSError:
+            return 0.0
+        duration = sum(await asyncio.gather(*(get_video_duration(part) for part in parts)))
+    elif os.path.isfile(input_path) or is_url(input_path):
+        duration = await get_video_duration(input_path)
+    else:
+        return 0.0
+    try:
+        if "-ss" in input_options:
+            duration -= float(input_options[input_options.index("-ss") + 1])
+        if "-t" in input_options:
+            duration = min(duration, float(input_options[input_options.index("-t") + 1]))
+    except ValueError:
+        pass
+    return max(duration, 0.0)
+
+# Helper function to turn one -progress block into a progress report
+def parse_progress(block: Dict[str, str], duration: float) -> Dict[str, Any]:
+    """Returns percent, fps, speed, bitrate and ETA for a block of FFmpeg -progress key=value pairs."""
+    try:
+        out_time = int(block.get("out_time_us", "")) / 1_000_000
+    except ValueError:
+        out_time = 0.0
+    try:
+        fps = float(block.get("fps", ""))
+    except ValueError:
+        fps = None
+    try:
+        speed = float(block.get("speed", "").rstrip("x"))
+    except ValueError:
+        speed = None
+    progress = {
+        "out_time": out_time,
+        "fps": fps,
+        "speed": speed,
+        "bitrate": block.get("bitrate", "N/A").strip(),
+        "percent": None,
+        "eta": None
+    }
+    if duration > 0:
+        progress["percent"] = min(100.0, round(out_time / duration * 100, 1))
+        if speed:
+            progress["eta"] = round(max(duration - out_time, 0.0) / speed, 1)
+    if block.get("progress") == "end":
+        progress["percent"] = 100.0
+        progress["eta"] = 0.0
+    return progress
+
+async def report_progress(progress: Dict[str, Any]) -> None:
+    """Publishes FFmpeg progress to the current job record and as an MCP progress notification.
+
+    MCP progress notifications only carry progress/total, so speed, fps and ETA are
+    available from the job record (job_status) but not from the notification itself.
+    """
+    if in_batch.get():
+        # Items of a batch report aggregate progress from batch_apply instead
+        return
+    job_id = current_job_id.get()
+    if job_id is not None:
+        # The request that queued the job has already returned; job_status is the only reader
+        update_job(job_id, progress=json.dumps(progress))
+        return
+    if progress["percent"] is None:
+        return
+    try:
+        await mcp.get_context().report_progress(progress["percent"], 100)
+    except Exception as e:
+        # Not inside an MCP request, or the client went away; progress is best effort
+        logger.debug("Progress notification failed: %s", e)
+
+async def read_progress(stream: asyncio.StreamReader, duration: float) -> None:
+    """Stream-parses FFmpeg -progress output, reporting each completed block."""
+    block = {}
+    while line := await stream.readline():
+        key, _, value = line.decode(errors="replace").strip().partition("=")
+        block[key] = value
+        if key == "progress":
+            await report_progress(parse_progress(block, duration))
+            block = {}
+
+async def read_stderr_tail(stream: asyncio.StreamReader, tail: deque) -> None:
+    """Keeps only the last lines of FFmpeg stderr so long runs cannot grow memory."""
+    while line := await stream.readline():
+        tail.append(line.decode(errors="replace").rstrip())
+
+# Helper function to charge an FFmpeg child's resource usage to the current tool call
+def record_child_usage(stderr_tail: deque) -> None:
+    """Parses the -benchmark summary ("bench: utime=...s stime=...s", "bench: maxrss=...KiB") from FFmpeg stderr."""
+    call = current_call.get()
+    if call is None:
+        return
+    for line in stderr_tail:
+        if match := re.search(r"bench: utime=([\d.]+)s stime=([\d.]+)s", line):
+            call["child_cpu_seconds"] += float(match.group(1)) + float(match.group(2))
+        elif match := re.search(r"bench: maxrss=(\d+)\s*(KiB|kB)", line):
+            call["child_peak_rss_kib"] = max(call["child_peak_rss_kib"], int(match.group(1)))
+
+async def run_ffmpeg(cmd: List[str], duration: float = None, feed=None, slots: asyncio.Semaphore = None) -> subprocess.CompletedProcess:
+    """Runs an FFmpeg command in the bounded FFmpeg worker pool (or slots), reporting progress as it goes.
+
+    feed, if given, is a coroutine function that receives FFmpeg's stdin writer and must close it.
+    """
+    if duration is None:
+        duration = await get_command_duration(cmd)
+    # -benchmark makes FFmpeg report its own CPU time and peak RSS (getrusage) on exit
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats", "-benchmark", *with_remote_options(cmd)[1:]]
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    queued = time.perf_counter()
+    async with slots or ffmpeg_slots:
+        call = current_call.get()
+        if call is not None:
+            call["stages"]["queue"] = call["stages"].get("queue", 0.0) + time.perf_counter() - queued
+        with span("ffmpeg"):
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=subprocess.PIPE if feed else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                limit=1024 * 1024
+            )
+            try:
+                await asyncio.gather(
+                    read_progress(proc.stdout, duration),
+                    read_stderr_tail(proc.stderr, stderr_tail),
+                    *([feed(proc.stdin)] if feed else [])
+                )
+                await proc.wait()
+            except asyncio.CancelledError:
+                proc.kill()
+                await proc.wait()
+                raise
+    record_child_usage(stderr_tail)
+    stderr = "\n".join(stderr_tail).encode()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output=b"", stderr=stderr)
+    return subprocess.CompletedProcess(cmd, proc.returncode, b"", stderr)
+
+async def run_ffprobe(cmd: List[str]) -> subprocess.CompletedProcess:
+    """Runs an FFprobe command in the bounded FFprobe worker pool."""
+    with span("probe"):
+        return await run_process(cmd, ffprobe_slots)
+
+# Helper function to run encodes side by side without leaving any behind on failure
+async def gather_or_cancel(*aws) -> list:
+    """Like asyncio.gather, but on the first failure cancels and awaits the rest before re-raising."""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+# Helper function to swap a defaulted profile for one the output container accepts
+def container_profile(profile: str, output_file: str, default: str = DEFAULT_ENCODER_PROFILE) -> str:
+    """Returns profile, or the container's default profile if profile is the tool default and cannot be written there."""
+    ext = os.path.splitext(output_file)[1].lower()
+    if profile == default and profile in ENCODER_PROFILES and ext not in CODEC_CONTAINERS[ENCODER_PROFILES[profile]["codec"]]:
+        return CONTAINER_DEFAULT_PROFILES.get(ext, profile)
+    return profile
+
+# Helper function to check an encoder profile against the output container
+def validate_encoder_profile(profile: str, output_file: str) -> str:
+    """Returns an error message if the profile is unknown or cannot be written to output_file, else None."""
+    if profile not in ENCODER_PROFILES:
+        return f"Error: Invalid profile. Must be one of {list(ENCODER_PROFILES.keys())}"
+    codec = ENCODER_PROFILES[profile]["codec"]
+    ext = os.path.splitext(output_file)[1].lower()
+    if ext not in CODEC_CONTAINERS[codec]:
+        return f"Error: Profile {profile} ({codec}) cannot be written to {ext}. Use one of {CODEC_CONTAINERS[codec]}"
+    return None
+
+# Helper function to turn an encoder profile into FFmpeg arguments
+def encoder_args(profile: str, pix_fmt: str = None) -> List[str]:
+    """Returns the -c:v/preset/crf/tune/threads arguments for an encoder profile, plus -pix_fmt if given.
+
+    Without pix_fmt the encoder keeps the source's pixel format (or its closest supported one).
+    """
+    settings = ENCODER_PROFILES[profile]
+    codec = settings["codec"]
+    args = ["-c:v", codec]
+    if codec == "libvpx-vp9":
+        # VP9 only honours -crf in constant-quality mode, which needs -b:v 0
+        args += ["-deadline", settings["preset"], "-cpu-used", str(settings["cpu_used"]), "-row-mt", "1",
+                 "-crf", str(settings["crf"]), "-b:v", "0"]
+    else:
+        args += ["-preset", str(settings["preset"]), "-crf", str(settings["crf"])]
+    if settings.get("tune"):
+        args += ["-tune", settings["tune"]]
+    if ENCODER_THREADS:
+        args += ["-threads", str(ENCODER_THREADS)]
+    return args + (["-pix_fmt", pix_fmt] if pix_fmt else [])
+
+# Tool to list encoder profiles
+@mcp.tool()
+def list_encoder_profiles() -> str:
+    """List the encoder profiles accepted by the profile parameter of the encoding tools."""
+    return json.dumps({
+        name: {**settings, "containers": CODEC_CONTAINERS[settings["codec"]], "default": name == DEFAULT_ENCODER_PROFILE}
+        for name, settings in ENCODER_PROFILES.items()
+    })
+
+# Number of parsed ffprobe results kept in memory in front of the on-disk cache
+PROBE_CACHE_SIZE = int(os.environ.get("MEDIA_PROBE_CACHE_SIZE", 1024))
+probe_memory_cache = OrderedDict()
+probe_inflight = {}
+probe_db = None
+PROBE_STATS = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "errors": 0}
+
+# Helper function to open the on-disk probe cache
+def get_probe_db() -> sqlite3.Connection:
+    """Returns the SQLite connection holding cached ffprobe results, creating it on first use."""
+    global probe_db
+    if probe_db is None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        probe_db = sqlite3.connect(os.path.join(CACHE_DIR, "probe_cache.db"))
+        probe_db.execute(
+            "CREATE TABLE IF NOT EXISTS probes ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, data TEXT)"
+        )
+        # Loudness measurements, keyed by a hash of the input versions, audio graph and targets
+        probe_db.execute("CREATE TABLE IF NOT EXISTS loudness (key TEXT PRIMARY KEY, data TEXT, created REAL)")
+        probe_db.commit()
+    return probe_db
+
+async def file_identity(file_path: str) -> tuple:
+    """Returns the (path, size, mtime_ns) triple that identifies one version of a file.
+
+    For a URL it is (url, size, ETag or Last-Modified) from the HEAD request made when the
+    tool checked its inputs, re-checked in a worker thread once it is older than URL_IDENTITY_TTL.
+    """
+    if is_url(file_path):
+        return await asyncio.to_thread(url_identity, file_path)
+    stat = os.stat(file_path)
+    return (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+
+# Directories where object-store gateways are mounted; file:// inputs must resolve inside one
+MOUNT_ROOTS = [os.path.realpath(root) for root in os.environ.get("MEDIA_MOUNT_ROOTS", "").split(os.pathsep) if root]
+URL_SCHEMES = ("http://", "https://")
+# Bytes FFmpeg reads through on an open connection instead of issuing a new range request
+URL_READ_AHEAD = int(os.environ.get("MEDIA_URL_READ_AHEAD", 4 * 1024 * 1024))
+URL_TIMEOUT = float(os.environ.get("MEDIA_URL_TIMEOUT", 30))
+URL_RECONNECT_DELAY_MAX = int(os.environ.get("MEDIA_URL_RECONNECT_DELAY_MAX", 10))
+# Seconds a URL's HEAD response identifies its version before it is checked again
+URL_IDENTITY_TTL = float(os.environ.get("MEDIA_URL_IDENTITY_TTL", 30))
+# Bytes probed from a remote input; enough for container headers without reading the media
+REMOTE_PROBE_SIZE = int(os.environ.get("MEDIA_REMOTE_PROBE_SIZE", 1024 * 1024))
+# URL identities remembered at once; the least recently used are dropped first
+URL_IDENTITY_CACHE_SIZE = int(os.environ.get("MEDIA_URL_IDENTITY_CACHE_SIZE", 1024))
+url_identities = OrderedDict()
+# url_identity also runs in worker threads (asyncio.to_thread)
+url_identities_lock = threading.Lock()
+
+def is_url(path: str) -> bool:
+    return isinstance(path, str) and path.lower().startswith(URL_SCHEMES)
+
+def is_input_uri(name: str) -> bool:
+    return is_url(name) or name.lower().startswith("file://")
+
+def is_mounted(path: str) -> bool:
+    real_path = os.path.realpath(path)
+    return any(real_path == root or real_path.startswith(root + os.sep) for root in MOUNT_ROOTS)
+
+def is_scratch(path: str) -> bool:
+    return os.path.realpath(path).startswith(os.path.realpath(SCRATCH_DIR) + os.sep)
+
+# Helper function to turn a tool's input argument into something FFmpeg can open
+def resolve_input(name: str) -> str:
+    """Returns the path under MEDIA_DIR, the URL itself, or the local path of a file:// URI.
+
+    file:// URIs outside every MEDIA_MOUNT_ROOTS entry resolve to None, which input_exists rejects.
+    """
+    if is_url(name):
+        return name
+    if name.lower().startswith("file://"):
+        parsed = urllib.parse.urlparse(name)
+        path = os.path.realpath(urllib.parse.unquote(parsed.path))
+        if parsed.netloc not in ("", "localhost") or not is_mounted(path):
+            return None
+        return path
+    return os.path.join(MEDIA_DIR, name)
+
+# Helper function to identify the current version of a URL without downloading it
+def url_identity(url: str, max_age: float = URL_IDENTITY_TTL) -> tuple:
+    """Returns (url, size, validator) from a HEAD request, or a one-byte range GET where HEAD is refused.
+
+    Responses without an ETag or Last-Modified get a fresh validator each time, so results
+    for unversioned URLs are never served from the caches.
+    """
+    with url_identities_lock:
+        cached = url_identities.get(url)
+        if cached is not None and time.monotonic() - cached[0] < max_age:
+            url_identities.move_to_end(url)
+            return cached[1]
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, method="HEAD"), timeout=URL_TIMEOUT) as response:
+            headers = response.headers
+            size = int(headers.get("Content-Length") or -1)
+    except urllib.error.HTTPError as e:
+        if e.code not in (403, 405, 501):
+            raise
+        request = urllib.request.Request(url, headers={"Range": "bytes=0-0"})
+        with urllib.request.urlopen(request, timeout=URL_TIMEOUT) as response:
+            headers = response.headers
+            size = int((headers.get("Content-Range") or "/-1").rpartition("/")[2].replace("*", "-1"))
+    validator = headers.get("ETag") or headers.get("Last-Modified") or f"unversioned-{uuid.uuid4().hex}"
+    identity = (url, size, validator)
+    with url_identities_lock:
+        url_identities[url] = (time.monotonic(), identity)
+        url_identities.move_to_end(url)
+        while len(url_identities) > URL_IDENTITY_CACHE_SIZE:
+            url_identities.popitem(last=False)
+    return identity
+
+# Helper function to check that a resolved input can be read
+async def input_exists(path: str) -> bool:
+    """Checks a local path on disk and a URL with a (cached) HEAD request."""
+    if path is None:
+        return False
+    if is_url(path):
+        try:
+            await asyncio.to_thread(url_identity, path)
+            return True
+        except (OSError, ValueError):
+            return False
+    return os.path.exists(path)
+
+# Helper function to get the input options FFmpeg/FFprobe need for a remote input
+def remote_input_options(path: str) -> List[str]:
+    """Returns HTTP options for URLs (persistent range requests, read-ahead, reconnects) and a bounded probe for any remote input."""
+    options = []
+    if is_url(path):
+        options += [
+            "-multiple_requests", "1",
+            "-short_seek_size", str(URL_READ_AHEAD),
+            "-reconnect", "1",
+            "-reconnect_on_network_error", "1",
+            "-reconnect_delay_max", str(URL_RECONNECT_DELAY_MAX),
+            "-rw_timeout", str(int(URL_TIMEOUT * 1_000_000))
+        ]
+    if options or (MOUNT_ROOTS and os.path.isabs(path) and is_mounted(path)):
+        options += ["-probesize", str(REMOTE_PROBE_SIZE)]
+    return options
+
+def with_remote_options(cmd: List[str]) -> List[str]:
+    """Inserts remote_input_options before each input: every -i for FFmpeg, the trailing path for FFprobe."""
+    result = cmd[:1]
+    for index in range(1, len(cmd)):
+        if cmd[0] == "ffprobe" and index == len(cmd) - 1:
+            result += remote_input_options(cmd[index])
+        elif cmd[index] == "-i" and index + 1 < len(cmd):
+            result += remote_input_options(cmd[index + 1])
+        result.append(cmd[index])
+    return result
+
+def remember_probe(key: tuple, metadata: Dict[str, Any]) -> None:
+    """Stores a probe result in the in-memory LRU, evicting the least recently used entry."""
+    probe_memory_cache[key] = metadata
+    probe_memory_cache.move_to_end(key)
+    while len(probe_memory_cache) > PROBE_CACHE_SIZE:
+        probe_memory_cache.popitem(last=False)
+
+# Helper function to probe a file once per version
+async def probe_media(file_path: str) -> Dict[str, Any]:
+    """Returns parsed ffprobe format/stream metadata, served from cache while the file is unchanged."""
+    key = await file_identity(file_path)
+    if key in probe_memory_cache:
+        PROBE_STATS["memory_hits"] += 1
+        probe_memory_cache.move_to_end(key)
+        return probe_memory_cache[key]
+
+    row = get_probe_db().execute(
+        "SELECT data FROM probes WHERE path = ? AND size = ? AND mtime_ns = ?", key
+    ).fetchone()
+    if row is not None:
+        PROBE_STATS["disk_hits"] += 1
+        metadata = json.loads(row[0])
+        remember_probe(key, metadata)
+        return metadata
+
+    # Concurrent callers for the same file version share one ffprobe run
+    if key not in probe_inflight:
+        probe_inflight[key] = asyncio.ensure_future(run_probe(key))
+    try:
+        return await asyncio.shield(probe_inflight[key])
+    finally:
+        if probe_inflight.get(key) is not None and probe_inflight[key].done():
+            probe_inflight.pop(key, None)
+
+async def run_probe(key: tuple) -> Dict[str, Any]:
+    """Runs ffprobe for a file version and stores the result in both cache tiers."""
     cmd = [
         "ffprobe",
         "-v", "quiet",
         "-print_format", "json",
         "-show_format",
         "-show_streams",
-        file_path
+        key[0]
     ]
     try:
-        result = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True)
-        metadata = json.loads(result.stdout)
+        result = await run_ffprobe(cmd)
+    except subprocess.CalledProcessError:
+        PROBE_STATS["errors"] += 1
+        raise
+    PROBE_STATS["misses"] += 1
+    metadata = json.loads(result.stdout)
+    # Intermediates are deleted within the call; only the in-memory tier may hold them
+    if is_url(key[0]) or not is_scratch(key[0]):
+        db = get_probe_db()
+        db.execute("INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?)", (*key, json.dumps(metadata)))
+        db.commit()
+    remember_probe(key, metadata)
+    return metadata
+
+# Resource exposing probe cache hit/miss counters
+@mcp.resource("metrics://probe_cache")
+def get_probe_cache_stats() -> str:
+    """Returns JSON hit/miss counters for the ffprobe metadata cache."""
+    lookups = PROBE_STATS["memory_hits"] + PROBE_STATS["disk_hits"] + PROBE_STATS["misses"]
+    hits = PROBE_STATS["memory_hits"] + PROBE_STATS["disk_hits"]
+    return json.dumps({
+        **PROBE_STATS,
+        "hit_ratio": round(hits / lookups, 4) if lookups else None,
+        "memory_entries": len(probe_memory_cache),
+        "memory_capacity": PROBE_CACHE_SIZE
+    })
+
+# Resource to get metadata for a specific file
+@mcp.resource("metadata://{filename}")
+async def get_metadata(filename: str) -> str:
+    """Returns JSON metadata for the specified media file using ffprobe."""
+    file_path = os.path.join(MEDIA_DIR, filename)
+    if not os.path.exists(file_path):
+        return json.dumps({"error": "File not found"})
+    
+    try:
+        metadata = await probe_media(file_path)
         return json.dumps(metadata)
     except subprocess.CalledProcessError as e:
         return json.dumps({"error": str(e)})
 
 # Helper function to get audio codec of a file
-def get_audio_codec(file_path: str) -> str:
+async def get_audio_codec(file_path: str) -> str:
     """Returns the audio codec of a media file using ffprobe."""
-    cmd = [
-        "ffprobe",
-        "-v", "quiet",
-        "-print_format", "json",
-        "-show_streams",
-        file_path
-    ]
     try:
-        result = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True)
-        metadata = json.loads(result.stdout)
+        metadata = await probe_media(file_path)
         for stream in metadata.get("streams", []):
             if stream.get("codec_type") == "audio":
                 return stream.get("codec_name", "unknown")
         return "none"
-    except subprocess.CalledProcessError:
+    except (subprocess.CalledProcessError, OSError):
         return "error"
 
     
 # Helper function to get video duration for fade tool
-def get_video_duration(file_path: str) -> float:
+async def get_video_duration(file_path: str) -> float:
     """Returns the duration of a video file in seconds using ffprobe."""
-    cmd = [
-        "ffprobe",
-        "-v", "error",
-        "-show_entries", "format=duration",
-        "-of", "default=noprint_wrappers=1:nokey=1",
-        file_path
-    ]
     try:
-        result = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True)
-        return float(result.stdout.strip())
-    except (subprocess.CalledProcessError, ValueError):
+        metadata = await probe_media(file_path)
+        return float(metadata.get("format", {}).get("duration", 0.0))
+    except (subprocess.CalledProcessError, OSError, ValueError):
         return 0.0
 
+# Seconds between incremental rescans of MEDIA_DIR for the media index
+MEDIA_INDEX_INTERVAL = float(os.environ.get("MEDIA_INDEX_INTERVAL", 30))
+# Fields of an index record that compare numerically in query filters
+MEDIA_INDEX_NUMERIC_FIELDS = ["size", "duration", "width", "height", "bitrate"]
+MEDIA_INDEX_FIELDS = ["name", "type", "ext", "codec", "audio_codec"] + MEDIA_INDEX_NUMERIC_FIELDS
+QUERY_PATTERN = re.compile(r"^(\w+)(>=|<=|!=|=|>|<)(.+)$")
+
+media_index = {}
+media_index_ready = None
+media_index_task = None
+
+def media_type(file_name: str) -> str:
+    """Returns 'video', 'audio', 'image' or None based on the file extension."""
+    ext = os.path.splitext(file_name)[1].lower()
+    if ext in VIDEO_EXTENSIONS:
+        return "video"
+    if ext in AUDIO_EXTENSIONS:
+        return "audio"
+    if ext in IMAGE_EXTENSIONS:
+        return "image"
+    return None
+
+def summarize_media(name: str, size: int, mtime_ns: int, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the flat index record for a file from its probe metadata."""
+    streams = metadata.get("streams", [])
+    video = next((st for st in streams if st.get("codec_type") == "video"), {})
+    audio = next((st for st in streams if st.get("codec_type") == "audio"), {})
+    fmt = metadata.get("format", {})
+    try:
+        duration = float(fmt.get("duration"))
+    except (TypeError, ValueError):
+        duration = None
+    try:
+        bitrate = int(fmt.get("bit_rate"))
+    except (TypeError, ValueError):
+        bitrate = None
+    return {
+        "name": name,
+        "type": media_type(name),
+        "ext": os.path.splitext(name)[1].lower(),
+        "size": size,
+        "mtime_ns": mtime_ns,
+        "duration": duration,
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "codec": video.get("codec_name") or audio.get("codec_name"),
+        "audio_codec": audio.get("codec_name"),
+        "bitrate": bitrate
+    }
+
+def walk_media_dir() -> Dict[str, tuple]:
+    """Returns {relative path: (size, mtime_ns)} for every media file under MEDIA_DIR."""
+    found = {}
+    cache_dir = os.path.abspath(CACHE_DIR)
+    for root, dirs, files in os.walk(MEDIA_DIR):
+        dirs[:] = [d for d in dirs if not d.startswith(".") and os.path.abspath(os.path.join(root, d)) != cache_dir]
+        for f in files:
+            # Hidden files include outputs still being copied into place
+            if f.startswith(".") or media_type(f) is None:
+                continue
+            full_path = os.path.join(root, f)
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                continue
+            found[os.path.relpath(full_path, MEDIA_DIR).replace(os.sep, "/")] = (stat.st_size, stat.st_mtime_ns)
+    return found
+
+# Helper function to bring the media index up to date
+async def scan_media_index(walked: asyncio.Event = None) -> Dict[str, int]:
+    """Re-stats MEDIA_DIR and probes only new or changed files; returns added/updated/removed counts.
+
+    New and changed files enter the index from the stat walk alone, and walked (if given) is set
+    at that point; their probe fields are filled in as the probes complete.
+    """
+    found = await asyncio.to_thread(walk_media_dir)
+    counts = {"added": 0, "updated": 0, "removed": 0}
+    for name in list(media_index):
+        if name not in found:
+            del media_index[name]
+            counts["removed"] += 1
+
+    async def index_file(name, size, mtime_ns):
+        try:
+            metadata = await probe_media(os.path.join(MEDIA_DIR, name))
+        except (subprocess.CalledProcessError, OSError):
+            metadata = {}
+        # The file may have changed again, or gone, while it was being probed
+        if name in media_index and (media_index[name]["size"], media_index[name]["mtime_ns"]) == (size, mtime_ns):
+            media_index[name] = {**summarize_media(name, size, mtime_ns, metadata), "probed": True}
+
+    changed = []
+    for name, (size, mtime_ns) in found.items():
+        record = media_index.get(name)
+        if record is not None and record["probed"] and (record["size"], record["mtime_ns"]) == (size, mtime_ns):
+            continue
+        counts["updated" if record is not None else "added"] += 1
+        # Stat-only until the probe completes; duration, dimensions, codecs and bitrate are None
+        media_index[name] = {**summarize_media(name, size, mtime_ns, {}), "probed": False}
+        changed.append(index_file(name, size, mtime_ns))
+    if walked is not None:
+        walked.set()
+    await asyncio.gather(*changed)
+    return counts
+
+async def media_index_loop() -> None:
+    """Keeps the media index fresh by rescanning MEDIA_DIR on an interval."""
+    while True:
+        try:
+            await scan_media_index(media_index_ready)
+        except Exception:
+            # One bad scan must not kill the scanner or leave list_media waiting forever
+            logger.exception("Media index scan failed")
+        finally:
+            media_index_ready.set()
+        await asyncio.sleep(MEDIA_INDEX_INTERVAL)
+
+def ensure_media_index() -> None:
+    """Starts the background media index scanner on the running loop."""
+    global media_index_ready, media_index_task
+    if media_index_task is None:
+        media_index_ready = asyncio.Event()
+        media_index_task = asyncio.create_task(media_index_loop(), context=contextvars.Context())
+
+def parse_media_query(query: str) -> List[tuple]:
+    """Parses 'codec=h264 duration>60' into (field, op, value) filters, raising ValueError on bad input."""
+    filters = []
+    for token in query.split():
+        match = QUERY_PATTERN.match(token)
+        if not match:
+            raise ValueError(f"Invalid filter '{token}'. Use field<op>value with one of =, !=, >, <, >=, <=")
+        field, op, value = match.groups()
+        if field not in MEDIA_INDEX_FIELDS:
+            raise ValueError(f"Invalid filter field '{field}'. Must be one of {MEDIA_INDEX_FIELDS}")
+        if field in MEDIA_INDEX_NUMERIC_FIELDS:
+            try:
+                value = float(value)
+            except ValueError:
+                raise ValueError(f"Filter field '{field}' needs a numeric value")
+        elif op not in ("=", "!="):
+            raise ValueError(f"Filter field '{field}' only supports = and !=")
+        filters.append((field, op, value))
+    return filters
+
+def match_media(record: Dict[str, Any], filters: List[tuple]) -> bool:
+    """Returns True if an index record satisfies every parsed filter."""
+    for field, op, value in filters:
+        actual = record.get(field)
+        if field in MEDIA_INDEX_NUMERIC_FIELDS:
+            if actual is None:
+                return False
+            ok = {
+                "=": actual == value, "!=": actual != value,
+                ">": actual > value, "<": actual < value,
+                ">=": actual >= value, "<=": actual <= value
+            }[op]
+        else:
+            # String fields match case-insensitively and accept glob patterns, e.g. name=*.mp4
+            ok = fnmatch.fnmatch(str(actual or "").lower(), value.lower())
+            if op == "!=":
+                ok = not ok
+        if not ok:
+            return False
+    return True
+
+# Resource to list available media files
+@mcp.resource("directory://media")
+async def get_media_files() -> str:
+    """Returns a JSON list of media files under the media directory, served from the media index."""
+    ensure_media_index()
+    await media_index_ready.wait()
+    return json.dumps(sorted(media_index))
+
+# Tool to search the media index
+@mcp.tool()
+async def query_media(query: str = "", sort: str = "name", page: int = 1, page_size: int = 100) -> str:
+    """Searches the media index with filters like 'type=video codec=h264 duration>60 height>=1080'.
+
+    Sort by any field, prefixing '-' for descending (e.g. '-duration'). Results are paginated.
+    Right after startup some records may still have probed=false, with their probe fields unset.
+    """
+    try:
+        filters = parse_media_query(query)
+    except ValueError as e:
+        return f"Error: {e}"
+    sort_field = sort.lstrip("-")
+    if sort_field not in MEDIA_INDEX_FIELDS:
+        return f"Error: Invalid sort field. Must be one of {MEDIA_INDEX_FIELDS}"
+    if page < 1 or page_size < 1:
+        return "Error: page and page_size must be positive."
+
+    ensure_media_index()
+    await media_index_ready.wait()
+    matches = [record for record in media_index.values() if match_media(record, filters)]
+    # Records missing the sort field always go last
+    present = [r for r in matches if r.get(sort_field) is not None]
+    missing = [r for r in matches if r.get(sort_field) is None]
+    present.sort(key=lambda r: r[sort_field], reverse=sort.startswith("-"))
+    matches = present + missing
+    start = (page - 1) * page_size
+    return json.dumps({
+        "total": len(matches),
+        "page": page,
+        "page_size": page_size,
+        "items": matches[start:start + page_size],
+        # Files still being probed match only on name, type, ext and size until their probe lands
+        "pending_probes": sum(1 for record in media_index.values() if not record["probed"])
+    })
+
+# Helper function to build a keyframe-aligned stream-copy split command
+def build_segment_cmd(input_path: str, segment_duration: float, output_pattern_full: str, stream_args: List[str] = None) -> List[str]:
+    """Returns an FFmpeg segment-muxer command; segments start on the first keyframe after each boundary."""
+    return [
+        "ffmpeg",
+        "-i", input_path,
+        *(stream_args or []),
+        "-f", "segment",
+        "-segment_time", str(segment_duration),
+        "-c", "copy",
+        output_pattern_full
+    ]
+
+# Helper function to write a concat demuxer list file
+def write_concat_list(paths: List[str]) -> str:
+    """Writes a concat demuxer list for the given paths and returns the list file path."""
+    with span("temp"), tempfile.NamedTemporaryFile(mode='w', suffix=".txt", delete=False) as tmpfile:
+        for path in paths:
+            escaped = path.replace("'", "'\\''")
+            tmpfile.write(f"file '{escaped}'\n")
+        return tmpfile.name
+
+def read_concat_list(list_path: str) -> List[str]:
+    """Returns the paths listed in a concat demuxer list written by write_concat_list."""
+    paths = []
+    with open(list_path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("file '") and line.endswith("'"):
+                paths.append(line[6:-1].replace("'\\''", "'"))
+    return paths
+
+# Byte budget for cached tool outputs; 0 disables the output cache
+OUTPUT_CACHE_MAX_BYTES = int(os.environ.get("MEDIA_OUTPUT_CACHE_MAX_BYTES", 10 * 1024 ** 3))
+OUTPUT_CACHE_DIR = os.path.join(CACHE_DIR, "outputs")
+OUTPUT_CACHE_STATS = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+# Linux FICLONE ioctl: copy-on-write clone on filesystems that support reflinks
+FICLONE = 0x40049409
+output_cache_db = None
+output_cache_lock = threading.Lock()
+# Byte budget shared by proxies, thumbnail sheets and keyframe/scene indexes; 0 means unbounded
+DERIVED_CACHE_MAX_BYTES = int(os.environ.get("MEDIA_DERIVED_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+DERIVED_CACHE_STATS = {"hits": 0, "stores": 0, "evictions": 0}
+derived_cache_lock = threading.Lock()
+ffmpeg_version = None
+
+def get_output_cache_db() -> sqlite3.Connection:
+    """Returns the SQLite connection indexing cached outputs, creating it on first use."""
+    global output_cache_db
+    if output_cache_db is None:
+        os.makedirs(OUTPUT_CACHE_DIR, exist_ok=True)
+        # Stores run in worker threads; output_cache_lock serialises them with the loop's lookups
+        output_cache_db = sqlite3.connect(os.path.join(CACHE_DIR, "output_cache.db"), check_same_thread=False)
+        output_cache_db.execute(
+            "CREATE TABLE IF NOT EXISTS outputs ("
+            "key TEXT PRIMARY KEY, file TEXT, size INTEGER, created REAL, last_access REAL, hits INTEGER)"
+        )
+        output_cache_db.commit()
+    return output_cache_db
+
+async def get_ffmpeg_version() -> str:
+    """Returns the first line of `ffmpeg -version`, so cached outputs are invalidated by upgrades."""
+    global ffmpeg_version
+    if ffmpeg_version is None:
+        try:
+            result = await run_process(["ffmpeg", "-version"], ffprobe_slots)
+            ffmpeg_version = result.stdout.decode(errors="replace").splitlines()[0]
+        except (subprocess.CalledProcessError, OSError, IndexError):
+            ffmpeg_version = "unknown"
+    return ffmpeg_version
+
+# Helper function to place a file at a new path as cheaply as the filesystem allows
+def clone_file(src: str, dst: str) -> None:
+    """Hardlinks src to dst, falling back to a reflink and then a plain copy."""
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    copy_file(src, dst)
+
+# Helper function to copy a file without sharing its inode
+def copy_file(src: str, dst: str) -> None:
+    """Reflinks src to dst where supported, otherwise copies it; dst is always a separate inode."""
+    try:
+        import fcntl
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return
+    except (ImportError, OSError):
+        if os.path.exists(dst):
+            os.remove(dst)
+    shutil.copyfile(src, dst)
+
+# Containers whose index is moved to the front while muxing, so playback can start before the download ends
+FASTSTART_EXTENSIONS = ['.mp4', '.mov', '.m4v', '.m4a']
+SCRATCH_NAME_PATTERN = re.compile(r"^[a-z]+-(\d+)-")
+PARTIAL_NAME_PATTERN = re.compile(r"^\..+\.(\d+)-[0-9a-f]+\.partial")
+PROCESS_STARTED = time.time()
+orphan_cleanup_task = None
+
+# Helper function to create a per-job scratch directory
+def make_scratch_dir(prefix: str, parent: str = None) -> str:
+    """Creates a unique directory tagged with this process's PID, so one left by a crash can be recognised."""
+    parent = parent or SCRATCH_DIR
+    os.makedirs(parent, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f"{prefix}-{os.getpid()}-", dir=parent)
+
+# Helper function to name a hidden sibling to write before an atomic rename
+def partial_path(path: str) -> str:
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{os.getpid()}-{uuid.uuid4().hex[:8]}.partial{os.path.splitext(name)[1]}")
+
+# Helper function to get container flags for a final output
+def muxer_args(output_path: str) -> List[str]:
+    """Returns -movflags +faststart for MP4/MOV outputs, applied by the muxer in the encoding pass itself."""
+    if os.path.splitext(output_path)[1].lower() in FASTSTART_EXTENSIONS:
+        return ["-movflags", "+faststart"]
+    return []
+
+# Helper function to point an FFmpeg command's output at its staged path
+def staged_cmd(cmd: List[str], staged_path: str) -> List[str]:
+    """Replaces the output path (the last argument) of cmd with staged_path and adds the output's container flags."""
+    return [*cmd[:-1], *muxer_args(staged_path), staged_path]
+
+# Helper function to move a finished file or directory into place
+def publish_path(src: str, dst: str) -> None:
+    """Places src at dst atomically, raising FileExistsError instead of replacing an existing dst.
+
+    On one filesystem this is a hardlink (or rename, for directories). Across filesystems src is
+    cloned to a hidden sibling of dst first, so dst never appears half-written.
+    """
+    if os.path.isdir(src):
+        if os.path.exists(dst):
+            raise FileExistsError(f"{dst} already exists")
+        try:
+            os.rename(src, dst)
+            return
+        except OSError:
+            staging = partial_path(dst)
+            shutil.copytree(src, staging, copy_function=clone_file)
+            os.rename(staging, dst)
+            return
+    try:
+        os.link(src, dst)
+        return
+    except FileExistsError:
+        raise
+    except OSError:
+        pass
+    staging = partial_path(dst)
+    try:
+        clone_file(src, staging)
+        try:
+            os.link(staging, dst)
+        except FileExistsError:
+            raise
+        except OSError:
+            # No hardlinks on this filesystem; a rename is still atomic
+            if os.path.exists(dst):
+                raise FileExistsError(f"{dst} already exists")
+            os.replace(staging, dst)
+    finally:
+        if os.path.exists(staging):
+            os.remove(staging)
+
+# Helper function to publish a file that must stay independent of its source (cache entries)
+def publish_copy(src: str, dst: str) -> None:
+    """Publishes a private copy of src at dst, so the two never share an inode."""
+    staging = partial_path(dst)
+    try:
+        copy_file(src, staging)
+        publish_path(staging, dst)
+    finally:
+        if os.path.exists(staging):
+            os.remove(staging)
+
+def publish_scratch(scratch_dir: str, output_dir: str) -> None:
+    """Publishes every entry of scratch_dir into output_dir, all or nothing.
+
+    Raises FileExistsError naming the first output that is already taken; entries published
+    before a failure are removed again.
+    """
+    names = sorted(os.listdir(scratch_dir))
+    for name in names:
+        if os.path.lexists(os.path.join(output_dir, name)):
+            raise FileExistsError(f"Output file {name} already exists.")
+    published = []
+    try:
+        for name in names:
+            publish_path(os.path.join(scratch_dir, name), os.path.join(output_dir, name))
+            published.append(os.path.join(output_dir, name))
+    except OSError as e:
+        for path in published:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+        if isinstance(e, FileExistsError):
+            raise FileExistsError(f"Output file {name} already exists.") from None
+        raise
+
+# Helper function to stage a tool's output and publish it only once it is complete
+@asynccontextmanager
+async def staged_output(output_path: str):
+    """Yields a path in a fresh scratch directory to write in place of output_path.
+
+    If the block succeeds, everything written there (a file, a numbered pattern or a whole
+    directory) is published next to output_path; otherwise nothing appears in MEDIA_DIR.
+    Publishing raises FileExistsError, leaving MEDIA_DIR untouched, if any output is taken.
+    """
+    scratch_dir = make_scratch_dir("stage")
+    try:
+        yield os.path.join(scratch_dir, os.path.basename(output_path))
+        with span("rename"):
+            await asyncio.to_thread(publish_scratch, scratch_dir, os.path.dirname(output_path))
+    finally:
+        with span("temp"):
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+# Helper function to tell whether a scratch or partial name (or a job row) belongs to a dead process
+def is_orphan(pid: int, path: str = None, created: float = None) -> bool:
+    """created, if given, replaces path's modification time as the age of the owned item."""
+    if pid == os.getpid():
+        # Containers reuse PIDs across restarts; anything older than this process is a leftover
+        return (created if created is not None else os.path.getmtime(path)) < PROCESS_STARTED
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+# Helper function to remove what crashed or killed servers left behind
+def cleanup_orphans() -> int:
+    """Removes scratch directories and partial outputs whose owning process is gone; returns how many."""
+    removed = 0
+    for parent in [SCRATCH_DIR, CACHE_DIR, THUMBNAIL_CACHE_DIR]:
+        try:
+            entries = list(os.scandir(parent))
+        except OSError:
+            continue
+        for entry in entries:
+            match = SCRATCH_NAME_PATTERN.match(entry.name)
+            if match and entry.is_dir(follow_symlinks=False) and is_orphan(int(match.group(1)), entry.path):
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+    cache_dir = os.path.abspath(CACHE_DIR)
+    for directory in [MEDIA_DIR, PROXY_DIR, INDEX_DIR, OUTPUT_CACHE_DIR]:
+        for root, dirs, files in os.walk(directory):
+            if directory == MEDIA_DIR:
+                # Server state under CACHE_DIR is handled above
+                dirs[:] = [d for d in dirs if not d.startswith(".") and os.path.abspath(os.path.join(root, d)) != cache_dir]
+            for name in files:
+                match = PARTIAL_NAME_PATTERN.match(name)
+                path = os.path.join(root, name)
+                try:
+                    if match and is_orphan(int(match.group(1)), path):
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+    return removed
+
+def ensure_orphan_cleanup() -> None:
+    """Sweeps up orphaned scratch space in the background once per process."""
+    global orphan_cleanup_task
+    if orphan_cleanup_task is None:
+        orphan_cleanup_task = asyncio.create_task(asyncio.to_thread(cleanup_orphans), context=contextvars.Context())
+
+# Helper function to key a tool call on everything that determines its output
+async def output_cache_key(tool: str, input_paths: List[str], params: Dict[str, Any], output_path: str) -> str:
+    """Returns a content-address for a tool call from input identities, parameters and FFmpeg version."""
+    payload = {
+        "tool": tool,
+        "inputs": [await file_identity(path) for path in input_paths],
+        "params": params,
+        "ext": os.path.splitext(output_path)[1].lower(),
+        "ffmpeg": await get_ffmpeg_version()
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+async def restore_cached_output(key: str, output_path: str) -> bool:
+    """Materialises a cached result at output_path; returns False on a miss."""
+    if OUTPUT_CACHE_MAX_BYTES <= 0:
+        return False
+    db = get_output_cache_db()
+    with output_cache_lock:
+        row = db.execute("SELECT file FROM outputs WHERE key = ?", (key,)).fetchone()
+    cached_path = os.path.join(OUTPUT_CACHE_DIR, row[0]) if row else None
+    if cached_path is None or not os.path.exists(cached_path):
+        OUTPUT_CACHE_STATS["misses"] += 1
+        return False
+    try:
+        with span("cache"):
+            await asyncio.to_thread(publish_copy, cached_path, output_path)
+    except FileExistsError:
+        # Another call produced this output meanwhile; the tool's own publish reports it
+        return False
+    with output_cache_lock:
+        db.execute("UPDATE outputs SET last_access = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+        db.commit()
+    OUTPUT_CACHE_STATS["hits"] += 1
+    return True
+
+async def store_cached_output(key: str, output_path: str) -> None:
+    """Adds a freshly written output to the cache off the event loop; the copy can take a while for large outputs."""
+    if OUTPUT_CACHE_MAX_BYTES <= 0:
+        return
+    with span("cache"):
+        await asyncio.to_thread(store_cached_file, key, output_path)
+
+# Helper function wrapping a tool's render in the output cache and staged publishing
+async def cached_render(tool: str, input_paths: List[str], params: Dict[str, Any], output_path: str, render, message: str) -> str:
+    """Serves output_path from the output cache, or runs render(staged_path) and caches what it published.
+
+    Returns message, marked "(cached)" on a hit; a string returned by render is appended to it
+    in parentheses. A taken output becomes an error message; render's own errors propagate.
+    """
+    key = await output_cache_key(tool, input_paths, params, output_path)
+    if await restore_cached_output(key, output_path):
+        return f"{message} (cached)"
+    try:
+        async with staged_output(output_path) as staged_path:
+            note = await render(staged_path)
+    except FileExistsError as e:
+        return f"Error: {e}"
+    await store_cached_output(key, output_path)
+    return f"{message} ({note})" if isinstance(note, str) and note else message
+
+def store_cached_file(key: str, output_path: str) -> None:
+    """Copies output_path into the cache, then evicts least recently used entries over budget."""
+    if not os.path.isfile(output_path):
+        return
+    size = os.path.getsize(output_path)
+    if size > OUTPUT_CACHE_MAX_BYTES:
+        return
+    file_name = key + os.path.splitext(output_path)[1].lower()
+    cached_path = os.path.join(OUTPUT_CACHE_DIR, file_name)
+    db = get_output_cache_db()
+    # A private copy renamed into place: later edits of the user's file never reach the cache
+    staging = partial_path(cached_path)
+    try:
+        copy_file(output_path, staging)
+        os.replace(staging, cached_path)
+    except OSError:
+        if os.path.exists(staging):
+            os.remove(staging)
+        return
+    now = time.time()
+    with output_cache_lock:
+        db.execute("INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?, 0)", (key, file_name, size, now, now))
+        OUTPUT_CACHE_STATS["stores"] += 1
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM outputs").fetchone()[0]
+        for old_key, old_file, old_size in db.execute("SELECT key, file, size FROM outputs ORDER BY last_access").fetchall():
+            if total <= OUTPUT_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(os.path.join(OUTPUT_CACHE_DIR, old_file))
+            except FileNotFoundError:
+                pass
+            db.execute("DELETE FROM outputs WHERE key = ?", (old_key,))
+            total -= old_size
+            OUTPUT_CACHE_STATS["evictions"] += 1
+        db.commit()
+
+# Tool to report output cache usage
+@mcp.tool()
+def get_output_cache_stats() -> str:
+    """Returns JSON statistics for the cache of previously produced tool outputs."""
+    if OUTPUT_CACHE_MAX_BYTES <= 0:
+        return json.dumps({"enabled": False, **OUTPUT_CACHE_STATS})
+    with output_cache_lock:
+        entries, total = get_output_cache_db().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM outputs").fetchone()
+    return json.dumps({
+        "enabled": True,
+        "entries": entries,
+        "bytes": total,
+        "max_bytes": OUTPUT_CACHE_MAX_BYTES,
+        **OUTPUT_CACHE_STATS
+    })
+
+# Helper functions to keep derived data (proxies, thumbnails, indexes) within DERIVED_CACHE_MAX_BYTES
+def touch_derived(path: str) -> None:
+    """Marks a derived cache entry as just used; the modification time is the LRU clock."""
+    DERIVED_CACHE_STATS["hits"] += 1
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def derived_cache_entries() -> Dict[str, List[tuple]]:
+    """Returns (last_used, size, path) per finished entry of each derived cache, skipping work in progress."""
+    entries = {"proxies": [], "thumbnails": [], "index": []}
+    for kind, directory in [("proxies", PROXY_DIR), ("thumbnails", THUMBNAIL_CACHE_DIR), ("index", INDEX_DIR)]:
+        try:
+            listing = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in listing:
+            if PARTIAL_NAME_PATTERN.match(entry.name) or SCRATCH_NAME_PATTERN.match(entry.name):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    # A thumbnail entry is a directory of sprite sheets
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+                else:
+                    size = entry.stat().st_size
+                entries[kind].append((entry.stat().st_mtime, size, entry.path))
+            except OSError:
+                continue
+    return entries
+
+def evict_derived_cache(keep: str = None) -> None:
+    """Removes least recently used derived entries until the caches fit the byte budget; keep is never removed."""
+    if DERIVED_CACHE_MAX_BYTES <= 0:
+        return
+    with derived_cache_lock:
+        entries = sorted(itertools.chain.from_iterable(derived_cache_entries().values()))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= DERIVED_CACHE_MAX_BYTES:
+                break
+            if path == keep:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            DERIVED_CACHE_STATS["evictions"] += 1
+
+async def store_derived(path: str) -> None:
+    """Records a newly built derived entry and trims the caches to budget off the event loop."""
+    DERIVED_CACHE_STATS["stores"] += 1
+    with span("cache"):
+        await asyncio.to_thread(evict_derived_cache, path)
+
+# Tool to report proxy, thumbnail and index cache usage
+@mcp.tool()
+def get_derived_cache_stats() -> str:
+    """Returns JSON statistics for the caches of proxies, thumbnail sheets and keyframe/scene indexes."""
+    entries = derived_cache_entries()
+    return json.dumps({
+        "caches": {kind: {"entries": len(items), "bytes": sum(size for _, size, _ in items)} for kind, items in entries.items()},
+        "bytes": sum(size for items in entries.values() for _, size, _ in items),
+        "max_bytes": DERIVED_CACHE_MAX_BYTES,
+        **DERIVED_CACHE_STATS
+    })
+
 # Splitting Tool
 @mcp.tool()
-def split_video(input_file: str, segment_duration: float, output_pattern: str) -> str:
+@instrumented
+async def split_video(input_file: str, segment_duration: float, output_pattern: str) -> str:
     """Splits a video into segments of specified duration using FFmpeg."""
-    input_path = os.path.join(MEDIA_DIR, input_file)
-    if not os.path.exists(input_path):
+    input_path = resolve_input(input_file)
+    if not await input_exists(input_path):
         return f"Error: Input file {input_file} not found."
     if segment_duration <= 0:
         return "Error: segment_duration must be positive."
@@ -114,28 +1472,175 @@ def split_video(input_file: str, segment_duration: float, output_pattern: str) -
     
     output_pattern_full = os.path.join(MEDIA_DIR, output_pattern)
     
-    cmd = [
-        "ffmpeg",
-        "-i", input_path,
-        "-f", "segment",
-        "-segment_time", str(segment_duration),
-        "-c", "copy",
-        output_pattern_full
-    ]
+    # The segment muxer hands container flags to each segment's muxer
+    segment_args = ["-segment_format_options", "movflags=+faststart"] if muxer_args(output_pattern_full) else []
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        async with staged_output(output_pattern_full) as staged_pattern:
+            await run_ffmpeg(build_segment_cmd(input_path, segment_duration, staged_pattern, segment_args))
         return f"Successfully split video into segments using pattern {output_pattern}"
+    except FileExistsError as e:
+        return f"Error: {e}"
     except subprocess.CalledProcessError as e:
         return f"Error splitting video: {e.stderr.decode()}"
 
+# Default adaptive bitrate ladder for package_stream; rungs taller than the source are dropped
+DEFAULT_LADDER = [
+    {"height": 1080, "bitrate": "5000k"},
+    {"height": 720, "bitrate": "2800k"},
+    {"height": 480, "bitrate": "1400k"},
+    {"height": 360, "bitrate": "800k"}
+]
+STREAM_FORMATS = ["hls", "dash"]
+# Codecs each packaging format can carry (HLS uses MPEG-TS segments)
+STREAM_FORMAT_CODECS = {"hls": ["libx264", "libx265"], "dash": ["libx264", "libx265", "libvpx-vp9", "libsvtav1"]}
+# Source codecs that may be copied into a rung unchanged
+STREAM_COPY_CODECS = {"libx264": "h264", "libx265": "hevc", "libvpx-vp9": "vp9", "libsvtav1": "av1"}
+
+# Helper function to turn "2800k"/"5M"/"800000" into bits per second
+def parse_bitrate(value: Any) -> int:
+    text = str(value).strip().lower()
+    scale = {"k": 1000, "m": 1000 ** 2}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+# Tool: Package a video for adaptive streaming
+@mcp.tool()
+@instrumented
+async def package_stream(input_file: str, output_dir: str, formats: List[str] = None, ladder: List[Dict[str, Any]] = None,
+                         segment_duration: float = 4, audio_bitrate: str = "128k", profile: str = DEFAULT_ENCODER_PROFILE) -> str:
+    """Packages a video as HLS and/or DASH renditions in output_dir from a single decode.
+
+    ladder is a list of {"height": 720, "bitrate": "2800k"} rungs (default 1080p-360p). All rungs share
+    keyframe positions so players can switch at any segment boundary; a rung matching the source's
+    codec, height and bitrate is stream-copied instead of transcoded. Requesting both formats writes
+    fMP4 segments with a DASH manifest and HLS playlists over the same files.
+    """
+    formats = formats or ["hls"]
+    input_path = resolve_input(input_file)
+    output_path = os.path.join(MEDIA_DIR, output_dir)
+    if not await input_exists(input_path):
+        return f"Error: Input file {input_file} not found."
+    if os.path.sep in output_dir or output_dir in ("", ".", ".."):
+        return "Error: Output directory must be a plain directory name."
+    if os.path.exists(output_path):
+        return f"Error: Output directory {output_dir} already exists."
+    if not formats or any(f not in STREAM_FORMATS for f in formats):
+        return f"Error: Invalid formats. Must be a subset of {STREAM_FORMATS}"
+    if segment_duration <= 0:
+        return "Error: segment_duration must be positive."
+    if profile not in ENCODER_PROFILES:
+        return f"Error: Invalid profile. Must be one of {list(ENCODER_PROFILES.keys())}"
+    codec = ENCODER_PROFILES[profile]["codec"]
+    for f in formats:
+        if codec not in STREAM_FORMAT_CODECS[f]:
+            return f"Error: Profile {profile} ({codec}) cannot be packaged as {f}. Use a profile with one of {STREAM_FORMAT_CODECS[f]}"
+    try:
+        rungs = sorted(
+            ({"height": int(r["height"]), "bitrate": parse_bitrate(r["bitrate"])} for r in (ladder or DEFAULT_LADDER)),
+            key=lambda r: -r["height"]
+        )
+        parse_bitrate(audio_bitrate)
+    except (KeyError, ValueError, TypeError):
+        return "Error: Each ladder rung needs a numeric height and a bitrate like 2800k."
+    if any(r["height"] <= 0 or r["bitrate"] <= 0 for r in rungs) or len({r["height"] for r in rungs}) != len(rungs):
+        return "Error: Ladder heights must be positive and unique, and bitrates positive."
+
+    try:
+        metadata = await probe_media(input_path)
+    except (subprocess.CalledProcessError, OSError):
+        return "Error: Could not probe input file."
+    video = next((st for st in metadata.get("streams", []) if st.get("codec_type") == "video"), None)
+    audio = next((st for st in metadata.get("streams", []) if st.get("codec_type") == "audio"), None)
+    if video is None or not video.get("height"):
+        return "Error: Input file has no video stream."
+    source_height = int(video["height"])
+    rungs = [r for r in rungs if r["height"] <= source_height] or [{"height": source_height, "bitrate": rungs[-1]["bitrate"]}]
+    source_bitrate = int(video.get("bit_rate") or metadata.get("format", {}).get("bit_rate") or 0)
+    for rung in rungs:
+        rung["copy"] = (
+            video.get("codec_name") == STREAM_COPY_CODECS[codec]
+            and video.get("pix_fmt") == "yuv420p"
+            and rung["height"] == source_height
+            and 0 < source_bitrate <= rung["bitrate"] * 1.1
+        )
+    copied = any(r["copy"] for r in rungs)
+    encoded = [r for r in rungs if not r["copy"]]
+
+    # One decode feeds every transcoded rung through split
+    cmd = ["ffmpeg", "-i", input_path]
+    graph = []
+    if encoded:
+        if len(encoded) > 1:
+            graph.append(f"[0:v]split={len(encoded)}" + "".join(f"[s{i}]" for i in range(len(encoded))))
+        graph += [f"[{'s' + str(i) if len(encoded) > 1 else '0:v'}]scale=-2:{r['height']}[v{i}]" for i, r in enumerate(encoded)]
+        cmd += ["-filter_complex", ";".join(graph)]
+    video_args = []
+    names = []
+    encoded_index = 0
+    for out_index, rung in enumerate(rungs):
+        names.append(f"{rung['height']}p")
+        if rung["copy"]:
+            cmd += ["-map", "0:v:0"]
+            video_args += [f"-c:v:{out_index}", "copy"]
+        else:
+            cmd += ["-map", f"[v{encoded_index}]"]
+            encoded_index += 1
+            # Capped quality: the profile's CRF, limited to the rung's bitrate
+            video_args += [f"-maxrate:v:{out_index}", str(rung["bitrate"]), f"-bufsize:v:{out_index}", str(rung["bitrate"] * 2)]
+    if audio is not None:
+        cmd += ["-map", "0:a:0"]
+    # HLS players expect 8-bit 4:2:0 whatever the source is
+    cmd += encoder_args(profile, "yuv420p") + video_args
+    # Keyframes land on segment boundaries in every rung; with a copied rung they follow the source's keyframes
+    cmd += ["-force_key_frames:v", "source" if copied else f"expr:gte(t,n_forced*{segment_duration})", "-sc_threshold", "0"]
+    if audio is not None:
+        cmd += ["-c:a", "copy"] if audio.get("codec_name") == "aac" else ["-c:a", "aac", "-b:a", audio_bitrate, "-ac", "2"]
+
+    try:
+        # Playlists and segments are written to scratch and the finished directory renamed into place
+        async with staged_output(output_path) as staged_dir:
+            if "dash" in formats:
+                cmd += [
+                    "-f", "dash",
+                    "-seg_duration", str(segment_duration),
+                    "-use_template", "1", "-use_timeline", "1",
+                    "-adaptation_sets", "id=0,streams=v" + (" id=1,streams=a" if audio is not None else ""),
+                    *(["-hls_playlist", "1"] if "hls" in formats else []),
+                    os.path.join(staged_dir, "manifest.mpd")
+                ]
+                outputs = ["manifest.mpd"] + (["master.m3u8"] if "hls" in formats else [])
+            else:
+                variants = [f"v:{i},name:{name}" + (",agroup:audio" if audio is not None else "") for i, name in enumerate(names)]
+                if audio is not None:
+                    variants.insert(0, "a:0,agroup:audio,name:audio")
+                cmd += [
+                    "-f", "hls",
+                    "-hls_time", str(segment_duration),
+                    "-hls_playlist_type", "vod",
+                    "-hls_flags", "independent_segments",
+                    "-hls_segment_filename", os.path.join(staged_dir, "%v", "segment_%05d.ts"),
+                    "-master_pl_name", "master.m3u8",
+                    "-var_stream_map", " ".join(variants),
+                    os.path.join(staged_dir, "%v", "index.m3u8")
+                ]
+                outputs = ["master.m3u8"]
+            os.makedirs(staged_dir)
+            await run_ffmpeg(cmd)
+    except FileExistsError as e:
+        return f"Error: {e}"
+    except subprocess.CalledProcessError as e:
+        return f"Error packaging stream: {e.stderr.decode()}"
+    summary = ", ".join(f"{name} ({'copy' if rung['copy'] else rung['bitrate'] // 1000}{'' if rung['copy'] else 'k'})" for name, rung in zip(names, rungs))
+    return f"Successfully packaged {input_file} into {output_dir}/{' and '.join(outputs)}: {summary}"
+
 # Fade Tool
 @mcp.tool()
-def fade_video(input_file: str, fade_in_duration: float, fade_out_duration: float, output_file: str) -> str:
+@instrumented
+async def fade_video(input_file: str, fade_in_duration: float, fade_out_duration: float, output_file: str, profile: str = DEFAULT_ENCODER_PROFILE) -> str:
     """Applies fade-in and/or fade-out effects to video and audio using FFmpeg."""
-    input_path = os.path.join(MEDIA_DIR, input_file)
+    input_path = resolve_input(input_file)
     output_path = os.path.join(MEDIA_DIR, output_file)
     
-    if not os.path.exists(input_path):
+    if not await input_exists(input_path):
         return f"Error: Input file {input_file} not found."
     if fade_in_duration < 0 or fade_out_duration < 0:
         return "Error: Fade durations must be non-negative."
@@ -143,8 +1648,12 @@ def fade_video(input_file: str, fade_in_duration: float, fade_out_duration: floa
         return f"Error: Output file {output_file} already exists."
     if not any(output_file.lower().endswith(ext) for ext in VIDEO_EXTENSIONS):
         return f"Error: Output file must have a video extension ({', '.join(VIDEO_EXTENSIONS)})"
+    profile = container_profile(profile, output_file)
+    profile_error = validate_encoder_profile(profile, output_file)
+    if profile_error:
+        return profile_error
     
-    duration = get_video_duration(input_path)
+    duration = await get_video_duration(input_path)
     if duration == 0.0:
         return "Error: Could not determine video duration."
     
@@ -168,42 +1677,474 @@ def fade_video(input_file: str, fade_in_duration: float, fade_out_duration: floa
         cmd += ["-vf", vf]
     if af:
         cmd += ["-af", af]
-    cmd += ["-c:v", "libx264", "-c:a", "aac", output_path]
+    cmd += [*encoder_args(profile), "-c:a", "aac", output_path]
     
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return f"Successfully applied fade to {output_file}"
+        return await cached_render("fade_video", [input_path], {"fade_in_duration": fade_in_duration, "fade_out_duration": fade_out_duration, "encoder": encoder_args(profile)}, output_path,
+                                   lambda staged_path: run_ffmpeg(staged_cmd(cmd, staged_path)), f"Successfully applied fade to {output_file}")
     except subprocess.CalledProcessError as e:
         return f"Error applying fade: {e.stderr.decode()}"
 
 
+# Encoders able to re-create a source codec for the re-encoded ends of a smart cut
+SMART_CUT_ENCODERS = {
+    "h264": "libx264",
+    "hevc": "libx265",
+    "vp9": "libvpx-vp9",
+    "av1": "libsvtav1",
+    "mpeg4": "mpeg4"
+}
+KEYFRAME_CACHE_SIZE = 64
+keyframe_cache = OrderedDict()
+# Per-file keyframe and scene indexes live next to the probe cache as packed arrays
+INDEX_DIR = os.path.join(CACHE_DIR, "index")
+INDEX_MAGIC = b"MIDX"
+INDEX_VERSION = 2
+# scdet threshold (0-100) used by the scenes:// resource
+SCENE_THRESHOLD = float(os.environ.get("MEDIA_SCENE_THRESHOLD", 10))
+# Height frames are scaled to before scene scoring; cuts survive downscaling and it is much cheaper
+SCENE_ANALYSIS_HEIGHT = 240
+scene_cache = OrderedDict()
+
+# Helper function to parse FFmpeg-style time strings
+def parse_time(value: str) -> float:
+    """Returns seconds for '90', '90.5', '01:30' or '00:01:30.5', raising ValueError otherwise."""
+    seconds = 0.0
+    for part in str(value).strip().split(":"):
+        number = float(part)
+        if not math.isfinite(number) or number < 0:
+            raise ValueError(f"invalid time {value}")
+        seconds = seconds * 60 + number
+    return seconds
+
+# Helper functions to store a file's index as packed arrays
+def index_path(identity: tuple, kind: str) -> str:
+    """Returns the on-disk location of an index for the file version with the given file_identity."""
+    digest = hashlib.sha256(json.dumps(identity).encode()).hexdigest()[:32]
+    return os.path.join(INDEX_DIR, digest + "." + kind)
+
+def write_index(path: str, columns: List[array]) -> None:
+    """Writes equal-length arrays behind a magic/version/count/typecodes header, atomically."""
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    staging = partial_path(path)
+    with open(staging, "wb") as f:
+        f.write(INDEX_MAGIC + bytes([INDEX_VERSION, len(columns)]) + len(columns[0]).to_bytes(8, "little"))
+        f.write("".join(column.typecode for column in columns).encode())
+        for column in columns:
+            f.write(column.tobytes())
+    os.replace(staging, path)
+
+def read_index(path: str) -> List[array]:
+    """Returns the arrays stored by write_index, or None if the file is missing or from another version."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    if data[:4] != INDEX_MAGIC or data[4] != INDEX_VERSION:
+        return None
+    column_count, count = data[5], int.from_bytes(data[6:14], "little")
+    offset = 14 + column_count
+    columns = []
+    for typecode in data[14:offset].decode():
+        column = array(typecode)
+        size = count * column.itemsize
+        column.frombytes(data[offset:offset + size])
+        columns.append(column)
+        offset += size
+    return columns
+
+# Helper function to get the container start time that input -ss positions are relative to
+async def get_start_time(file_path: str) -> float:
+    try:
+        metadata = await probe_media(file_path)
+        return float(metadata.get("format", {}).get("start_time") or 0.0)
+    except (subprocess.CalledProcessError, OSError, ValueError):
+        return 0.0
+
+# Helper function to get the keyframe index (timestamps and byte offsets) of the first video stream
+
+async def get_keyframe_index(file_path: str) -> tuple:
+    """Returns (times, positions) arrays, scanning packets (no decoding) once per file version.
+
+    Times are relative to the container start time, the origin of input -ss seeks.
+    """
+    key = await file_identity(file_path)
+    if key in keyframe_cache:
+        keyframe_cache.move_to_end(key)
+        return keyframe_cache[key]
+    path = index_path(key, "keyframes")
+    columns = await asyncio.to_thread(read_index, path)
+    if columns is not None:
+        touch_derived(path)
+    else:
+        cmd = [
+            "ffprobe",
+            "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "packet=pts_time,flags,pos",
+            "-of", "csv=p=0",
+            file_path
+        ]
+        result = await run_ffprobe(cmd)
+        start_time = await get_start_time(file_path)
+        entries = []
+        for line in result.stdout.decode(errors="replace").splitlines():
+            # Field order follows the section definition (pts_time, pos, flags); match by content
+            fields = line.split(",")
+            if not any("K" in field for field in fields):
+                continue
+            try:
+                pts_time = float(fields[0]) - start_time
+            except ValueError:
+                continue
+            pos = next((int(field) for field in fields[1:] if field.isdigit()), -1)
+            entries.append((pts_time, pos))
+        entries.sort()
+        columns = [array("d", (t for t, _ in entries)), array("q", (p for _, p in entries))]
+        await asyncio.to_thread(write_index, path, columns)
+        await store_derived(path)
+    keyframe_cache[key] = tuple(columns)
+    while len(keyframe_cache) > KEYFRAME_CACHE_SIZE:
+        keyframe_cache.popitem(last=False)
+    return keyframe_cache[key]
+
+async def get_keyframe_times(file_path: str) -> array:
+    """Returns sorted keyframe timestamps in seconds."""
+    return (await get_keyframe_index(file_path))[0]
+
+# Nudge applied to seeks aimed at a keyframe, so float rounding cannot land on the wrong side of it
+SEEK_EPSILON = 0.001
+
+def format_seconds(t: float) -> str:
+    return f"{t:.6f}"
+
+# Helper functions for O(log n) keyframe lookups
+def keyframe_at_or_after(keyframes: array, t: float) -> float:
+    index = bisect.bisect_left(keyframes, t)
+    return keyframes[index] if index < len(keyframes) else None
+
+def keyframe_at_or_before(keyframes: array, t: float) -> float:
+    index = bisect.bisect_right(keyframes, t)
+    return keyframes[index - 1] if index > 0 else None
+
+# Helper function to get scene cuts of the first video stream
+async def get_scene_index(file_path: str, threshold: float = SCENE_THRESHOLD) -> tuple:
+    """Returns (times, scores) arrays of scene cuts scoring at least threshold (scdet, 0-100), computed once per file version.
+
+    Like keyframe times, scene times are relative to the container start time.
+    """
+    identity = await file_identity(file_path)
+    key = (*identity, threshold)
+    if key in scene_cache:
+        scene_cache.move_to_end(key)
+        return scene_cache[key]
+    path = index_path(identity, f"scenes-{threshold:g}")
+    columns = await asyncio.to_thread(read_index, path)
+    if columns is not None:
+        touch_derived(path)
+    else:
+        cmd = [
+            "ffmpeg", "-benchmark",
+            "-i", file_path,
+            "-an", "-sn", "-dn",
+            "-vf", f"scale=-2:'min(ih,{SCENE_ANALYSIS_HEIGHT})',scdet=threshold={threshold}",
+            "-f", "null", "-"
+        ]
+        with span("ffmpeg"):
+            result = await run_process(cmd, ffmpeg_slots)
+        stderr = result.stderr.decode(errors="replace")
+        record_child_usage(stderr.splitlines())
+        start_time = await get_start_time(file_path)
+        cuts = sorted(
+            (float(t) - start_time, float(score))
+            for score, t in re.findall(r"lavfi\.scd\.score:\s*([\d.]+),\s*lavfi\.scd\.time:\s*([\d.]+)", stderr)
+        )
+        columns = [array("d", (t for t, _ in cuts)), array("d", (score for _, score in cuts))]
+        await asyncio.to_thread(write_index, path, columns)
+        await store_derived(path)
+    scene_cache[key] = tuple(columns)
+    while len(scene_cache) > KEYFRAME_CACHE_SIZE:
+        scene_cache.popitem(last=False)
+    return scene_cache[key]
+
+# Resource exposing the keyframe index of a file
+@mcp.resource("keyframes://{filename}")
+async def get_keyframes(filename: str) -> str:
+    """Returns JSON keyframe timestamps and byte offsets of a file's first video stream."""
+    file_path = os.path.join(MEDIA_DIR, filename)
+    if not os.path.exists(file_path):
+        return json.dumps({"error": "File not found"})
+    try:
+        times, positions = await get_keyframe_index(file_path)
+    except subprocess.CalledProcessError as e:
+        return json.dumps({"error": str(e)})
+    return json.dumps({"count": len(times), "keyframes": times.tolist(), "positions": positions.tolist()})
+
+# Resource exposing the scene cuts of a file
+@mcp.resource("scenes://{filename}")
+async def get_scenes(filename: str) -> str:
+    """Returns JSON scene-cut timestamps and scores of a file's first video stream."""
+    file_path = os.path.join(MEDIA_DIR, filename)
+    if not os.path.exists(file_path):
+        return json.dumps({"error": "File not found"})
+    try:
+        times, scores = await get_scene_index(file_path)
+    except subprocess.CalledProcessError as e:
+        return json.dumps({"error": str(e)})
+    return json.dumps({
+        "threshold": SCENE_THRESHOLD,
+        "count": len(times),
+        "scenes": [{"time": round(t, 3), "score": round(score, 2)} for t, score in zip(times, scores)]
+    })
+
+# Helper function to cut frame-accurately while copying everything between keyframes
+async def smart_trim(input_path: str, start: float, end: float, output_path: str, profile: str = DEFAULT_ENCODER_PROFILE) -> str:
+    """Trims [start, end) by re-encoding only the partial GOPs at each boundary; returns a short mode description."""
+    metadata = await probe_media(input_path)
+    video = next((st for st in metadata.get("streams", []) if st.get("codec_type") == "video"), None)
+    if video is None:
+        raise ValueError("Input file has no video stream.")
+    encoder = SMART_CUT_ENCODERS.get(video.get("codec_name"))
+    keyframes = await get_keyframe_times(input_path)
+    first_keyframe = keyframe_at_or_after(keyframes, start)
+    last_keyframe = keyframe_at_or_before(keyframes, end)
+
+    if encoder is None or first_keyframe is None or last_keyframe is None or last_keyframe <= first_keyframe:
+        # No copyable middle section: an accurate re-encode of the whole range is the best we can do
+        cmd = [
+            "ffmpeg",
+            "-ss", str(start), "-i", input_path,
+            "-t", str(end - start),
+            *encoder_args(profile),
+            "-c:a", "aac",
+            *muxer_args(output_path),
+            output_path
+        ]
+        await run_ffmpeg(cmd, duration=end - start)
+        return "full re-encode"
+
+    # Re-encoded ends must match the copied middle so the concat demuxer can join them;
+    # the profile only sets speed/quality when it uses the source's codec
+    pix_fmt = video.get("pix_fmt") or "yuv420p"
+    if ENCODER_PROFILES[profile]["codec"] == encoder:
+        encode_args = ["-an", *encoder_args(profile, pix_fmt)]
+    else:
+        # Fall back to the codec's own balanced profile so the ends get its quality settings, not encoder defaults
+        fallback = next((name for name, settings in ENCODER_PROFILES.items() if settings["codec"] == encoder and name.endswith("balanced")), None)
+        encode_args = ["-an", *(encoder_args(fallback, pix_fmt) if fallback else ["-c:v", encoder, "-pix_fmt", pix_fmt])]
+    h264_profile = str(video.get("profile", "")).lower().replace(" ", "").replace("constrained", "")
+    if encoder == "libx264" and h264_profile in ("baseline", "main", "high", "high10", "high422", "high444"):
+        encode_args += ["-profile:v", h264_profile]
+
+    # Keyframe times are nudged by SEEK_EPSILON so the printed positions cannot round across a keyframe:
+    # the copied middle starts just after its keyframe (copy seeks snap back onto it), the ends stop just short of
+    # the next piece and the re-encoded tail starts just before its keyframe
+    head_duration = first_keyframe - start - SEEK_EPSILON
+    middle_duration = last_keyframe - first_keyframe - SEEK_EPSILON
+    tail_start = last_keyframe - SEEK_EPSILON
+
+    # Matroska pieces, since MPEG-TS cannot carry every codec in SMART_CUT_ENCODERS (VP9, AV1)
+    scratch_dir = make_scratch_dir("trim")
+    list_path = None
+    try:
+        pieces = []
+        steps = []
+        if first_keyframe > start:
+            pieces.append(os.path.join(scratch_dir, "head.mkv"))
+            steps.append(run_ffmpeg(
+                ["ffmpeg", "-ss", format_seconds(start), "-i", input_path, "-t", format_seconds(head_duration), *encode_args, pieces[-1]],
+                duration=head_duration
+            ))
+        pieces.append(os.path.join(scratch_dir, "middle.mkv"))
+        steps.append(run_ffmpeg(
+            ["ffmpeg", "-ss", format_seconds(first_keyframe + SEEK_EPSILON), "-i", input_path, "-t", format_seconds(middle_duration),
+             "-an", "-c:v", "copy", pieces[-1]],
+            duration=middle_duration
+        ))
+        if end > last_keyframe:
+            pieces.append(os.path.join(scratch_dir, "tail.mkv"))
+            steps.append(run_ffmpeg(
+                ["ffmpeg", "-ss", format_seconds(tail_start), "-i", input_path, "-t", format_seconds(end - tail_start), *encode_args, pieces[-1]],
+                duration=end - tail_start
+            ))
+        await gather_or_cancel(*steps)
+
+        # Audio is cut separately from the original so it has no seams at the joins
+        list_path = write_concat_list(pieces)
+        cmd = [
+            "ffmpeg",
+            "-f", "concat",
+            "-safe", "0",
+            "-i", list_path,
+            "-ss", str(start), "-t", str(end - start), "-i", input_path,
+            "-map", "0:v",
+            "-map", "1:a?",
+            "-c:v", "copy",
+            "-c:a", "aac",
+            *muxer_args(output_path),
+            output_path
+        ]
+        await run_ffmpeg(cmd, duration=end - start)
+    finally:
+        with span("temp"):
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+        if list_path is not None:
+            os.remove(list_path)
+    return "smart cut"
+
 # Tool to trim video without re-encoding
 @mcp.tool()
-def trim_video(input_file: str, start_time: str, duration: str, output_file: str) -> str:
-    """Trims a video file without re-encoding using FFmpeg. Ensures output is a video file."""
-    input_path = os.path.join(MEDIA_DIR, input_file)
+@instrumented
+async def trim_video(input_file: str, start_time: str, duration: str, output_file: str, accurate: bool = False, profile: str = DEFAULT_ENCODER_PROFILE) -> str:
+    """Trims a video file without re-encoding using FFmpeg. Ensures output is a video file.
+
+    With accurate=True the cut is frame-exact: only the partial GOPs at the start and end
+    are re-encoded and everything between keyframes is stream-copied.
+    """
+    input_path = resolve_input(input_file)
     output_path = os.path.join(MEDIA_DIR, output_file)
     
-    if os.path.sep in input_file or os.path.sep in output_file:
+    if (os.path.sep in input_file and not is_input_uri(input_file)) or os.path.sep in output_file:
         return "Error: File names cannot contain directory separators."
-    if not os.path.exists(input_path):
+    if not await input_exists(input_path):
         return f"Error: Input file {input_file} not found."
     if os.path.exists(output_path):
         return f"Error: Output file {output_file} already exists."
     if not any(output_file.lower().endswith(ext) for ext in VIDEO_EXTENSIONS):
         return f"Error: Output file must have a video extension ({', '.join(VIDEO_EXTENSIONS)})"
+    if accurate:
+        profile = container_profile(profile, output_file)
+        profile_error = validate_encoder_profile(profile, output_file)
+        if profile_error:
+            return profile_error
+        try:
+            start, length = parse_time(start_time), parse_time(duration)
+        except ValueError:
+            return "Error: start_time and duration must be seconds or [HH:]MM:SS[.ms]."
+        if length <= 0:
+            return "Error: duration must be positive."
     
     cmd = ["ffmpeg", "-ss", start_time, "-t", duration, "-i", input_path, "-c", "copy", output_path]
+    params = {"start_time": start_time, "duration": duration, "accurate": accurate, "encoder": encoder_args(profile) if accurate else None}
     try:
-        result = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        return f"Successfully trimmed video to {output_file}"
+        if accurate:
+            source_duration = await get_video_duration(input_path)
+            end = min(start + length, source_duration) if source_duration > 0 else start + length
+            if end <= start:
+                return "Error: start_time is past the end of the video."
+            render = lambda staged_path: smart_trim(input_path, start, end, staged_path, profile)
+        else:
+            render = lambda staged_path: run_ffmpeg(staged_cmd(cmd, staged_path))
+        return await cached_render("trim_video", [input_path], params, output_path, render, f"Successfully trimmed video to {output_file}")
+    except ValueError as e:
+        return f"Error: {e}"
     except subprocess.CalledProcessError as e:
-        return f"Error trimming video: {e.stderr}"
+        return f"Error trimming video: {e.stderr.decode()}"
 
-# Tool to concatenate videos without re-encoding
+# Encoders used to re-encode concat inputs into the majority's audio codec
+AUDIO_ENCODERS = {
+    "aac": "aac",
+    "mp3": "libmp3lame",
+    "opus": "libopus",
+    "vorbis": "libvorbis",
+    "ac3": "ac3",
+    "flac": "flac",
+    "pcm_s16le": "pcm_s16le"
+}
+
+# Helper function to describe the stream parameters that must match for a stream-copy concat
+def stream_signature(metadata: Dict[str, Any]) -> tuple:
+    """Returns (video params, audio params); None for a missing stream.
+
+    The container timebase is left out: the concat demuxer rescales timestamps between inputs.
+    """
+    streams = metadata.get("streams", [])
+    video = next((st for st in streams if st.get("codec_type") == "video"), None)
+    audio = next((st for st in streams if st.get("codec_type") == "audio"), None)
+    video_params = None if video is None else (
+        video.get("codec_name"), video.get("profile"), video.get("width"), video.get("height"),
+        video.get("pix_fmt"), video.get("r_frame_rate")
+    )
+    audio_params = None if audio is None else (
+        audio.get("codec_name"), audio.get("sample_rate"), audio.get("channels")
+    )
+    return video_params, audio_params
+
+# Helper function to build the filter that conforms a video stream to the target frame geometry and rate
+def conform_video_filter(width: int, height: int, frame_rate: str, pix_fmt: str) -> str:
+    return (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={frame_rate},format={pix_fmt}"
+    )
+
+# Helper function to re-encode one concat input so it can be stream-copied alongside the majority
+async def normalize_for_concat(input_path: str, target: Dict[str, Any], output_path: str, profile: str) -> None:
+    """Re-encodes input_path to the target's codecs, geometry, frame rate, timebase and audio layout."""
+    video, audio = target["video"], target["audio"]
+    encoder = SMART_CUT_ENCODERS[video["codec_name"]]
+    metadata = await probe_media(input_path)
+    has_audio = any(st.get("codec_type") == "audio" for st in metadata.get("streams", []))
+    cmd = ["ffmpeg", "-i", input_path]
+    if audio is not None and not has_audio:
+        # Pad with silence so every concat segment has the same stream layout
+        cmd += ["-f", "lavfi", "-i", f"anullsrc=r={audio['sample_rate']}:cl={'mono' if audio.get('channels') == 1 else 'stereo'}", "-shortest"]
+    cmd += ["-map", "0:v:0"]
+    if audio is not None:
+        cmd += ["-map", "0:a:0" if has_audio else "1:a:0"]
+    cmd += ["-vf", conform_video_filter(video["width"], video["height"], video["r_frame_rate"], video["pix_fmt"])]
+    if ENCODER_PROFILES[profile]["codec"] == encoder:
+        cmd += encoder_args(profile, video["pix_fmt"])
+    else:
+        cmd += ["-c:v", encoder, "-pix_fmt", video["pix_fmt"]]
+    video_profile = str(video.get("profile", "")).lower().replace(" ", "").replace("constrained", "")
+    if encoder == "libx264" and video_profile in ("baseline", "main", "high", "high10", "high422", "high444"):
+        cmd += ["-profile:v", video_profile]
+    timebase = str(video.get("time_base", "")).partition("/")[2]
+    if timebase.isdigit() and os.path.splitext(output_path)[1].lower() in (".mp4", ".mov"):
+        cmd += ["-video_track_timescale", timebase]
+    if audio is not None:
+        cmd += ["-c:a", AUDIO_ENCODERS[audio["codec_name"]], "-ar", str(audio["sample_rate"]), "-ac", str(audio["channels"])]
+    cmd += [output_path]
+    await run_ffmpeg(cmd)
+
+# Helper function to build a full re-encode through the concat filter
+def concat_filter_cmd(input_paths: List[str], metadata: List[Dict[str, Any]], target: Dict[str, Any], output_path: str, profile: str) -> List[str]:
+    """Returns a concat-filter command conforming every input to the target video (and silence where audio is missing)."""
+    video, audio = target["video"], target["audio"]
+    cmd = ["ffmpeg"]
+    for path in input_paths:
+        cmd += ["-i", path]
+    graph = []
+    segments = ""
+    for index, info in enumerate(metadata):
+        has_audio = any(st.get("codec_type") == "audio" for st in info.get("streams", []))
+        graph.append(f"[{index}:v]{conform_video_filter(video['width'], video['height'], video['r_frame_rate'], 'yuv420p')}[v{index}]")
+        segments += f"[v{index}]"
+        if audio is not None:
+            if has_audio:
+                graph.append(f"[{index}:a]aresample={audio['sample_rate']},aformat=channel_layouts={'mono' if audio.get('channels') == 1 else 'stereo'}[a{index}]")
+            else:
+                duration = float(info.get("format", {}).get("duration") or 0)
+                graph.append(f"anullsrc=r={audio['sample_rate']}:cl={'mono' if audio.get('channels') == 1 else 'stereo'},atrim=duration={duration}[a{index}]")
+            segments += f"[a{index}]"
+    graph.append(f"{segments}concat=n={len(input_paths)}:v=1:a={1 if audio is not None else 0}[v]" + ("[a]" if audio is not None else ""))
+    cmd += ["-filter_complex", ";".join(graph), "-map", "[v]"]
+    if audio is not None:
+        cmd += ["-map", "[a]", "-c:a", "aac"]
+    return cmd + [*encoder_args(profile), *muxer_args(output_path), output_path]
+
+# Tool to concatenate videos, re-encoding only inputs that do not match the rest
 @mcp.tool()
-def concatenate_videos(input_files: List[str], output_file: str) -> str:
-    """Concatenates multiple video files without re-encoding using FFmpeg concat demuxer."""
+@instrumented
+async def concatenate_videos(input_files: List[str], output_file: str, profile: str = DEFAULT_ENCODER_PROFILE) -> str:
+    """Concatenates multiple video files using the FFmpeg concat demuxer.
+
+    All inputs are probed first. Inputs whose codec, resolution, pixel format, frame rate,
+    timebase or audio layout differ from the majority are re-encoded to match it and the rest
+    are stream-copied; the concat filter (a full re-encode with profile) is used only when
+    the majority's codecs cannot be reproduced.
+    """
     output_path = os.path.join(MEDIA_DIR, output_file)
     
     if os.path.sep in output_file:
@@ -212,47 +2153,98 @@ def concatenate_videos(input_files: List[str], output_file: str) -> str:
         return f"Error: Output file {output_file} already exists."
     if not any(output_file.lower().endswith(ext) for ext in VIDEO_EXTENSIONS):
         return f"Error: Output file must have a video extension ({', '.join(VIDEO_EXTENSIONS)})"
+    profile = container_profile(profile, output_file)
+    profile_error = validate_encoder_profile(profile, output_file)
+    if profile_error:
+        return profile_error
     
-    import tempfile
-    with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmpfile:
-        for input_file in input_files:
-            if os.path.sep in input_file:
-                return "Error: Input file names cannot contain directory separators."
-            input_path = os.path.join(MEDIA_DIR, input_file)
-            if not os.path.exists(input_path):
-                return f"Error: Input file {input_file} not found."
-            tmpfile.write(f"file '{input_path}'\n")
-        tmpfile_path = tmpfile.name
+    input_paths = []
+    for input_file in input_files:
+        if os.path.sep in input_file and not is_input_uri(input_file):
+            return "Error: Input file names cannot contain directory separators."
+        input_path = resolve_input(input_file)
+        if not await input_exists(input_path):
+            return f"Error: Input file {input_file} not found."
+        input_paths.append(input_path)
     
-    cmd = [
-        "ffmpeg",
-        "-f", "concat",
-        "-safe", "0",
-        "-i", tmpfile_path,
-        "-c", "copy",
-        output_path
-    ]
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        os.remove(tmpfile_path)
-        return f"Successfully concatenated videos to {output_file}"
+        metadata = await asyncio.gather(*(probe_media(path) for path in input_paths))
+    except (subprocess.CalledProcessError, OSError):
+        return "Error: Could not probe input files."
+    signatures = [stream_signature(info) for info in metadata]
+    if any(video is None for video, _ in signatures):
+        return "Error: Every input must contain a video stream."
+    # The most common signature wins; ties go to the earliest input
+    majority = max(signatures, key=lambda sig: (signatures.count(sig), -signatures.index(sig)))
+    reference = metadata[signatures.index(majority)]
+    target = {
+        "video": next(st for st in reference["streams"] if st.get("codec_type") == "video"),
+        "audio": next((st for st in reference["streams"] if st.get("codec_type") == "audio"), None)
+    }
+    outliers = [index for index, sig in enumerate(signatures) if sig != majority]
+    can_normalize = (
+        target["video"].get("codec_name") in SMART_CUT_ENCODERS
+        and (target["audio"] is None or target["audio"].get("codec_name") in AUDIO_ENCODERS)
+    )
+
+    scratch_dir = make_scratch_dir("concat")
+    list_path = None
+
+    async def render(staged_path: str) -> str:
+        nonlocal list_path
+        try:
+            if outliers and not can_normalize:
+                raise ValueError("majority codecs cannot be re-encoded")
+            parts = list(input_paths)
+            # Normalized parts share the majority's container; a URL's extension is in its path, not its query
+            majority_path = input_paths[signatures.index(majority)]
+            majority_name = urllib.parse.urlparse(majority_path).path if is_url(majority_path) else majority_path
+            extension = os.path.splitext(majority_name)[1] or os.path.splitext(output_file)[1]
+            steps = []
+            for index in outliers:
+                parts[index] = os.path.join(scratch_dir, f"normalized_{index}{extension}")
+                steps.append(normalize_for_concat(input_paths[index], target, parts[index], profile))
+            # A failed normalization stops the others before the concat filter fallback starts
+            await gather_or_cancel(*steps)
+            list_path = write_concat_list(parts)
+            # The concat demuxer only opens remote entries whose protocols are whitelisted
+            whitelist = ["-protocol_whitelist", "file,http,https,tcp,tls,crypto"] if any(is_url(part) for part in parts) else []
+            await run_ffmpeg(staged_cmd(["ffmpeg", "-f", "concat", "-safe", "0", *whitelist, "-i", list_path, "-c", "copy", output_path], staged_path))
+        except (ValueError, KeyError, subprocess.CalledProcessError):
+            # Fall back to decoding everything through the concat filter
+            if os.path.exists(staged_path):
+                os.remove(staged_path)
+            await run_ffmpeg(concat_filter_cmd(input_paths, metadata, target, staged_path, profile))
+            return "concat filter, all inputs re-encoded"
+        if outliers:
+            return f"stream copy; re-encoded to match the others: {', '.join(input_files[index] for index in outliers)}"
+        return None
+
+    try:
+        return await cached_render("concatenate_videos", input_paths, {"encoder": encoder_args(profile)}, output_path,
+                                   render, f"Successfully concatenated videos to {output_file}")
     except subprocess.CalledProcessError as e:
-        os.remove(tmpfile_path)
         return f"Error concatenating videos: {e.stderr.decode()}"
+    finally:
+        if list_path is not None:
+            os.remove(list_path)
+        with span("temp"):
+            shutil.rmtree(scratch_dir, ignore_errors=True)
 
 # Tool to merge audio and video tracks
 @mcp.tool()
-def merge_audio_video(video_file: str, audio_file: str, output_file: str) -> str:
+@instrumented
+async def merge_audio_video(video_file: str, audio_file: str, output_file: str) -> str:
     """Merges a video file and an audio file into a single output file."""
-    video_path = os.path.join(MEDIA_DIR, video_file)
-    audio_path = os.path.join(MEDIA_DIR, audio_file)
+    video_path = resolve_input(video_file)
+    audio_path = resolve_input(audio_file)
     output_path = os.path.join(MEDIA_DIR, output_file)
     
-    if os.path.sep in video_file or os.path.sep in audio_file or os.path.sep in output_file:
+    if any(os.path.sep in name and not is_input_uri(name) for name in (video_file, audio_file)) or os.path.sep in output_file:
         return "Error: File names cannot contain directory separators."
-    if not os.path.exists(video_path):
+    if not await input_exists(video_path):
         return f"Error: Video file {video_file} not found."
-    if not os.path.exists(audio_path):
+    if not await input_exists(audio_path):
         return f"Error: Audio file {audio_file} not found."
     if not any(audio_file.lower().endswith(ext) for ext in AUDIO_EXTENSIONS):
         return f"Error: Audio file must have an audio extension ({', '.join(AUDIO_EXTENSIONS)})"
@@ -262,7 +2254,7 @@ def merge_audio_video(video_file: str, audio_file: str, output_file: str) -> str
         return f"Error: Output file must have a video extension ({', '.join(VIDEO_EXTENSIONS)})"
     
     # Check audio codec compatibility
-    audio_codec = get_audio_codec(audio_path)
+    audio_codec = await get_audio_codec(audio_path)
     if audio_codec == "none":
         return "Error: Audio file has no audio stream."
     if audio_codec == "error":
@@ -280,21 +2272,22 @@ def merge_audio_video(video_file: str, audio_file: str, output_file: str) -> str
         output_path
     ]
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return f"Successfully merged audio and video to {output_file}"
+        return await cached_render("merge_audio_video", [video_path, audio_path], {}, output_path,
+                                   lambda staged_path: run_ffmpeg(staged_cmd(cmd, staged_path)), f"Successfully merged audio and video to {output_file}")
     except subprocess.CalledProcessError as e:
         return f"Error merging audio and video: {e.stderr.decode()}"
 
 # Tool to extract audio from video
 @mcp.tool()
-def extract_audio(video_file: str, output_audio_file: str) -> str:
+@instrumented
+async def extract_audio(video_file: str, output_audio_file: str) -> str:
     """Extracts audio from a video file. Re-encodes to MP3 if necessary."""
-    video_path = os.path.join(MEDIA_DIR, video_file)
+    video_path = resolve_input(video_file)
     output_path = os.path.join(MEDIA_DIR, output_audio_file)
     
-    if os.path.sep in video_file or os.path.sep in output_audio_file:
+    if (os.path.sep in video_file and not is_input_uri(video_file)) or os.path.sep in output_audio_file:
         return "Error: File names cannot contain directory separators."
-    if not os.path.exists(video_path):
+    if not await input_exists(video_path):
         return f"Error: Video file {video_file} not found."
     if os.path.exists(output_path):
         return f"Error: Output file {output_audio_file} already exists."
@@ -302,7 +2295,7 @@ def extract_audio(video_file: str, output_audio_file: str) -> str:
         return f"Error: Output file must have an audio extension ({', '.join(AUDIO_EXTENSIONS)})"
     
     # Get audio codec of input video
-    audio_codec = get_audio_codec(video_path)
+    audio_codec = await get_audio_codec(video_path)
     if audio_codec == "none":
         return "Error: Video file has no audio stream."
     if audio_codec == "error":
@@ -337,15 +2330,161 @@ def extract_audio(video_file: str, output_audio_file: str) -> str:
         ]
     
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return f"Successfully extracted audio to {output_audio_file}"
+        return await cached_render("extract_audio", [video_path], {}, output_path,
+                                   lambda staged_path: run_ffmpeg(staged_cmd(cmd, staged_path)), f"Successfully extracted audio to {output_audio_file}")
     except subprocess.CalledProcessError as e:
         return f"Error extracting audio: {e.stderr.decode()}"
 
+# Helper function to read a whole file (run in a worker thread)
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+# Audio encoder chosen from the output container when process_audio is not given one
+AUDIO_CODEC_BY_EXTENSION = {
+    ".mp3": "libmp3lame", ".wav": "pcm_s16le", ".flac": "flac", ".ogg": "libvorbis",
+    ".webm": "libopus", ".aac": "aac", ".m4a": "aac"
+}
+LOUDNORM_MEASUREMENTS = ["input_i", "input_tp", "input_lra", "input_thresh", "target_offset"]
+
+# Helper function to build the pre-normalization audio graph of process_audio
+def build_audio_mix_graph(music_gain_db: float = None, duck: bool = True, duck_threshold: float = 0.05, duck_ratio: float = 8) -> str:
+    """Returns a filter graph ending in [mix]: the input's audio, optionally with a music bed ([1:a]) ducked under it."""
+    if music_gain_db is None:
+        return "[0:a:0]anull[mix]"
+    bed = f"[1:a:0]volume={music_gain_db}dB[bed]"
+    if not duck:
+        return f"{bed};[0:a:0][bed]amix=inputs=2:duration=first:dropout_transition=0:normalize=0[mix]"
+    # The original feeds both the mix and the compressor's sidechain, so speech pushes the bed down
+    return (
+        f"[0:a:0]asplit=2[main][sidechain];{bed};"
+        f"[bed][sidechain]sidechaincompress=threshold={duck_threshold}:ratio={duck_ratio}:attack=20:release=400[ducked];"
+        f"[main][ducked]amix=inputs=2:duration=first:dropout_transition=0:normalize=0[mix]"
+    )
+
+# Helper function to run (or reuse) the loudnorm measurement pass
+async def measure_loudness(input_args: List[str], graph: str, loudnorm: str, cache_key: str) -> Dict[str, str]:
+    """Returns loudnorm's first-pass measurements for the [mix] output of graph, cached per input version and settings."""
+    db = get_probe_db()
+    row = db.execute("SELECT data FROM loudness WHERE key = ?", (cache_key,)).fetchone()
+    if row is not None:
+        return json.loads(row[0])
+    cmd = [
+        "ffmpeg", *input_args,
+        "-filter_complex", f"{graph};[mix]{loudnorm}:print_format=json[measured]",
+        "-map", "[measured]",
+        "-f", "null", "-"
+    ]
+    result = await run_ffmpeg(cmd)
+    stderr = result.stderr.decode(errors="replace")
+    match = re.search(r"\{[^{}]*\"input_i\"[^{}]*\}", stderr)
+    if match is None:
+        raise ValueError("loudnorm did not report measurements.")
+    measured = json.loads(match.group(0))
+    if any(key not in measured for key in LOUDNORM_MEASUREMENTS) or "inf" in measured["input_i"]:
+        raise ValueError("Could not measure loudness (silent or missing audio).")
+    db.execute("INSERT OR REPLACE INTO loudness VALUES (?, ?, ?)", (cache_key, json.dumps(measured), time.time()))
+    db.commit()
+    return measured
+
+# Tool: Normalize loudness, mix a music bed and transcode audio while copying video
+@mcp.tool()
+@instrumented
+async def process_audio(input_file: str, output_file: str, normalize: bool = True, target_i: float = -23.0, target_tp: float = -1.0,
+                        target_lra: float = 7.0, music_file: str = None, music_gain_db: float = -12.0, duck: bool = True,
+                        duck_threshold: float = 0.05, duck_ratio: float = 8.0, sample_rate: int = None, channels: int = None,
+                        audio_codec: str = None, audio_bitrate: str = None) -> str:
+    """Processes the audio of a video or audio file in one encode; any video stream is copied, never re-encoded.
+
+    normalize applies two-pass EBU R128 loudnorm to target_i LUFS / target_tp dBTP / target_lra LU (the
+    measurement pass is cached). music_file is looped under the original at music_gain_db, ducked by
+    sidechain compression while the original is loud when duck is set. sample_rate, channels,
+    audio_codec and audio_bitrate control the output encode (codec defaults from the output extension).
+    """
+    input_path = resolve_input(input_file)
+    output_path = os.path.join(MEDIA_DIR, output_file)
+    if not await input_exists(input_path):
+        return f"Error: Input file {input_file} not found."
+    if os.path.exists(output_path):
+        return f"Error: Output file {output_file} already exists."
+    extension = os.path.splitext(output_file)[1].lower()
+    if extension not in VIDEO_EXTENSIONS + AUDIO_EXTENSIONS:
+        return f"Error: Output file must have a video or audio extension ({', '.join(VIDEO_EXTENSIONS + AUDIO_EXTENSIONS)})"
+    if not -70 <= target_i <= -5 or not -9 <= target_tp <= 0 or not 1 <= target_lra <= 50:
+        return "Error: Loudness targets out of range (target_i -70..-5 LUFS, target_tp -9..0 dBTP, target_lra 1..50 LU)."
+    if not 0 < duck_threshold <= 1 or not 1 <= duck_ratio <= 20:
+        return "Error: duck_threshold must be in (0, 1] and duck_ratio in [1, 20]."
+    if (sample_rate is not None and sample_rate <= 0) or (channels is not None and channels <= 0):
+        return "Error: sample_rate and channels must be positive."
+    music_path = None
+    if music_file is not None:
+        music_path = resolve_input(music_file)
+        if not await input_exists(music_path):
+            return f"Error: Music file {music_file} not found."
+
+    try:
+        metadata = await probe_media(input_path)
+    except (subprocess.CalledProcessError, OSError):
+        return "Error: Could not probe input file."
+    audio = next((st for st in metadata.get("streams", []) if st.get("codec_type") == "audio"), None)
+    if audio is None:
+        return "Error: Input file has no audio stream."
+    has_video = any(st.get("codec_type") == "video" and not st.get("disposition", {}).get("attached_pic")
+                    for st in metadata.get("streams", []))
+    codec = audio_codec or AUDIO_CODEC_BY_EXTENSION.get(extension, "aac")
+    # loudnorm works at 192 kHz internally, so the output rate is always set explicitly
+    rate = sample_rate or int(audio.get("sample_rate") or 48000)
+
+    input_args = ["-i", input_path]
+    if music_path:
+        # Loop the bed so it covers the whole programme; amix stops with the original
+        input_args += ["-stream_loop", "-1", "-i", music_path]
+    graph = build_audio_mix_graph(music_gain_db if music_path else None, duck, duck_threshold, duck_ratio)
+    audio_filter = "[mix]anull"
+    loudnorm = f"loudnorm=I={target_i}:TP={target_tp}:LRA={target_lra}"
+    if normalize:
+        identities = [await file_identity(input_path)] + ([await file_identity(music_path)] if music_path else [])
+        measurement_key = hashlib.sha256(json.dumps([identities, graph, loudnorm]).encode()).hexdigest()
+        try:
+            measured = await measure_loudness(input_args, graph, loudnorm, measurement_key)
+        except ValueError as e:
+            return f"Error: {e}"
+        except subprocess.CalledProcessError as e:
+            return f"Error measuring loudness: {e.stderr.decode()}"
+        audio_filter = (
+            f"[mix]{loudnorm}:measured_I={measured['input_i']}:measured_TP={measured['input_tp']}"
+            f":measured_LRA={measured['input_lra']}:measured_thresh={measured['input_thresh']}"
+            f":offset={measured['target_offset']}:linear=true"
+        )
+    filter_complex = f"{graph};{audio_filter},aresample={rate}[a]"
+
+    cmd = ["ffmpeg", *input_args, "-filter_complex", filter_complex]
+    if has_video and extension in VIDEO_EXTENSIONS:
+        cmd += ["-map", "0:v:0", "-c:v", "copy"]
+    cmd += ["-map", "[a]", "-c:a", codec, "-ar", str(rate)]
+    if channels:
+        cmd += ["-ac", str(channels)]
+    if audio_bitrate:
+        cmd += ["-b:a", audio_bitrate]
+    cmd += [output_path]
+
+    steps = (["loudness normalized"] if normalize else []) + ([f"mixed with {music_file}" + (" (ducked)" if duck else "")] if music_path else [])
+    try:
+        return await cached_render("process_audio", [input_path] + ([music_path] if music_path else []), {"filter": filter_complex, "args": cmd[cmd.index("-map"):-1]}, output_path,
+                                   lambda staged_path: run_ffmpeg(staged_cmd(cmd, staged_path)),
+                                   f"Successfully processed audio to {output_file}" + (f" ({', '.join(steps)})" if steps else ""))
+    except subprocess.CalledProcessError as e:
+        return f"Error processing audio: {e.stderr.decode()}"
+
 # Tool: Convert image sequence to video
 @mcp.tool()
-def images_to_video(input_pattern: str, frame_rate: float, output_file: str) -> str:
-    """Converts a sequence of images into a video using FFmpeg."""
+@instrumented
+async def images_to_video(input_pattern: str, frame_rate: float, output_file: str, profile: str = DEFAULT_ENCODER_PROFILE, input_files: List[str] = None) -> str:
+    """Converts a sequence of images into a video using FFmpeg.
+
+    Instead of a numbered input_pattern, input_files may list images in playback order under
+    any names (pass input_pattern=""); they are piped to FFmpeg without renumbering.
+    """
     if not frame_rate > 0:
         return "Error: frame_rate must be positive"
     if not any(output_file.lower().endswith(ext) for ext in VIDEO_EXTENSIONS):
@@ -356,28 +2495,293 @@ def images_to_video(input_pattern: str, frame_rate: float, output_file: str) ->
     if os.path.exists(output_path):
         return f"Error: Output file {output_file} already exists."
 
-    input_pattern_full = os.path.join(MEDIA_DIR, input_pattern)
+    profile = container_profile(profile, output_file)
+    profile_error = validate_encoder_profile(profile, output_file)
+    if profile_error:
+        return profile_error
+
+    if input_files:
+        if input_pattern:
+            return "Error: Use either input_pattern or input_files, not both."
+        if any(os.path.sep in f or os.path.isabs(f) or f in ("", ".", "..") for f in input_files):
+            return "Error: Input file names cannot contain directory separators."
+        input_paths = [os.path.join(MEDIA_DIR, f) for f in input_files]
+        missing = [f for f, path in zip(input_files, input_paths) if not os.path.isfile(path)]
+        if missing:
+            return f"Error: Image files not found: {missing[:10]}"
+        # image2pipe detects the codec once, so every frame must share a format
+        if len({os.path.splitext(f)[1].lower().replace(".jpeg", ".jpg") for f in input_files}) > 1:
+            return "Error: All input files must have the same image format."
+        stream = FrameStream(frame_stream_cmd(frame_rate, output_path, profile), output_path, len(input_files) / frame_rate)
+        try:
+            try:
+                for index, path in enumerate(input_paths):
+                    await stream.write(index, await asyncio.to_thread(read_file, path))
+                await stream.close()
+            except BaseException:
+                # Covers unreadable images and cancellation too; the encode must not outlive the call
+                await stream.abort()
+                raise
+            return f"Successfully created video {output_file}"
+        except FileExistsError as e:
+            return f"Error: {e}"
+        except (ValueError, OSError) as e:
+            return f"Error creating video: {e}"
+        except subprocess.CalledProcessError as e:
+            return f"Error creating video: {e.stderr.decode()}"
+
+    input_pattern_full = os.path.join(MEDIA_DIR, input_pattern)
+
+    cmd = [
+        "ffmpeg",
+        "-framerate", str(frame_rate),
+        "-i", input_pattern_full,
+        *encoder_args(profile, "yuv420p"),
+        output_path
+    ]
+    try:
+        async with staged_output(output_path) as staged_path:
+            await run_ffmpeg(staged_cmd(cmd, staged_path))
+        return f"Successfully created video {output_file}"
+    except FileExistsError as e:
+        return f"Error: {e}"
+    except subprocess.CalledProcessError as e:
+        return f"Error creating video: {e.stderr.decode()}"
+
+# Frames queued ahead of FFmpeg's stdin before writers have to wait
+FRAME_STREAM_BUFFER = int(os.environ.get("MEDIA_FRAME_STREAM_BUFFER", 32))
+# Out-of-order frames held back while waiting for a missing index
+FRAME_STREAM_REORDER = int(os.environ.get("MEDIA_FRAME_STREAM_REORDER", 256))
+# Seconds a stream opened with open_frame_stream may sit idle before it is aborted
+FRAME_STREAM_IDLE_TIMEOUT = float(os.environ.get("MEDIA_FRAME_STREAM_IDLE_TIMEOUT", 300))
+frame_streams = {}
+frame_stream_reaper_task = None
+
+class FrameStream:
+    """Feeds frames to an FFmpeg encode over stdin, in index order, with backpressure.
+
+    write() accepts frames in any order; frames are held until every earlier index has
+    arrived, then queued for FFmpeg. The queue is bounded, so writers wait while FFmpeg
+    catches up instead of buffering the whole sequence in memory. cmd must end with
+    output_path; the encode is staged and only published by a successful close().
+    """
+
+    def __init__(self, cmd: List[str], output_path: str, duration: float = 0.0, detached: bool = False):
+        self.output_path = output_path
+        self.scratch_dir = make_scratch_dir("stream")
+        cmd = staged_cmd(cmd, os.path.join(self.scratch_dir, os.path.basename(output_path)))
+        self.queue = asyncio.Queue(maxsize=FRAME_STREAM_BUFFER)
+        self.pending = {}
+        self.next_index = 0
+        self.frames = 0
+        self.last_write = time.monotonic()
+        # Set once close() starts waiting on the encode, so the idle reaper leaves it alone
+        self.closing = False
+        # A detached stream outlives the request that opened it, so it must not report progress to it
+        self.detached = detached
+        context = contextvars.Context() if detached else None
+        self.task = asyncio.create_task(run_ffmpeg(cmd, duration=duration, feed=self.feed, slots=frame_stream_slots), context=context)
+
+    async def feed(self, stdin: asyncio.StreamWriter) -> None:
+        try:
+            while (frame := await self.queue.get()) is not None:
+                stdin.write(frame)
+                await stdin.drain()
+            stdin.close()
+            await stdin.wait_closed()
+        except (BrokenPipeError, ConnectionResetError):
+            # FFmpeg exited early; its exit status carries the error
+            pass
+
+    async def put(self, frame: bytes) -> None:
+        """Queues one frame, failing fast instead of waiting forever if FFmpeg has exited."""
+        self.last_write = time.monotonic()
+        put = asyncio.ensure_future(self.queue.put(frame))
+        await asyncio.wait([put, self.task], return_when=asyncio.FIRST_COMPLETED)
+        # A writer held up by backpressure is busy, not idle
+        self.last_write = time.monotonic()
+        if not put.done():
+            put.cancel()
+            await self.task
+            raise ValueError("FFmpeg exited before all frames were written.")
+
+    async def write(self, index: int, data: bytes) -> None:
+        """Adds the frame at index, flushing every frame that is now in order."""
+        self.last_write = time.monotonic()
+        if self.task.done():
+            await self.task
+            raise ValueError("FFmpeg exited before all frames were written.")
+        if index < self.next_index or index in self.pending:
+            raise ValueError(f"Frame {index} was already written.")
+        if len(self.pending) >= FRAME_STREAM_REORDER:
+            raise ValueError(f"Too many frames ahead of missing frame {self.next_index}.")
+        self.pending[index] = data
+        while self.next_index in self.pending:
+            await self.put(self.pending.pop(self.next_index))
+            self.next_index += 1
+            self.frames += 1
+
+    async def close(self, allow_gaps: bool = False) -> subprocess.CompletedProcess:
+        """Flushes held frames (skipping gaps only if allow_gaps) and waits for the encode to finish."""
+        if self.pending and not allow_gaps:
+            raise ValueError(f"Missing frame {self.next_index}; {len(self.pending)} later frames are waiting.")
+        self.closing = True
+        try:
+            for index in sorted(self.pending):
+                await self.put(self.pending.pop(index))
+                self.frames += 1
+            await self.put(None)
+            # A detached encode reports to no tool call, so the wait for it stands in for its ffmpeg stage
+            with span("ffmpeg") if self.detached else nullcontext():
+                result = await self.task
+            with span("rename"):
+                await asyncio.to_thread(publish_scratch, self.scratch_dir, os.path.dirname(self.output_path))
+            return result
+        finally:
+            # put() only fails once FFmpeg has exited, so the encode is over either way
+            with span("temp"):
+                shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+    async def abort(self) -> None:
+        """Kills the encode and discards the staged output."""
+        self.task.cancel()
+        try:
+            await self.task
+        except (asyncio.CancelledError, subprocess.CalledProcessError):
+            pass
+        with span("temp"):
+            shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+# Helper function to build the encode command for frames arriving on stdin
+def frame_stream_cmd(frame_rate: float, output_path: str, profile: str, width: int = None, height: int = None, pix_fmt: str = "rgb24") -> List[str]:
+    """Returns an FFmpeg command reading encoded images (image2pipe) or, given a size, raw frames from stdin."""
+    if width and height:
+        source = ["-f", "rawvideo", "-pix_fmt", pix_fmt, "-s", f"{width}x{height}"]
+    else:
+        source = ["-f", "image2pipe"]
+    return [
+        "ffmpeg",
+        *source,
+        "-framerate", str(frame_rate),
+        "-i", "pipe:0",
+        *encoder_args(profile, "yuv420p"),
+        output_path
+    ]
+
+# Helper function to abort streams their client has abandoned
+async def reap_idle_frame_streams() -> None:
+    now = time.monotonic()
+    for stream_id, stream in list(frame_streams.items()):
+        if not stream.closing and now - stream.last_write > FRAME_STREAM_IDLE_TIMEOUT:
+            frame_streams.pop(stream_id, None)
+            await stream.abort()
+
+async def frame_stream_reaper_loop() -> None:
+    """Aborts abandoned streams even when nobody opens a new one."""
+    while True:
+        await asyncio.sleep(min(FRAME_STREAM_IDLE_TIMEOUT, 60))
+        await reap_idle_frame_streams()
+
+def ensure_frame_stream_reaper() -> None:
+    global frame_stream_reaper_task
+    if frame_stream_reaper_task is None:
+        frame_stream_reaper_task = asyncio.create_task(frame_stream_reaper_loop(), context=contextvars.Context())
+
+# Tool to start a streamed encode
+@mcp.tool()
+@instrumented
+async def open_frame_stream(output_file: str, frame_rate: float, profile: str = DEFAULT_ENCODER_PROFILE,
+                            width: int = None, height: int = None, pix_fmt: str = "rgb24") -> str:
+    """Starts encoding a video from frames sent with write_frames; returns a stream id.
+
+    Frames are encoded images (PNG/JPEG) unless width and height are given, in which case
+    they are raw pix_fmt frames of that size.
+    """
+    if not frame_rate > 0:
+        return "Error: frame_rate must be positive"
+    if (width is None) != (height is None) or (width is not None and (width <= 0 or height <= 0)):
+        return "Error: width and height must both be positive or both omitted"
+    if not any(output_file.lower().endswith(ext) for ext in VIDEO_EXTENSIONS):
+        return f"Error: Output file must have a video extension ({', '.join(VIDEO_EXTENSIONS)})"
+    if os.path.sep in output_file:
+        return "Error: Output file name cannot contain directory separators."
+    output_path = os.path.join(MEDIA_DIR, output_file)
+    if os.path.exists(output_path) or any(s.output_path == output_path for s in frame_streams.values()):
+        return f"Error: Output file {output_file} already exists."
+    profile = container_profile(profile, output_file)
+    profile_error = validate_encoder_profile(profile, output_file)
+    if profile_error:
+        return profile_error
+
+    await reap_idle_frame_streams()
+    if len(frame_streams) >= MAX_FRAME_STREAMS:
+        return f"Error: Too many open frame streams (limit {MAX_FRAME_STREAMS}); close one first."
+    stream_id = uuid.uuid4().hex[:12]
+    frame_streams[stream_id] = FrameStream(
+        frame_stream_cmd(frame_rate, output_path, profile, width, height, pix_fmt), output_path, detached=True
+    )
+    return json.dumps({"stream_id": stream_id, "output_file": output_file})
+
+# Tool to send frames to a streamed encode
+@mcp.tool()
+@instrumented
+async def write_frames(stream_id: str, frames: List[Dict[str, Any]]) -> str:
+    """Sends frames as [{"index": n, "data": base64}]; indices start at 0 and may arrive in any order."""
+    stream = frame_streams.get(stream_id)
+    if stream is None:
+        return f"Error: Frame stream {stream_id} not found."
+    try:
+        for frame in frames:
+            await stream.write(int(frame["index"]), base64.b64decode(frame["data"], validate=True))
+    except (KeyError, ValueError, TypeError, binascii.Error) as e:
+        return f"Error writing frames: {e}"
+    except asyncio.CancelledError:
+        # The encode was aborted under us (idle reaper or another client), not this request
+        if asyncio.current_task().cancelling():
+            raise
+        return f"Error: Frame stream {stream_id} was aborted."
+    except subprocess.CalledProcessError as e:
+        frame_streams.pop(stream_id, None)
+        await stream.abort()
+        return f"Error creating video: {e.stderr.decode()}"
+    return json.dumps({"stream_id": stream_id, "encoded": stream.next_index, "waiting": sorted(stream.pending)})
 
-    cmd = [
-        "ffmpeg",
-        "-framerate", str(frame_rate),
-        "-i", input_pattern_full,
-        "-c:v", "libx264",
-        "-pix_fmt", "yuv420p",
-        output_path
-    ]
+# Tool to finish (or abandon) a streamed encode
+@mcp.tool()
+@instrumented
+async def close_frame_stream(stream_id: str, allow_gaps: bool = False, abort: bool = False) -> str:
+    """Finishes the video once all frames are written; allow_gaps skips missing indices, abort discards it."""
+    stream = frame_streams.get(stream_id)
+    if stream is None:
+        return f"Error: Frame stream {stream_id} not found."
+    if abort:
+        frame_streams.pop(stream_id)
+        await stream.abort()
+        return f"Successfully aborted frame stream {stream_id}"
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return f"Successfully created video {output_file}"
+        await stream.close(allow_gaps)
+    except ValueError as e:
+        return f"Error: {e}"
+    except FileExistsError as e:
+        return f"Error: {e}"
     except subprocess.CalledProcessError as e:
         return f"Error creating video: {e.stderr.decode()}"
+    except asyncio.CancelledError:
+        if asyncio.current_task().cancelling():
+            raise
+        return f"Error: Frame stream {stream_id} was aborted."
+    finally:
+        if stream.task.done():
+            frame_streams.pop(stream_id, None)
+    return f"Successfully created video {os.path.basename(stream.output_path)} from {stream.frames} frames"
 
 # Tool: Convert video to image sequence
 @mcp.tool()
-def video_to_images(input_file: str, output_pattern: str, frame_rate: float = None) -> str:
+@instrumented
+async def video_to_images(input_file: str, output_pattern: str, frame_rate: float = None) -> str:
     """Converts a video into a sequence of images using FFmpeg."""
-    input_path = os.path.join(MEDIA_DIR, input_file)
-    if not os.path.exists(input_path):
+    input_path = resolve_input(input_file)
+    if not await input_exists(input_path):
         return f"Error: Input file {input_file} not found."
     if os.path.sep in output_pattern:
         return "Error: Output pattern cannot contain directory separators."
@@ -394,22 +2798,278 @@ def video_to_images(input_file: str, output_pattern: str, frame_rate: float = No
     cmd += [output_pattern_full]
 
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        async with staged_output(output_pattern_full) as staged_pattern:
+            await run_ffmpeg(staged_cmd(cmd, staged_pattern))
         return f"Successfully extracted images to {output_pattern}"
+    except FileExistsError as e:
+        return f"Error: {e}"
     except subprocess.CalledProcessError as e:
         return f"Error extracting images: {e.stderr.decode()}"
 
+# Encoders for frames streamed over stdout, with their image2pipe options
+FRAME_FORMATS = {
+    "jpeg": ["-c:v", "mjpeg", "-q:v", "3"],
+    "png": ["-c:v", "png"]
+}
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+JPEG_SOI = b"\xff\xd8\xff"
+# Largest frame width accepted by extract_frames, to bound the in-memory response
+MAX_FRAME_WIDTH = 1920
+
+# Helper function to cut an image2pipe byte stream into individual images
+def split_image_stream(data: bytes, image_format: str) -> List[bytes]:
+    """Splits concatenated PNG (by chunk walk up to IEND) or JPEG (by SOI marker) images."""
+    images = []
+    if image_format == "png":
+        pos = 0
+        while data.startswith(PNG_SIGNATURE, pos):
+            end = pos + len(PNG_SIGNATURE)
+            while end + 8 <= len(data):
+                length = int.from_bytes(data[end:end + 4], "big")
+                chunk_type = data[end + 4:end + 8]
+                end += 12 + length
+                if chunk_type == b"IEND":
+                    break
+            images.append(data[pos:end])
+            pos = end
+        return images
+    # Entropy-coded JPEG data stuffs every 0xFF byte, so SOI only appears at image starts
+    starts = [m.start() for m in re.finditer(re.escape(JPEG_SOI), data)]
+    return [data[a:b] for a, b in zip(starts, starts[1:] + [len(data)])]
+
+# Tool: Extract frames as in-memory images
+@mcp.tool()
+@instrumented
+async def extract_frames(input_file: str, interval: float = None, scene_threshold: float = None, max_frames: int = 12,
+                         width: int = 320, image_format: str = "jpeg", contact_sheet: bool = False, columns: int = 4) -> Any:
+    """Streams frames from FFmpeg stdout and returns them as images, without writing files.
+
+    Frames are sampled every `interval` seconds, at scene changes scoring above `scene_threshold`
+    (0-1), or evenly across the clip when neither is given, up to max_frames. With
+    contact_sheet=True the frames are tiled into a single image `columns` wide.
+    """
+    input_path = resolve_input(input_file)
+    if not await input_exists(input_path):
+        return f"Error: Input file {input_file} not found."
+    if image_format not in FRAME_FORMATS:
+        return f"Error: Invalid image format. Must be one of {list(FRAME_FORMATS.keys())}"
+    if interval is not None and scene_threshold is not None:
+        return "Error: Use either interval or scene_threshold, not both."
+    if interval is not None and interval <= 0:
+        return "Error: interval must be positive"
+    if scene_threshold is not None and not 0 < scene_threshold < 1:
+        return "Error: scene_threshold must be between 0 and 1"
+    if not 0 < max_frames <= 256:
+        return "Error: max_frames must be between 1 and 256"
+    if not 16 <= width <= MAX_FRAME_WIDTH:
+        return f"Error: width must be between 16 and {MAX_FRAME_WIDTH}"
+    if contact_sheet and columns < 1:
+        return "Error: columns must be positive"
+
+    if scene_threshold is not None:
+        sampler = f"select='gt(scene,{scene_threshold})'"
+    else:
+        if interval is None:
+            duration = await get_video_duration(input_path)
+            if duration == 0.0:
+                return "Error: Could not determine video duration."
+            interval = duration / max_frames
+        # Take the frame in the middle of each interval rather than the first one
+        sampler = f"fps=1/{interval}:start_time={interval / 2}"
+    # showinfo reports each selected frame's timestamp on stderr
+    filters = [sampler, f"scale={width}:-2", "showinfo"]
+    if contact_sheet:
+        rows = math.ceil(max_frames / columns)
+        filters.append(f"tile={min(columns, max_frames)}x{rows}:padding=4:margin=4")
+
+    cmd = [
+        "ffmpeg", "-benchmark",
+        "-i", input_path,
+        "-an", "-sn",
+        "-vf", ",".join(filters),
+        "-fps_mode", "vfr",
+        "-frames:v", "1" if contact_sheet else str(max_frames),
+        *FRAME_FORMATS[image_format],
+        "-f", "image2pipe",
+        "pipe:1"
+    ]
+    try:
+        with span("ffmpeg"):
+            result = await run_process(cmd, ffmpeg_slots)
+    except subprocess.CalledProcessError as e:
+        return f"Error extracting frames: {e.stderr.decode(errors='replace')[-2000:]}"
+    stderr_lines = result.stderr.decode(errors="replace").splitlines()
+    record_child_usage(stderr_lines)
+
+    frames = split_image_stream(result.stdout, image_format)
+    if not frames:
+        return "Error: No frames matched the sampling settings."
+    times = [float(t) for t in re.findall(r"pts_time:\s*([-\d.]+)", "\n".join(stderr_lines))][:max_frames]
+    summary = json.dumps({"frames": len(times) if contact_sheet else len(frames), "timestamps": times, "contact_sheet": contact_sheet})
+    return [summary, *[Image(data=frame, format=image_format) for frame in frames]]
+
+THUMBNAIL_CACHE_DIR = os.path.join(CACHE_DIR, "thumbnails")
+THUMBNAIL_FORMATS = {"jpeg": ".jpg", "png": ".png"}
+
+# Helper function to format seconds as a WebVTT timestamp
+def vtt_timestamp(seconds: float) -> str:
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    return f"{hours:02d}:{minutes:02d}:{milliseconds // 1000:02d}.{milliseconds % 1000:03d}"
+
+# Helper function to grab one frame after an input-side seek
+async def grab_frame(input_path: str, seek: float, width: int, height: int, image_format: str, keyframes_only: bool) -> bytes:
+    """Seeks on the input (jumping straight to a keyframe) and returns one scaled frame as image bytes."""
+    cmd = ["ffmpeg", "-benchmark"]
+    if keyframes_only:
+        # Seeking to a keyframe and decoding only keyframes means one frame is decoded per sample;
+        # without accurate seek the demuxer lands on the keyframe at or before the (nudged) position
+        cmd += ["-skip_frame", "nokey", "-noaccurate_seek"]
+        seek += SEEK_EPSILON
+    cmd += [
+        "-ss", format_seconds(seek), "-i", input_path,
+        "-an", "-sn",
+        "-frames:v", "1",
+        "-vf", f"scale={width}:{height}",
+        *FRAME_FORMATS[image_format],
+        "-f", "image2pipe", "pipe:1"
+    ]
+    with span("ffmpeg"):
+        result = await run_process(cmd, ffmpeg_slots)
+    record_child_usage(result.stderr.decode(errors="replace").splitlines())
+    if not result.stdout:
+        raise ValueError(f"No frame found at {seek:.3f}s.")
+    return result.stdout
+
+# Tool: Generate a thumbnail sprite sheet and WebVTT index
+@mcp.tool()
+@instrumented
+async def generate_thumbnails(input_file: str, output_name: str, interval: float = 10, width: int = 160, columns: int = 10,
+                              rows: int = 10, snap_to_keyframes: bool = True, image_format: str = "jpeg") -> str:
+    """Writes {output_name}_NNN sprite sheets and {output_name}.vtt mapping each interval to its tile (#xywh) for scrubbing previews.
+
+    Each sample is taken with an input-side seek, so only a few frames per sample are decoded and the
+    samples run in parallel. With snap_to_keyframes each sample uses the nearest earlier keyframe,
+    which decodes exactly one frame. Results are cached per file version and settings.
+    """
+    input_path = resolve_input(input_file)
+    if not await input_exists(input_path):
+        return f"Error: Input file {input_file} not found."
+    if os.path.sep in output_name or not output_name:
+        return "Error: Output name cannot be empty or contain directory separators."
+    if image_format not in THUMBNAIL_FORMATS:
+        return f"Error: Invalid image format. Must be one of {list(THUMBNAIL_FORMATS.keys())}"
+    if interval <= 0:
+        return "Error: interval must be positive"
+    if not 16 <= width <= MAX_FRAME_WIDTH or columns < 1 or rows < 1:
+        return f"Error: width must be between 16 and {MAX_FRAME_WIDTH}, and columns and rows positive"
+    extension = THUMBNAIL_FORMATS[image_format]
+    vtt_path = os.path.join(MEDIA_DIR, f"{output_name}.vtt")
+    if os.path.exists(vtt_path) or os.path.exists(os.path.join(MEDIA_DIR, f"{output_name}_000{extension}")):
+        return f"Error: Output {output_name} already exists."
+
+    try:
+        metadata = await probe_media(input_path)
+    except (subprocess.CalledProcessError, OSError):
+        return "Error: Could not probe input file."
+    video = next((st for st in metadata.get("streams", []) if st.get("codec_type") == "video"), None)
+    duration = float(metadata.get("format", {}).get("duration") or 0)
+    if video is None or not video.get("width") or not video.get("height"):
+        return "Error: Input file has no video stream."
+    if duration <= 0:
+        return "Error: Could not determine video duration."
+    height = max(2, round(width * int(video["height"]) / int(video["width"]) / 2) * 2)
+    starts = [i * interval for i in range(math.ceil(duration / interval))]
+    per_sheet = columns * rows
+
+    settings = {"interval": interval, "width": width, "columns": columns, "rows": rows, "snap": snap_to_keyframes,
+                "format": image_format, "codec": FRAME_FORMATS[image_format]}
+    cache_dir = os.path.join(THUMBNAIL_CACHE_DIR, await output_cache_key("generate_thumbnails", [input_path], settings, f"sheet{extension}"))
+    sheet_count = math.ceil(len(starts) / per_sheet)
+    cached = os.path.isdir(cache_dir)
+    if cached:
+        touch_derived(cache_dir)
+    else:
+        keyframes = []
+        if snap_to_keyframes:
+            try:
+                keyframes = await get_keyframe_times(input_path)
+            except subprocess.CalledProcessError:
+                pass
+        seeks = [keyframe_at_or_before(keyframes, t) or keyframes[0] for t in starts] if keyframes else list(starts)
+        # Long GOPs map several samples onto one keyframe; grab each position once
+        grabs = {seek: asyncio.ensure_future(grab_frame(input_path, seek, width, height, image_format, bool(keyframes)))
+                 for seek in dict.fromkeys(seeks)}
+        # Built beside the cache so the finished set can be renamed into place
+        scratch_dir = make_scratch_dir("thumbs", THUMBNAIL_CACHE_DIR)
+        tile_cmd = [
+            "ffmpeg",
+            "-f", "image2pipe", "-framerate", "1", "-i", "pipe:0",
+            "-vf", f"tile={columns}x{rows}",
+            *(["-q:v", "3"] if image_format == "jpeg" else []),
+            "-start_number", "0",
+            os.path.join(scratch_dir, f"sheet_%03d{extension}")
+        ]
+        stream = FrameStream(tile_cmd, tile_cmd[-1], len(starts))
+        try:
+            for index, seek in enumerate(seeks):
+                await stream.write(index, await grabs[seek])
+            await stream.close()
+        except BaseException as e:
+            # Cancelled or failed grabs are reaped so no FFmpeg child outlives the call
+            for task in grabs.values():
+                task.cancel()
+            await asyncio.gather(*grabs.values(), return_exceptions=True)
+            await stream.abort()
+            with span("temp"):
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+            if not isinstance(e, (ValueError, subprocess.CalledProcessError)):
+                raise
+            detail = e.stderr.decode() if isinstance(e, subprocess.CalledProcessError) else str(e)
+            return f"Error generating thumbnails: {detail}"
+        if any(not os.path.exists(os.path.join(scratch_dir, f"sheet_{index:03d}{extension}")) for index in range(sheet_count)):
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+            return f"Error generating thumbnails: expected {sheet_count} sprite sheet(s)"
+        try:
+            with span("rename"):
+                os.replace(scratch_dir, cache_dir)
+            await store_derived(cache_dir)
+        except OSError:
+            # Another call cached the same thumbnails first
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    sheet_names = [f"{output_name}_{index:03d}{extension}" for index in range(sheet_count)]
+    cues = ["WEBVTT", ""]
+    for index, start in enumerate(starts):
+        cell = index % per_sheet
+        x, y = (cell % columns) * width, (cell // columns) * height
+        cues += [f"{vtt_timestamp(start)} --> {vtt_timestamp(min(start + interval, duration))}",
+                 f"{sheet_names[index // per_sheet]}#xywh={x},{y},{width},{height}", ""]
+    try:
+        async with staged_output(vtt_path) as staged_vtt:
+            with span("cache"):
+                for index, sheet_name in enumerate(sheet_names):
+                    await asyncio.to_thread(copy_file, os.path.join(cache_dir, f"sheet_{index:03d}{extension}"), os.path.join(os.path.dirname(staged_vtt), sheet_name))
+            with open(staged_vtt, "w") as f:
+                f.write("\n".join(cues))
+    except FileExistsError as e:
+        return f"Error: {e}"
+    return (f"Successfully generated {len(starts)} thumbnails in {sheet_count} sprite sheet(s) with index {output_name}.vtt"
+            + (" (cached)" if cached else ""))
+
 # Tool: Replace audio track in video
 @mcp.tool()
-def replace_audio_track(input_video: str, input_audio: str, output_file: str) -> str:
+@instrumented
+async def replace_audio_track(input_video: str, input_audio: str, output_file: str) -> str:
     """Replaces the audio track in a video file with a new audio file."""
-    video_path = os.path.join(MEDIA_DIR, input_video)
-    audio_path = os.path.join(MEDIA_DIR, input_audio)
+    video_path = resolve_input(input_video)
+    audio_path = resolve_input(input_audio)
     output_path = os.path.join(MEDIA_DIR, output_file)
 
-    if not os.path.exists(video_path):
+    if not await input_exists(video_path):
         return f"Error: Video file {input_video} not found."
-    if not os.path.exists(audio_path):
+    if not await input_exists(audio_path):
         return f"Error: Audio file {input_audio} not found."
     if os.path.exists(output_path):
         return f"Error: Output file {output_file} already exists."
@@ -427,22 +3087,23 @@ def replace_audio_track(input_video: str, input_audio: str, output_file: str) ->
         output_path
     ]
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return f"Successfully replaced audio in {output_file}"
+        return await cached_render("replace_audio_track", [video_path, audio_path], {}, output_path,
+                                   lambda staged_path: run_ffmpeg(staged_cmd(cmd, staged_path)), f"Successfully replaced audio in {output_file}")
     except subprocess.CalledProcessError as e:
         return f"Error replacing audio: {e.stderr.decode()}"
 
 # Tool: Overlay image on video (e.g., watermark)
 @mcp.tool()
-def overlay_image(input_video: str, input_image: str, position: str, output_file: str) -> str:
+@instrumented
+async def overlay_image(input_video: str, input_image: str, position: str, output_file: str, profile: str = DEFAULT_ENCODER_PROFILE) -> str:
     """Overlays an image on a video at a specified position."""
-    video_path = os.path.join(MEDIA_DIR, input_video)
-    image_path = os.path.join(MEDIA_DIR, input_image)
+    video_path = resolve_input(input_video)
+    image_path = resolve_input(input_image)
     output_path = os.path.join(MEDIA_DIR, output_file)
 
-    if not os.path.exists(video_path):
+    if not await input_exists(video_path):
         return f"Error: Video file {input_video} not found."
-    if not os.path.exists(image_path):
+    if not await input_exists(image_path):
         return f"Error: Image file {input_image} not found."
     if position not in POSITION_MAP:
         return f"Error: Invalid position. Must be one of {list(POSITION_MAP.keys())}"
@@ -450,6 +3111,10 @@ def overlay_image(input_video: str, input_image: str, position: str, output_file
         return f"Error: Output file {output_file} already exists."
     if not any(output_file.lower().endswith(ext) for ext in VIDEO_EXTENSIONS):
         return f"Error: Output file must have a video extension ({', '.join(VIDEO_EXTENSIONS)})"
+    profile = container_profile(profile, output_file)
+    profile_error = validate_encoder_profile(profile, output_file)
+    if profile_error:
+        return profile_error
 
     overlay_expr = POSITION_MAP[position]
     cmd = [
@@ -459,84 +3124,288 @@ def overlay_image(input_video: str, input_image: str, position: str, output_file
         "-filter_complex", f"[0:v][1:v]overlay={overlay_expr}[v]",
         "-map", "[v]",
         "-map", "0:a?",
-        "-c:v", "libx264",
+        *encoder_args(profile),
         "-c:a", "copy",
         output_path
     ]
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return f"Successfully overlaid image on {output_file}"
+        return await cached_render("overlay_image", [video_path, image_path], {"position": position, "encoder": encoder_args(profile)}, output_path,
+                                   lambda staged_path: run_ffmpeg(staged_cmd(cmd, staged_path)), f"Successfully overlaid image on {output_file}")
     except subprocess.CalledProcessError as e:
         return f"Error overlaying image: {e.stderr.decode()}"
 
-# Tool: Transform video (crop, scale, rotate, flip, transpose)
-# Updated transform_video tool
-@mcp.tool()
-def transform_video(input_file: str, transformation: str, params: Dict[str, Any], output_file: str) -> str:
-    """Applies a transformation (crop, scale, rotate, flip, transpose, pad) to a video."""
-    input_path = os.path.join(MEDIA_DIR, input_file)
-    output_path = os.path.join(MEDIA_DIR, output_file)
+# Helper function to read a numeric transformation parameter without letting filter syntax through
+def transform_number(params: Dict[str, Any], name: str, integer: bool = True):
+    """Returns params[name] as an int (or float), raising ValueError for anything that is not a finite number."""
+    value = params[name]
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number")
+    if not math.isfinite(number) or (integer and not number.is_integer()):
+        raise ValueError(f"{name} must be {'an integer' if integer else 'a finite number'}")
+    return int(number) if integer else number
 
-    if not os.path.exists(input_path):
-        return f"Error: Input file {input_file} not found."
+# Colors accepted by pad: names, #RRGGBB[AA] / 0xRRGGBB[AA], optionally @alpha
+PAD_COLOR = re.compile(r"^(?:[A-Za-z]+|#[0-9A-Fa-f]{6}(?:[0-9A-Fa-f]{2})?|0x[0-9A-Fa-f]{6}(?:[0-9A-Fa-f]{2})?)(?:@[0-9.]+)?$")
+
+# Helper function to build the filter string for a transformation
+def build_transform_filter(transformation: str, params: Dict[str, Any]) -> str:
+    """Returns the FFmpeg video filter for a transformation, raising ValueError on bad input."""
     if transformation not in TRANSFORM_PARAMS:
-        return f"Error: Invalid transformation. Must be one of {list(TRANSFORM_PARAMS.keys())}"
+        raise ValueError(f"Invalid transformation. Must be one of {list(TRANSFORM_PARAMS.keys())}")
     required_params = TRANSFORM_PARAMS[transformation]
     if not all(p in params for p in required_params):
-        return f"Error: Missing parameters for {transformation}. Required: {required_params}"
-    if os.path.exists(output_path):
-        return f"Error: Output file {output_file} already exists."
-    if not any(output_file.lower().endswith(ext) for ext in VIDEO_EXTENSIONS):
-        return f"Error: Output file must have a video extension ({', '.join(VIDEO_EXTENSIONS)})"
+        raise ValueError(f"Missing parameters for {transformation}. Required: {required_params}")
 
+    if transformation in ("crop", "scale", "pad"):
+        numbers = {name: transform_number(params, name) for name in required_params}
     if transformation == "crop":
-        filter_str = "crop={width}:{height}:{x}:{y}".format(**params)
+        return "crop={width}:{height}:{x}:{y}".format(**numbers)
     elif transformation == "scale":
-        filter_str = "scale={width}:{height}".format(**params)
+        return "scale={width}:{height}".format(**numbers)
     elif transformation == "rotate":
-        filter_str = "rotate={angle}*PI/180".format(**params)
+        return "rotate={angle}*PI/180".format(angle=transform_number(params, "angle", integer=False))
     elif transformation == "flip":
         direction = params["direction"]
         if direction not in ["horizontal", "vertical"]:
-            return "Error: direction must be 'horizontal' or 'vertical'"
-        filter_str = "hflip" if direction == "horizontal" else "vflip"
+            raise ValueError("direction must be 'horizontal' or 'vertical'")
+        return "hflip" if direction == "horizontal" else "vflip"
     elif transformation == "transpose":
         dir = params["dir"]
-        if not 0 <= dir <= 3:
-            return "Error: dir must be between 0 and 3"
-        filter_str = "transpose={dir}".format(**params)
+        if not isinstance(dir, int) or isinstance(dir, bool) or not 0 <= dir <= 3:
+            raise ValueError("dir must be an integer between 0 and 3")
+        return "transpose={dir}".format(**params)
     elif transformation == "pad":
         color = params.get("color", "black")
-        filter_str = "pad={width}:{height}:{x}:{y}:{color}".format(**params)
+        if not isinstance(color, str) or not PAD_COLOR.match(color):
+            raise ValueError("color must be a color name or #RRGGBB[AA], optionally with @alpha")
+        return "pad={width}:{height}:{x}:{y}:{color}".format(color=color, **numbers)
+
+# Shortest chunk worth encoding on its own in parallel mode, in seconds
+PARALLEL_MIN_SEGMENT = float(os.environ.get("MEDIA_PARALLEL_MIN_SEGMENT", 10))
+
+# Filters that carry state across frames or depend on the frame number: chunks are encoded with
+# their source timestamps (-copyts), so fades, fps and timed text line up, but these would restart per chunk
+STATEFUL_FILTER = re.compile(
+    r"(?:^|[,;\]])\s*(?:framerate|setpts|trim|select|zoompan|minterpolate|tmix|tblend|"
+    r"deflicker|deshake|loop)\b|\bn\b"
+)
+NOISE_FILTER = re.compile(r"(?:^|(?<=[,;\]]))\s*noise=([^,;\[]*)")
+
+# Helper function to give each parallel chunk its own noise seed
+def seed_noise_filters(filter_str: str, seed: int) -> str:
+    """Adds all_seed=seed to noise filters without an explicit seed, so chunks don't repeat the same grain."""
+    def add_seed(match: re.Match) -> str:
+        if "seed=" in match.group(1):
+            return match.group(0)
+        return f"{match.group(0)}:all_seed={seed}"
+    return NOISE_FILTER.sub(add_seed, filter_str)
 
+# Helper function to run a -vf re-encode, optionally split across parallel workers
+async def encode_filtered_video(input_path: str, filter_str: str, video_args: List[str], output_path: str, parallel: bool = False) -> None:
+    """Re-encodes the video stream of input_path through filter_str and copies audio, raising CalledProcessError on failure.
+
+    In parallel mode the video is split at keyframes, the chunks are encoded concurrently
+    in the FFmpeg worker pool and joined with the concat demuxer. The original audio is
+    muxed back untouched so it has no seams at chunk boundaries. Chunks keep their
+    source timestamps, so fades, fps and timed text behave as in a single pass, and
+    noise is seeded per chunk. Stateful filter chains always run as a single pass.
+    """
+    filter_args = ["-vf", filter_str] if filter_str else []
+    parallel = parallel and not STATEFUL_FILTER.search(filter_str or "")
+    duration = await get_video_duration(input_path) if parallel else 0.0
+    workers = min(MAX_FFMPEG_PROCESSES, int(duration // PARALLEL_MIN_SEGMENT))
+    single_pass_cmd = ["ffmpeg", "-i", input_path, *filter_args, *video_args, "-c:a", "copy", *muxer_args(output_path), output_path]
+    if workers < 2:
+        await run_ffmpeg(single_pass_cmd)
+        return
+
+    scratch_dir = make_scratch_dir("segments")
+    list_path = None
+    try:
+        # Split the video stream only; the segment muxer keeps the source timestamps in each chunk
+        await run_ffmpeg(build_segment_cmd(
+            input_path, duration / workers, os.path.join(scratch_dir, "source_%05d.mkv"), ["-map", "0:v:0"]
+        ))
+        sources = sorted(f for f in os.listdir(scratch_dir) if f.startswith("source_"))
+        if len(sources) < 2:
+            # Too few keyframes to split on; nothing to gain from chunking
+            await run_ffmpeg(single_pass_cmd)
+            return
+        encoded = [os.path.join(scratch_dir, f.replace("source_", "encoded_")) for f in sources]
+        # One failed chunk stops the others before the scratch directory goes away
+        await gather_or_cancel(*[
+            run_ffmpeg(
+                [
+                    "ffmpeg", "-copyts", "-i", os.path.join(scratch_dir, src),
+                    *(["-vf", seed_noise_filters(filter_str, index + 1)] if filter_str else []),
+                    *video_args, "-an", dst
+                ],
+                duration=duration / len(sources)
+            )
+            for index, (src, dst) in enumerate(zip(sources, encoded))
+        ])
+        list_path = write_concat_list(encoded)
+        cmd = [
+            "ffmpeg",
+            "-f", "concat",
+            "-safe", "0",
+            "-i", list_path,
+            "-i", input_path,
+            "-map", "0:v",
+            "-map", "1:a?",
+            "-c", "copy",
+            *muxer_args(output_path),
+            output_path
+        ]
+        await run_ffmpeg(cmd, duration=duration)
+    finally:
+        with span("temp"):
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+        if list_path is not None:
+            os.remove(list_path)
+
+# Proxy settings: small, short-GOP copies that make previews cheap to decode and seek
+PROXY_HEIGHT = int(os.environ.get("MEDIA_PROXY_HEIGHT", 360))
+PROXY_GOP = 12
+PROXY_DIR = os.path.join(CACHE_DIR, "proxies")
+# Length of a preview clip rendered from a proxy, in seconds
+PREVIEW_SECONDS = float(os.environ.get("MEDIA_PREVIEW_SECONDS", 3))
+PREVIEW_IMAGE_EXTENSIONS = ['.png', '.jpg']
+# Draft profile used for video previews written to containers libx264 cannot go into
+PREVIEW_CONTAINER_PROFILES = {".webm": "vp9-draft"}
+proxy_inflight = {}
+
+# Helper function to get (and build on first use) the proxy of a media file
+async def get_proxy(input_path: str) -> str:
+    """Returns the path of a cached low-resolution, short-GOP proxy for input_path, encoding it if needed."""
+    identity = json.dumps([*(await file_identity(input_path)), PROXY_HEIGHT, PROXY_GOP])
+    proxy_path = os.path.join(PROXY_DIR, hashlib.sha256(identity.encode()).hexdigest()[:32] + ".mp4")
+    if os.path.exists(proxy_path):
+        touch_derived(proxy_path)
+        return proxy_path
+    task = proxy_inflight.get(proxy_path)
+    if task is None:
+        # Concurrent previews of the same file share a single proxy encode
+        task = proxy_inflight[proxy_path] = asyncio.ensure_future(build_proxy(input_path, proxy_path))
+        task.add_done_callback(lambda _: proxy_inflight.pop(proxy_path, None))
+    await asyncio.shield(task)
+    return proxy_path
+
+async def build_proxy(input_path: str, proxy_path: str) -> None:
+    """Encodes a proxy next to its final path and renames it into place once complete."""
+    os.makedirs(PROXY_DIR, exist_ok=True)
+    staging = partial_path(proxy_path)
     cmd = [
-        "ffmpeg",
+        "ffmpeg", "-y",
         "-i", input_path,
-        "-vf", filter_str,
-        "-c:a", "copy",
-        output_path
+        "-vf", f"scale=-2:'min(ih,{PROXY_HEIGHT})'",
+        *encoder_args("draft"),
+        "-g", str(PROXY_GOP),
+        "-c:a", "aac", "-b:a", "96k",
+        *muxer_args(proxy_path),
+        staging
     ]
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return f"Successfully transformed video to {output_file}"
-    except subprocess.CalledProcessError as e:
-        return f"Error transforming video: {e.stderr.decode()}"
+        await run_ffmpeg(cmd)
+        with span("rename"):
+            os.replace(staging, proxy_path)
+    finally:
+        if os.path.exists(staging):
+            os.remove(staging)
+    await store_derived(proxy_path)
 
-import math
+# Helper function to pick the draft profile for a preview's container
+def preview_profile(output_file: str) -> str:
+    return PREVIEW_CONTAINER_PROFILES.get(os.path.splitext(output_file)[1].lower(), "draft")
 
+# Helper function to check a preview output name
+def validate_preview_output(output_file: str) -> str:
+    """Returns an error message if output_file cannot hold a preview image or clip, else None."""
+    if not any(output_file.lower().endswith(ext) for ext in VIDEO_EXTENSIONS + PREVIEW_IMAGE_EXTENSIONS):
+        return f"Error: Preview output must have a video or image extension ({', '.join(VIDEO_EXTENSIONS + PREVIEW_IMAGE_EXTENSIONS)})"
+    if os.path.splitext(output_file)[1].lower() in PREVIEW_IMAGE_EXTENSIONS:
+        return None
+    return validate_encoder_profile(preview_profile(output_file), output_file)
+
+# Helper function to render a quick preview of a filter graph from the proxy
+async def render_preview(input_path: str, filter_complex: str, output_path: str, overlay_inputs: List[str] = None) -> None:
+    """Renders filter_complex (which must output [v]) over a few seconds of the proxy, or one frame for image outputs.
+
+    Video previews use the container's draft profile; the proxy's AAC audio is copied unless
+    the container needs another codec.
+    """
+    proxy_path = await get_proxy(input_path)
+    cmd = ["ffmpeg", "-i", proxy_path]
+    for overlay_path in overlay_inputs or []:
+        cmd += ["-i", overlay_path]
+    cmd += ["-filter_complex", filter_complex, "-map", "[v]"]
+    if os.path.splitext(output_path)[1].lower() in PREVIEW_IMAGE_EXTENSIONS:
+        cmd += ["-frames:v", "1", output_path]
+    else:
+        extension = os.path.splitext(output_path)[1].lower()
+        audio_codec = AUDIO_CODEC_BY_EXTENSION.get(extension, "copy")
+        cmd += ["-map", "0:a?", "-t", str(PREVIEW_SECONDS), *encoder_args(preview_profile(output_path)), "-c:a", audio_codec,
+                *muxer_args(output_path), output_path]
+    await run_ffmpeg(cmd, duration=PREVIEW_SECONDS)
+
+# Tool to build a proxy ahead of previewing
 @mcp.tool()
-def apply_color_curves(input_file: str, red_curve: str, green_curve: str, blue_curve: str, output_file: str) -> str:
-    """Apply advanced color curve adjustments with contrast, saturation, and vignette for a realistic vintage look."""
-    input_path = os.path.join(MEDIA_DIR, input_file)
+@instrumented
+async def generate_proxy(input_file: str) -> str:
+    """Builds (or reuses) the cached low-resolution proxy used by preview=True renders."""
+    input_path = resolve_input(input_file)
+    if not await input_exists(input_path):
+        return f"Error: Input file {input_file} not found."
+    try:
+        proxy_path = await get_proxy(input_path)
+        return f"Proxy for {input_file} ready ({os.path.getsize(proxy_path)} bytes)"
+    except subprocess.CalledProcessError as e:
+        return f"Error generating proxy: {e.stderr.decode()}"
+
+# Tool: Transform video (crop, scale, rotate, flip, transpose)
+# Updated transform_video tool
+@mcp.tool()
+@instrumented
+async def transform_video(input_file: str, transformation: str, params: Dict[str, Any], output_file: str, parallel: bool = False, profile: str = DEFAULT_ENCODER_PROFILE) -> str:
+    """Applies a transformation (crop, scale, rotate, flip, transpose, pad) to a video."""
+    input_path = resolve_input(input_file)
     output_path = os.path.join(MEDIA_DIR, output_file)
-    
-    if not os.path.exists(input_path):
+
+    if not await input_exists(input_path):
         return f"Error: Input file {input_file} not found."
+    if transformation not in TRANSFORM_PARAMS:
+        return f"Error: Invalid transformation. Must be one of {list(TRANSFORM_PARAMS.keys())}"
+    required_params = TRANSFORM_PARAMS[transformation]
+    if not all(p in params for p in required_params):
+        return f"Error: Missing parameters for {transformation}. Required: {required_params}"
     if os.path.exists(output_path):
         return f"Error: Output file {output_file} already exists."
     if not any(output_file.lower().endswith(ext) for ext in VIDEO_EXTENSIONS):
         return f"Error: Output file must have a video extension ({', '.join(VIDEO_EXTENSIONS)})"
-    
+    profile = container_profile(profile, output_file)
+    profile_error = validate_encoder_profile(profile, output_file)
+    if profile_error:
+        return profile_error
+
+    try:
+        filter_str = build_transform_filter(transformation, params)
+    except ValueError as e:
+        return f"Error: {e}"
+
+    try:
+        return await cached_render("transform_video", [input_path], {"filter": filter_str, "encoder": encoder_args(profile)}, output_path,
+                                   lambda staged_path: encode_filtered_video(input_path, filter_str, encoder_args(profile), staged_path, parallel), f"Successfully transformed video to {output_file}")
+    except subprocess.CalledProcessError as e:
+        return f"Error transforming video: {e.stderr.decode()}"
+
+
+# Helper function to build the vintage color curves chain
+def build_color_curves_filter(red_curve: str, green_curve: str, blue_curve: str) -> str:
+    """Returns the curves, eq and vignette chain used by apply_color_curves."""
     # Define the advanced curves filter
     curves_filter = f"curves=red='{red_curve}':green='{green_curve}':blue='{blue_curve}'"
     
@@ -548,30 +3417,57 @@ def apply_color_curves(input_file: str, red_curve: str, green_curve: str, blue_c
     vignette_filter = f"vignette=angle={vignette_angle}"
     
     # Combine all filters
-    filter_str = ",".join([curves_filter, eq_filter, vignette_filter])
+    return ",".join([curves_filter, eq_filter, vignette_filter])
+
+@mcp.tool()
+@instrumented
+async def apply_color_curves(input_file: str, red_curve: str, green_curve: str, blue_curve: str, output_file: str, parallel: bool = False, profile: str = DEFAULT_ENCODER_PROFILE, preview: bool = False) -> str:
+    """Apply advanced color curve adjustments with contrast, saturation, and vignette for a realistic vintage look."""
+    input_path = resolve_input(input_file)
+    output_path = os.path.join(MEDIA_DIR, output_file)
     
-    cmd = [
-        "ffmpeg",
-        "-i", input_path,
-        "-vf", filter_str,
-        "-c:v", "libx264",
-        "-preset", "ultrafast",
-        "-c:a", "copy",
-        output_path
-    ]
+    if not await input_exists(input_path):
+        return f"Error: Input file {input_file} not found."
+    if os.path.exists(output_path):
+        return f"Error: Output file {output_file} already exists."
+    if preview:
+        preview_error = validate_preview_output(output_file)
+        if preview_error:
+            return preview_error
+    else:
+        if not any(output_file.lower().endswith(ext) for ext in VIDEO_EXTENSIONS):
+            return f"Error: Output file must have a video extension ({', '.join(VIDEO_EXTENSIONS)})"
+        profile = container_profile(profile, output_file)
+        profile_error = validate_encoder_profile(profile, output_file)
+        if profile_error:
+            return profile_error
+    
+    filter_str = build_color_curves_filter(red_curve, green_curve, blue_curve)
+    
+    if preview:
+        try:
+            async with staged_output(output_path) as staged_path:
+                await render_preview(input_path, f"[0:v]{filter_str or 'null'}[v]", staged_path)
+            return f"Successfully rendered color curves preview to {output_file}"
+        except FileExistsError as e:
+            return f"Error: {e}"
+        except subprocess.CalledProcessError as e:
+            return f"Error rendering preview: {e.stderr.decode()}"
+
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return f"Successfully applied color curves to {output_file}"
+        return await cached_render("apply_color_curves", [input_path], {"filter": filter_str, "encoder": encoder_args(profile)}, output_path,
+                                   lambda staged_path: encode_filtered_video(input_path, filter_str, encoder_args(profile), staged_path, parallel), f"Successfully applied color curves to {output_file}")
     except subprocess.CalledProcessError as e:
         return f"Error applying color curves: {e.stderr.decode()}"
 
 @mcp.tool()
-def set_video_fps(input_file: str, fps: float, output_file: str) -> str:
+@instrumented
+async def set_video_fps(input_file: str, fps: float, output_file: str, parallel: bool = False, profile: str = DEFAULT_ENCODER_PROFILE) -> str:
     """Set a custom frame rate for a vintage effect."""
-    input_path = os.path.join(MEDIA_DIR, input_file)
+    input_path = resolve_input(input_file)
     output_path = os.path.join(MEDIA_DIR, output_file)
     
-    if not os.path.exists(input_path):
+    if not await input_exists(input_path):
         return f"Error: Input file {input_file} not found."
     if fps <= 0:
         return "Error: fps must be positive."
@@ -579,30 +3475,27 @@ def set_video_fps(input_file: str, fps: float, output_file: str) -> str:
         return f"Error: Output file {output_file} already exists."
     if not any(output_file.lower().endswith(ext) for ext in VIDEO_EXTENSIONS):
         return f"Error: Output file must have a video extension ({', '.join(VIDEO_EXTENSIONS)})"
+    profile = container_profile(profile, output_file)
+    profile_error = validate_encoder_profile(profile, output_file)
+    if profile_error:
+        return profile_error
     
     filter_str = f"fps=fps={fps}"
     
-    cmd = [
-        "ffmpeg",
-        "-i", input_path,
-        "-vf", filter_str,
-        "-c:v", "libx264",
-        "-c:a", "copy",
-        output_path
-    ]
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return f"Successfully set fps to {fps} in {output_file}"
+        return await cached_render("set_video_fps", [input_path], {"filter": filter_str, "encoder": encoder_args(profile)}, output_path,
+                                   lambda staged_path: encode_filtered_video(input_path, filter_str, encoder_args(profile), staged_path, parallel), f"Successfully set fps to {fps} in {output_file}")
     except subprocess.CalledProcessError as e:
         return f"Error setting fps: {e.stderr.decode()}"
 
 @mcp.tool()
-def add_video_noise(input_file: str, noise_strength: int, noise_flags: str, output_file: str) -> str:
+@instrumented
+async def add_video_noise(input_file: str, noise_strength: int, noise_flags: str, output_file: str, parallel: bool = False, profile: str = DEFAULT_ENCODER_PROFILE) -> str:
     """Add noise to a video for a vintage effect."""
-    input_path = os.path.join(MEDIA_DIR, input_file)
+    input_path = resolve_input(input_file)
     output_path = os.path.join(MEDIA_DIR, output_file)
     
-    if not os.path.exists(input_path):
+    if not await input_exists(input_path):
         return f"Error: Input file {input_file} not found."
     if noise_strength < 0:
         return "Error: noise_strength must be non-negative."
@@ -610,33 +3503,30 @@ def add_video_noise(input_file: str, noise_strength: int, noise_flags: str, outp
         return f"Error: Output file {output_file} already exists."
     if not any(output_file.lower().endswith(ext) for ext in VIDEO_EXTENSIONS):
         return f"Error: Output file must have a video extension ({', '.join(VIDEO_EXTENSIONS)})"
+    profile = container_profile(profile, output_file)
+    profile_error = validate_encoder_profile(profile, output_file)
+    if profile_error:
+        return profile_error
     
     filter_str = f"noise=c0s={noise_strength}:c0f={noise_flags}"
     
-    cmd = [
-        "ffmpeg",
-        "-i", input_path,
-        "-vf", filter_str,
-        "-c:v", "libx264",
-        "-c:a", "copy",
-        output_path
-    ]
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return f"Successfully added noise to {output_file}"
+        return await cached_render("add_video_noise", [input_path], {"filter": filter_str, "encoder": encoder_args(profile)}, output_path,
+                                   lambda staged_path: encode_filtered_video(input_path, filter_str, encoder_args(profile), staged_path, parallel), f"Successfully added noise to {output_file}")
     except subprocess.CalledProcessError as e:
         return f"Error adding noise: {e.stderr.decode()}"
 
 @mcp.tool()
-def apply_overlay(input_file: str, overlay_file: str, position: str, opacity: float, output_file: str) -> str:
+@instrumented
+async def apply_overlay(input_file: str, overlay_file: str, position: str, opacity: float, output_file: str, profile: str = DEFAULT_ENCODER_PROFILE, preview: bool = False) -> str:
     """Apply an overlay video/image with position and opacity for a vintage effect."""
-    input_path = os.path.join(MEDIA_DIR, input_file)
-    overlay_path = os.path.join(MEDIA_DIR, overlay_file)
+    input_path = resolve_input(input_file)
+    overlay_path = resolve_input(overlay_file)
     output_path = os.path.join(MEDIA_DIR, output_file)
     
-    if not os.path.exists(input_path):
+    if not await input_exists(input_path):
         return f"Error: Input file {input_file} not found."
-    if not os.path.exists(overlay_path):
+    if not await input_exists(overlay_path):
         return f"Error: Overlay file {overlay_file} not found."
     if position not in POSITION_MAP:
         return f"Error: Invalid position. Must be one of {list(POSITION_MAP.keys())}"
@@ -644,10 +3534,37 @@ def apply_overlay(input_file: str, overlay_file: str, position: str, opacity: fl
         return "Error: opacity must be between 0 and 1."
     if os.path.exists(output_path):
         return f"Error: Output file {output_file} already exists."
-    if not any(output_file.lower().endswith(ext) for ext in VIDEO_EXTENSIONS):
-        return f"Error: Output file must have a video extension ({', '.join(VIDEO_EXTENSIONS)})"
+    if preview:
+        preview_error = validate_preview_output(output_file)
+        if preview_error:
+            return preview_error
+    else:
+        if not any(output_file.lower().endswith(ext) for ext in VIDEO_EXTENSIONS):
+            return f"Error: Output file must have a video extension ({', '.join(VIDEO_EXTENSIONS)})"
+        profile = container_profile(profile, output_file)
+        profile_error = validate_encoder_profile(profile, output_file)
+        if profile_error:
+            return profile_error
     
     overlay_expr = POSITION_MAP[position]
+    if preview:
+        # Shrink the overlay by the same factor as the proxy so the preview keeps its proportions
+        try:
+            metadata = await probe_media(input_path)
+            height = next((st.get("height") for st in metadata.get("streams", []) if st.get("codec_type") == "video"), None)
+            scale = min(1.0, PROXY_HEIGHT / height) if height else 1.0
+            preview_graph = (
+                f"[1:v]scale=iw*{scale}:-1,format=yuva444p,colorchannelmixer=aa={opacity}[overlay];"
+                f"[0:v][overlay]overlay={overlay_expr}[v]"
+            )
+            async with staged_output(output_path) as staged_path:
+                await render_preview(input_path, preview_graph, staged_path, [overlay_path])
+            return f"Successfully rendered overlay preview to {output_file}"
+        except FileExistsError as e:
+            return f"Error: {e}"
+        except subprocess.CalledProcessError as e:
+            return f"Error rendering preview: {e.stderr.decode()}"
+
     filter_complex = (
         f"[1:v]format=yuva444p,colorchannelmixer=aa={opacity}[overlay];"
         f"[0:v][overlay]overlay={overlay_expr}[v]"
@@ -660,109 +3577,773 @@ def apply_overlay(input_file: str, overlay_file: str, position: str, opacity: fl
         "-filter_complex", filter_complex,
         "-map", "[v]",
         "-map", "0:a?",
-        "-c:v", "libx264",
+        *encoder_args(profile),
         "-c:a", "copy",
         output_path
     ]
     try:
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return f"Successfully applied overlay to {output_file}"
+        return await cached_render("apply_overlay", [input_path, overlay_path], {"filter_complex": filter_complex, "encoder": encoder_args(profile)}, output_path,
+                                   lambda staged_path: run_ffmpeg(staged_cmd(cmd, staged_path)), f"Successfully applied overlay to {output_file}")
     except subprocess.CalledProcessError as e:
         return f"Error applying overlay: {e.stderr.decode()}"
 
 
+# How often the filters directory is checked for added, changed or removed templates, in seconds
+TEMPLATE_RELOAD_INTERVAL = float(os.environ.get("MEDIA_TEMPLATE_RELOAD_INTERVAL", 2))
+CURVE_PATTERN = re.compile(r"^\s*(\d*\.?\d+/\d*\.?\d+\s*)+$")
+NOISE_FLAGS_PATTERN = re.compile(r"^[atpu](\+[atpu])*$")
+# Allowed template sections and, per field, (type, minimum, maximum) or a pattern
+TEMPLATE_SCHEMA = {
+    "curves": {"red": CURVE_PATTERN, "green": CURVE_PATTERN, "blue": CURVE_PATTERN},
+    "eq": {"contrast": (float, -1000, 1000), "saturation": (float, 0, 3), "brightness": (float, -1, 1), "gamma": (float, 0.1, 10)},
+    "vignette": {"angle": (float, 0, math.pi / 2)},
+    "fps": (float, 0.001, 1000),
+    "noise": {"strength": (int, 0, 100), "flags": NOISE_FLAGS_PATTERN}
+}
+# Sections every resolved template must define in full
+TEMPLATE_REQUIRED_FIELDS = {"curves": ["red", "green", "blue"], "eq": [], "vignette": ["angle"], "noise": ["strength", "flags"]}
+TEMPLATE_METADATA = ["name", "description", "extends"]
+
+# Helper function to check one template value against its schema rule
+def validate_template_value(path: str, value: Any, rule: Any) -> None:
+    if isinstance(rule, re.Pattern):
+        if not isinstance(value, str) or not rule.match(value):
+            raise ValueError(f"{path} has an invalid value {value!r}")
+        if rule is CURVE_PATTERN and any(not 0 <= float(n) <= 1 for point in value.split() for n in point.split("/")):
+            raise ValueError(f"{path} points must lie between 0 and 1")
+        return
+    kind, low, high = rule
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or (kind is int and value != int(value)):
+        raise ValueError(f"{path} must be {'an integer' if kind is int else 'a number'}")
+    if not low <= value <= high:
+        raise ValueError(f"{path} must be between {low:g} and {high:g}")
+
+# Helper function to validate a fully resolved template
+def validate_template(template: Dict[str, Any]) -> None:
+    """Raises ValueError naming the first unknown section or field, wrong type or out-of-range value."""
+    for section, value in template.items():
+        if section in TEMPLATE_METADATA:
+            continue
+        if section not in TEMPLATE_SCHEMA:
+            raise ValueError(f"unknown section {section!r}; allowed: {list(TEMPLATE_SCHEMA) + TEMPLATE_METADATA}")
+        rules = TEMPLATE_SCHEMA[section]
+        if not isinstance(rules, dict):
+            validate_template_value(section, value, rules)
+            continue
+        if not isinstance(value, dict):
+            raise ValueError(f"{section} must be an object")
+        for field, field_value in value.items():
+            if field not in rules:
+                raise ValueError(f"unknown field {section}.{field}; allowed: {list(rules)}")
+            validate_template_value(f"{section}.{field}", field_value, rules[field])
+        missing = [f for f in TEMPLATE_REQUIRED_FIELDS.get(section, []) if f not in value]
+        if missing or not value:
+            raise ValueError(f"{section} is missing {missing or 'a setting'}")
+
+# Helper function to merge a child template (or overrides) over its parent
+def merge_template(base: Dict[str, Any], changes: Dict[str, Any]) -> Dict[str, Any]:
+    """Merges section by section; a None value removes the section or field."""
+    merged = {k: dict(v) if isinstance(v, dict) else v for k, v in base.items()}
+    for key, value in changes.items():
+        if value is None:
+            merged.pop(key, None)
+        elif isinstance(value, dict) and isinstance(merged.get(key), dict):
+            for field, field_value in value.items():
+                if field_value is None:
+                    merged[key].pop(field, None)
+                else:
+                    merged[key][field] = field_value
+        else:
+            merged[key] = dict(value) if isinstance(value, dict) else value
+    return merged
+
+# Helper function to compile a filter template into a single -vf chain
+def compile_filter_template(template: Dict[str, Any]) -> str:
+    """Returns one comma-separated video filter chain for a filter template."""
+    filters = []
+    if "curves" in template:
+        curves = template["curves"]
+        filters.append(f"curves=red='{curves['red']}':green='{curves['green']}':blue='{curves['blue']}'")
+    if "eq" in template:
+        filters.append("eq=" + ":".join(f"{k}={v}" for k, v in template["eq"].items()))
+    if "vignette" in template:
+        filters.append(f"vignette=angle={template['vignette']['angle']}")
+    if "fps" in template:
+        filters.append(f"fps=fps={template['fps']}")
+    if "noise" in template:
+        noise = template["noise"]
+        filters.append(f"noise=c0s={noise['strength']}:c0f={noise['flags']}")
+    return ",".join(filters)
+
+class TemplateRegistry:
+    """Filter templates from a directory, validated and compiled ahead of use.
+
+    Templates may name a parent with "extends"; the child's sections are merged over the
+    parent's. reload() re-reads only when a file was added, removed or modified, and a
+    template that fails validation is kept with its error so it is rejected before encoding.
+    Lookups only read the compiled templates in memory; reloads run in template_reload_loop.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.mtimes = None
+        self.raw = {}
+        self.templates = {}
+        # Serializes the first load with background reloads running in a worker thread
+        self.lock = threading.Lock()
+
+    def scan(self) -> Dict[str, int]:
+        try:
+            return {
+                entry.name[:-5]: entry.stat().st_mtime_ns
+                for entry in os.scandir(self.directory)
+                if entry.name.endswith(".json") and entry.is_file()
+            }
+        except FileNotFoundError:
+            return {}
+
+    def reload(self, force: bool = False) -> bool:
+        """Re-reads and recompiles the templates if the directory changed; returns True if it did."""
+        with self.lock:
+            return self.reload_locked(force)
+
+    def reload_locked(self, force: bool) -> bool:
+        mtimes = self.scan()
+        if mtimes == self.mtimes and not force:
+            return False
+        raw = {}
+        for name, mtime in mtimes.items():
+            if self.mtimes and self.mtimes.get(name) == mtime and name in self.raw:
+                raw[name] = self.raw[name]
+                continue
+            try:
+                with open(os.path.join(self.directory, f"{name}.json"), "r") as f:
+                    raw[name] = json.load(f)
+                if not isinstance(raw[name], dict):
+                    raise ValueError("template must be a JSON object")
+            except (OSError, ValueError) as e:
+                raw[name] = e
+        self.raw = raw
+        # Parents may have changed, so every template is resolved again (they are tiny)
+        self.templates = {name: self.build(name) for name in raw}
+        # Set last, so refresh() never sees a half-finished first load as loaded
+        self.mtimes = mtimes
+        return True
+
+    def resolve(self, name: str, chain: List[str]) -> Dict[str, Any]:
+        if name in chain:
+            raise ValueError(f"inheritance cycle {' -> '.join(chain + [name])}")
+        if name not in self.raw:
+            raise ValueError(f"parent template {name} not found")
+        raw = self.raw[name]
+        if isinstance(raw, Exception):
+            raise ValueError(f"{name}.json could not be read: {raw}")
+        chain.append(name)
+        parent = raw.get("extends")
+        if parent is None:
+            return dict(raw)
+        if not isinstance(parent, str):
+            raise ValueError("extends must be a template name")
+        return merge_template(self.resolve(parent, chain), raw)
+
+    def build(self, name: str) -> Dict[str, Any]:
+        chain = []
+        try:
+            template = self.resolve(name, chain)
+            template.pop("extends", None)
+            validate_template(template)
+            return {"template": template, "chain": chain, "filter": compile_filter_template(template), "error": None}
+        except ValueError as e:
+            return {"template": None, "chain": chain, "filter": None, "error": str(e)}
+
+    def refresh(self) -> None:
+        """Loads the templates if nothing has loaded them yet (no reload task is running)."""
+        if self.mtimes is None:
+            with self.lock:
+                if self.mtimes is None:
+                    self.reload_locked(False)
+
+    def get(self, name: str, overrides: Dict[str, Any] = None) -> str:
+        """Returns the compiled filter chain for name with optional overrides, raising ValueError."""
+        self.refresh()
+        entry = self.templates.get(name)
+        if entry is None:
+            raise ValueError(f"Filter template {name} not found.")
+        if entry["error"]:
+            raise ValueError(f"Filter template {name} is invalid: {entry['error']}")
+        if not overrides:
+            return entry["filter"]
+        if not isinstance(overrides, dict):
+            raise ValueError("Overrides must be an object of template sections.")
+        template = merge_template(entry["template"], overrides)
+        try:
+            validate_template(template)
+        except ValueError as e:
+            raise ValueError(f"Invalid overrides for {name}: {e}")
+        return compile_filter_template(template)
+
+template_registry = TemplateRegistry(os.path.join(MEDIA_DIR, "filters"))
+template_reload_task = None
+
+async def template_reload_loop() -> None:
+    """Picks up template edits in the background so requests never pay for a reload."""
+    while True:
+        try:
+            await asyncio.to_thread(template_registry.reload)
+        except OSError:
+            pass
+        await asyncio.sleep(TEMPLATE_RELOAD_INTERVAL)
+
+def ensure_template_registry() -> None:
+    """Loads the templates and starts watching the filters directory on the running loop."""
+    global template_reload_task
+    if template_reload_task is None:
+        template_registry.reload()
+        template_reload_task = asyncio.create_task(template_reload_loop(), context=contextvars.Context())
+
+# Helper function to look up a compiled template
+def load_filter_template(template_name: str, overrides: Dict[str, Any] = None) -> str:
+    """Returns the compiled filter chain for a registered template, raising ValueError on failure."""
+    return template_registry.get(template_name, overrides)
+
 # Tool to apply a filter template (without overlay)
 @mcp.tool()
-def apply_filter_template(input_file: str, template_name: str, output_file: str) -> str:
-    """Apply a predefined filter template to a video."""
-    input_path = os.path.join(MEDIA_DIR, input_file)
+@instrumented
+async def apply_filter_template(input_file: str, template_name: str, output_file: str, parallel: bool = False, profile: str = DEFAULT_ENCODER_PROFILE,
+                                preview: bool = False, overrides: Dict[str, Any] = None) -> str:
+    """Apply a predefined filter template to a video in a single FFmpeg pass.
+
+    overrides are merged over the template, e.g. {"noise": {"strength": 5}} or {"vignette": null}.
+    """
+    input_path = resolve_input(input_file)
     output_path = os.path.join(MEDIA_DIR, output_file)
-    template_path = os.path.join(MEDIA_DIR, "filters", f"{template_name}.json")
     
     # Validation checks
-    if not os.path.exists(input_path):
+    if not await input_exists(input_path):
         return f"Error: Input file {input_file} not found."
-    if not os.path.exists(template_path):
-        return f"Error: Filter template {template_name} not found."
     if os.path.exists(output_path):
         return f"Error: Output file {output_file} already exists."
-    if not any(output_file.lower().endswith(ext) for ext in VIDEO_EXTENSIONS):
-        return f"Error: Output file must have a video extension ({', '.join(VIDEO_EXTENSIONS)})"
-    
-    with open(template_path, "r") as f:
-        template = json.load(f)
-    
-    current_file = input_file
-    temp_files = []
-    
-    # Apply curves, eq, and vignette in one step
-    if "curves" in template and "eq" in template and "vignette" in template:
-        curves = template["curves"]
-        eq = template["eq"]
-        vignette = template["vignette"]
-        
-        curves_filter = f"curves=red='{curves['red']}':green='{curves['green']}':blue='{curves['blue']}'"
-        eq_filter = f"eq=contrast={eq['contrast']}:saturation={eq['saturation']}"
-        vignette_filter = f"vignette=angle={vignette['angle']}"
-        filter_str = ",".join([curves_filter, eq_filter, vignette_filter])
-        
-        temp_output = f"temp_{len(temp_files)}.mp4"
-        temp_files.append(temp_output)
-        cmd = [
-            "ffmpeg", "-i", os.path.join(MEDIA_DIR, current_file),
-            "-vf", filter_str, "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "copy",
-            os.path.join(MEDIA_DIR, temp_output)
-        ]
-        subprocess.run(cmd, check=True)
-        current_file = temp_output
-    
-    # Apply fps
-    if "fps" in template:
-        fps = template["fps"]
-        temp_output = f"temp_{len(temp_files)}.mp4"
-        temp_files.append(temp_output)
-        cmd = [
-            "ffmpeg", "-i", os.path.join(MEDIA_DIR, current_file),
-            "-vf", f"fps=fps={fps}", "-c:v", "libx264", "-c:a", "copy",
-            os.path.join(MEDIA_DIR, temp_output)
-        ]
-        subprocess.run(cmd, check=True)
-        current_file = temp_output
-    
-    # Apply noise
-    if "noise" in template:
-        noise = template["noise"]
-        filter_str = f"noise=c0s={noise['strength']}:c0f={noise['flags']}"
-        temp_output = f"temp_{len(temp_files)}.mp4"
-        temp_files.append(temp_output)
-        cmd = [
-            "ffmpeg", "-i", os.path.join(MEDIA_DIR, current_file),
-            "-vf", filter_str, "-c:v", "libx264", "-c:a", "copy",
-            os.path.join(MEDIA_DIR, temp_output)
-        ]
-        subprocess.run(cmd, check=True)
-        current_file = temp_output
-    
-    # Rename the final temp file to the output file
-    os.rename(os.path.join(MEDIA_DIR, current_file), output_path)
+    if preview:
+        preview_error = validate_preview_output(output_file)
+        if preview_error:
+            return preview_error
+    else:
+        if not any(output_file.lower().endswith(ext) for ext in VIDEO_EXTENSIONS):
+            return f"Error: Output file must have a video extension ({', '.join(VIDEO_EXTENSIONS)})"
+        profile = container_profile(profile, output_file)
+        profile_error = validate_encoder_profile(profile, output_file)
+        if profile_error:
+            return profile_error
     
-    # Clean up temporary files
-    for temp_file in temp_files:
-        if os.path.exists(os.path.join(MEDIA_DIR, temp_file)):
-            os.remove(os.path.join(MEDIA_DIR, temp_file))
+    # Curves, eq, vignette, fps and noise all go into one chain: one decode, one encode
+    try:
+        filter_str = load_filter_template(template_name, overrides)
+    except ValueError as e:
+        return f"Error: {e}"
     
-    return f"Successfully applied {template_name} filter to {output_file}"
+    if preview:
+        try:
+            async with staged_output(output_path) as staged_path:
+                await render_preview(input_path, f"[0:v]{filter_str or 'null'}[v]", staged_path)
+            return f"Successfully rendered {template_name} preview to {output_file}"
+        except FileExistsError as e:
+            return f"Error: {e}"
+        except subprocess.CalledProcessError as e:
+            return f"Error rendering preview: {e.stderr.decode()}"
+
+    try:
+        return await cached_render("apply_filter_template", [input_path], {"template": filter_str, "encoder": encoder_args(profile)}, output_path,
+                                   lambda staged_path: encode_filtered_video(input_path, filter_str, encoder_args(profile), staged_path, parallel), f"Successfully applied {template_name} filter to {output_file}")
+    except subprocess.CalledProcessError as e:
+        return f"Error applying {template_name} filter: {e.stderr.decode()}"
 
 # Tool to list available filters
 @mcp.tool()
 def list_filter_templates() -> str:
-    """List available filter templates."""
-    filters_dir = os.path.join(MEDIA_DIR, "filters")
-    if not os.path.exists(filters_dir):
+    """Lists usable filter templates, plus any that fail validation with their error."""
+    template_registry.refresh()
+    if not template_registry.templates:
         return "No filter templates found."
-    
-    templates = [f.split(".")[0] for f in os.listdir(filters_dir) if f.endswith(".json")]
-    return json.dumps(templates)
+    entries = sorted(template_registry.templates.items())
+    return json.dumps({
+        "templates": [name for name, entry in entries if entry["error"] is None],
+        # Broken templates stay visible so an operator can tell which edit needs fixing
+        "invalid": [{"name": name, "error": entry["error"]} for name, entry in entries if entry["error"] is not None]
+    })
+
+# Tool to describe one filter template
+@mcp.tool()
+def describe_filter_template(template_name: str) -> str:
+    """Returns a template's resolved settings, inheritance chain, compiled FFmpeg filter and any validation error."""
+    template_registry.refresh()
+    entry = template_registry.templates.get(template_name)
+    if entry is None:
+        return f"Error: Filter template {template_name} not found."
+    return json.dumps({"name": template_name, **entry})
+
+# Helper function to compile pipeline operations into one filter graph
+async def build_pipeline(input_path: str, operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Returns input options, overlay inputs and filter graphs for a run_pipeline spec, raising ValueError on bad input."""
+    input_options = []
+    overlay_inputs = []
+    graph = []
+    video_chain = []
+    audio_chain = []
+    video_label = "0:v"
+    duration = None
+
+    def flush_video_chain():
+        nonlocal video_label
+        if video_chain:
+            graph.append(f"[{video_label}]{','.join(video_chain)}[v{len(graph)}]")
+            video_label = f"v{len(graph) - 1}"
+            video_chain.clear()
+
+    for step, op in enumerate(operations):
+        if not isinstance(op, dict):
+            raise ValueError(f"Operation at step {step} must be an object.")
+        kind = op.get("op")
+        if kind not in PIPELINE_OPERATIONS:
+            raise ValueError(f"Invalid operation at step {step}. Must be one of {list(PIPELINE_OPERATIONS.keys())}")
+        required_params = PIPELINE_OPERATIONS[kind]
+        if not all(p in op for p in required_params):
+            raise ValueError(f"Missing parameters for {kind} at step {step}. Required: {required_params}")
+        for name, value in op.items():
+            expected = PIPELINE_PARAM_TYPES.get(name)
+            if expected is None or (kind == "template" and name == "overrides" and value is None):
+                continue
+            if isinstance(value, bool) or not isinstance(value, expected):
+                type_name = {str: "a string", dict: "an object", (int, float, str): "seconds or [HH:]MM:SS[.ms]"}.get(expected, "a number")
+                raise ValueError(f"Parameter {name} of {kind} at step {step} must be {type_name}.")
+
+        if kind == "trim":
+            if step != 0:
+                raise ValueError("trim must be the first operation in a pipeline.")
+            # Same parameters and time formats as trim_video
+            try:
+                start, length = parse_time(op["start_time"]), parse_time(op["duration"])
+            except ValueError:
+                raise ValueError("trim start_time and duration must be seconds or [HH:]MM:SS[.ms].")
+            if length <= 0:
+                raise ValueError("trim duration must be positive.")
+            input_options = ["-ss", str(start), "-t", str(length)]
+            source_duration = await get_video_duration(input_path)
+            if source_duration > 0:
+                duration = max(min(source_duration - start, length), 0.0)
+        elif kind == "transform":
+            video_chain.append(build_transform_filter(op["transformation"], op["params"]))
+        elif kind == "color_curves":
+            video_chain.append(build_color_curves_filter(op["red"], op["green"], op["blue"]))
+        elif kind == "template":
+            filter_str = load_filter_template(op["name"], op.get("overrides"))
+            if filter_str:
+                video_chain.append(filter_str)
+        elif kind == "fps":
+            if op["fps"] <= 0:
+                raise ValueError("fps must be positive.")
+            video_chain.append(f"fps=fps={op['fps']}")
+        elif kind == "noise":
+            if op["strength"] < 0:
+                raise ValueError("noise strength must be non-negative.")
+            if not NOISE_FLAGS_PATTERN.match(op["flags"]):
+                raise ValueError("noise flags must be a combination of a, t, p and u, e.g. 't+u'.")
+            video_chain.append(f"noise=c0s={op['strength']}:c0f={op['flags']}")
+        elif kind == "fade":
+            fade_in, fade_out = float(op.get("fade_in", 0)), float(op.get("fade_out", 0))
+            if fade_in < 0 or fade_out < 0:
+                raise ValueError("Fade durations must be non-negative.")
+            if duration is None:
+                duration = await get_video_duration(input_path)
+            if duration == 0.0:
+                raise ValueError("Could not determine video duration.")
+            # Silent inputs have no [0:a] to fade
+            streams = (await probe_media(input_path)).get("streams", [])
+            has_audio = any(st.get("codec_type") == "audio" for st in streams)
+            if fade_in > 0:
+                video_chain.append(f"fade=t=in:st=0:d={fade_in}")
+                if has_audio:
+                    audio_chain.append(f"afade=t=in:st=0:d={fade_in}")
+            if fade_out > 0:
+                fade_out_start = max(duration - fade_out, 0)
+                video_chain.append(f"fade=t=out:st={fade_out_start}:d={fade_out}")
+                if has_audio:
+                    audio_chain.append(f"afade=t=out:st={fade_out_start}:d={fade_out}")
+        elif kind == "overlay":
+            overlay_path = resolve_input(op["file"])
+            opacity = float(op.get("opacity", 1.0))
+            if not await input_exists(overlay_path):
+                raise ValueError(f"Overlay file {op['file']} not found.")
+            if op["position"] not in POSITION_MAP:
+                raise ValueError(f"Invalid position. Must be one of {list(POSITION_MAP.keys())}")
+            if not 0 <= opacity <= 1:
+                raise ValueError("opacity must be between 0 and 1.")
+            flush_video_chain()
+            overlay_inputs.append(overlay_path)
+            index = len(overlay_inputs)
+            graph.append(f"[{index}:v]format=yuva444p,colorchannelmixer=aa={opacity}[ov{index}]")
+            graph.append(f"[{video_label}][ov{index}]overlay={POSITION_MAP[op['position']]}[v{len(graph)}]")
+            video_label = f"v{len(graph) - 1}"
+
+    flush_video_chain()
+    if audio_chain:
+        graph.append(f"[0:a]{','.join(audio_chain)}[aout]")
+    return {
+        "input_options": input_options,
+        "overlay_inputs": overlay_inputs,
+        "filter_complex": ";".join(graph),
+        "video_label": video_label if video_label != "0:v" else None,
+        "audio_label": "aout" if audio_chain else None
+    }
+
+# Tool to run several operations in a single decode/encode pass
+@mcp.tool()
+@instrumented
+async def run_pipeline(input_file: str, operations: List[Dict[str, Any]], output_file: str, profile: str = DEFAULT_ENCODER_PROFILE) -> str:
+    """Runs an ordered list of operations (trim, transform, color_curves, template, fps, noise, fade, overlay) in one FFmpeg pass.
+
+    Each operation is a dict with an "op" key plus its parameters, e.g.
+    {"op": "transform", "transformation": "crop", "params": {...}} or
+    {"op": "overlay", "file": "logo.png", "position": "top-right", "opacity": 0.5}.
+    Template operations accept the same "overrides" as apply_filter_template.
+    Streams that no operation touches are copied instead of re-encoded.
+    """
+    input_path = resolve_input(input_file)
+    output_path = os.path.join(MEDIA_DIR, output_file)
+
+    if os.path.sep in output_file:
+        return "Error: Output file name cannot contain directory separators."
+    if not await input_exists(input_path):
+        return f"Error: Input file {input_file} not found."
+    if os.path.exists(output_path):
+        return f"Error: Output file {output_file} already exists."
+    if not any(output_file.lower().endswith(ext) for ext in VIDEO_EXTENSIONS):
+        return f"Error: Output file must have a video extension ({', '.join(VIDEO_EXTENSIONS)})"
+    if not operations:
+        return "Error: operations must contain at least one operation."
+    profile = container_profile(profile, output_file)
+    profile_error = validate_encoder_profile(profile, output_file)
+    if profile_error:
+        return profile_error
+
+    try:
+        pipeline = await build_pipeline(input_path, operations)
+    except ValueError as e:
+        return f"Error: {e}"
+
+    cmd = ["ffmpeg", *pipeline["input_options"], "-i", input_path]
+    for overlay_path in pipeline["overlay_inputs"]:
+        cmd += ["-i", overlay_path]
+    if pipeline["filter_complex"]:
+        cmd += ["-filter_complex", pipeline["filter_complex"]]
+
+    if pipeline["video_label"]:
+        cmd += ["-map", f"[{pipeline['video_label']}]", *encoder_args(profile)]
+    else:
+        cmd += ["-map", "0:v?", "-c:v", "copy"]
+    if pipeline["audio_label"]:
+        cmd += ["-map", f"[{pipeline['audio_label']}]", "-c:a", "aac"]
+    else:
+        cmd += ["-map", "0:a?", "-c:a", "copy"]
+    cmd += [output_path]
+
+    mode = "stream copy" if not pipeline["video_label"] and not pipeline["audio_label"] else "single pass"
+    try:
+        return await cached_render("run_pipeline", [input_path, *pipeline["overlay_inputs"]], {"pipeline": pipeline, "encoder": encoder_args(profile)}, output_path,
+                                   lambda staged_path: run_ffmpeg(staged_cmd(cmd, staged_path)),
+                                   f"Successfully ran {len(operations)} operations on {output_file} ({mode})")
+    except subprocess.CalledProcessError as e:
+        return f"Error running pipeline: {e.stderr.decode()}"
+
+# Operations that can be run as background jobs
+JOB_OPERATIONS = {
+    "split_video": split_video,
+    "fade_video": fade_video,
+    "trim_video": trim_video,
+    "concatenate_videos": concatenate_videos,
+    "merge_audio_video": merge_audio_video,
+    "extract_audio": extract_audio,
+    "images_to_video": images_to_video,
+    "video_to_images": video_to_images,
+    "replace_audio_track": replace_audio_track,
+    "overlay_image": overlay_image,
+    "transform_video": transform_video,
+    "apply_color_curves": apply_color_curves,
+    "set_video_fps": set_video_fps,
+    "add_video_noise": add_video_noise,
+    "apply_overlay": apply_overlay,
+    "apply_filter_template": apply_filter_template,
+    "run_pipeline": run_pipeline,
+    "generate_proxy": generate_proxy,
+    "package_stream": package_stream,
+    "process_audio": process_audio,
+    "generate_thumbnails": generate_thumbnails
+}
+
+JOB_STATUSES = ["queued", "running", "succeeded", "failed", "cancelled"]
+# Number of jobs executed concurrently; FFmpeg itself is still bounded by MAX_FFMPEG_PROCESSES
+JOB_WORKERS = int(os.environ.get("MEDIA_JOB_WORKERS", MAX_FFMPEG_PROCESSES))
+
+job_db = None
+job_queue = None
+job_workers = []
+running_jobs = {}
+job_sequence = itertools.count()
+
+# Helper function to open the persistent job table
+def get_job_db() -> sqlite3.Connection:
+    """Returns the SQLite connection holding the job table, creating it on first use."""
+    global job_db
+    if job_db is None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        job_db = sqlite3.connect(os.path.join(CACHE_DIR, "jobs.db"))
+        job_db.row_factory = sqlite3.Row
+        job_db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, operation TEXT, params TEXT, priority INTEGER, status TEXT, "
+            "result TEXT, created REAL, started REAL, finished REAL, progress TEXT, owner INTEGER)"
+        )
+        columns = [row["name"] for row in job_db.execute("PRAGMA table_info(jobs)")]
+        if "progress" not in columns:
+            job_db.execute("ALTER TABLE jobs ADD COLUMN progress TEXT")
+        # PID of the server running the job; several servers may share one MEDIA_CACHE_DIR
+        if "owner" not in columns:
+            job_db.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")
+        job_db.commit()
+    return job_db
+
+def update_job(job_id: str, **fields) -> None:
+    """Persists changed fields of a job record."""
+    db = get_job_db()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", [*fields.values(), job_id])
+    db.commit()
+
+def get_job(job_id: str) -> Dict[str, Any]:
+    """Returns a job record as a dict, or None if it does not exist."""
+    row = get_job_db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    return job
+
+def enqueue_job(job_id: str, priority: int) -> None:
+    """Queues a job; higher priority values run first, ties run in submission order."""
+    job_queue.put_nowait((-priority, next(job_sequence), job_id))
+
+# Helper function to start the job workers and resume persisted jobs
+def ensure_job_workers() -> None:
+    """Starts the background job workers on the running loop and re-queues unfinished jobs."""
+    global job_queue
+    if job_workers:
+        return
+    job_queue = asyncio.PriorityQueue()
+    db = get_job_db()
+    # Jobs whose server stopped while running them are started again from scratch; jobs other
+    # live servers are running are left to them
+    for row in db.execute("SELECT id, owner, started FROM jobs WHERE status = 'running'").fetchall():
+        if row["owner"] is None or is_orphan(row["owner"], created=row["started"] or 0):
+            db.execute("UPDATE jobs SET status = 'queued', started = NULL, owner = NULL WHERE id = ? AND status = 'running'", (row["id"],))
+    db.commit()
+    for row in db.execute("SELECT id, priority FROM jobs WHERE status = 'queued' ORDER BY created"):
+        enqueue_job(row["id"], row["priority"])
+    for _ in range(JOB_WORKERS):
+        # A fresh context keeps jobs from inheriting the request that happened to start the workers
+        job_workers.append(asyncio.create_task(job_worker(), context=contextvars.Context()))
+
+async def job_worker() -> None:
+    """Runs queued jobs until the server shuts down."""
+    while True:
+        _, _, job_id = await job_queue.get()
+        job = get_job(job_id)
+        if job is None or job["status"] != "queued":
+            continue
+        # Claim the job atomically; another server sharing the job table may have queued it too
+        db = get_job_db()
+        claimed = db.execute(
+            "UPDATE jobs SET status = 'running', started = ?, progress = NULL, owner = ? WHERE id = ? AND status = 'queued'",
+            (time.time(), os.getpid(), job_id)
+        ).rowcount
+        db.commit()
+        if not claimed:
+            continue
+        current_job_id.set(job_id)
+        task = asyncio.create_task(JOB_OPERATIONS[job["operation"]](**job["params"]))
+        current_job_id.set(None)
+        running_jobs[job_id] = task
+        await asyncio.wait([task])
+        running_jobs.pop(job_id, None)
+        if task.cancelled():
+            update_job(job_id, status="cancelled", result="Cancelled while running.", finished=time.time())
+        elif task.exception() is not None:
+            update_job(job_id, status="failed", result=f"Error: {task.exception()}", finished=time.time())
+        else:
+            result = str(task.result())
+            status = "failed" if result.startswith("Error") else "succeeded"
+            update_job(job_id, status=status, result=result, finished=time.time())
+
+# Tool to submit an operation as a background job
+@mcp.tool()
+async def submit_job(operation: str, params: Dict[str, Any], priority: int = 0) -> str:
+    """Queues a media operation to run in the background and returns its job id. Higher priority runs first."""
+    if operation not in JOB_OPERATIONS:
+        return f"Error: Invalid operation. Must be one of {list(JOB_OPERATIONS.keys())}"
+    try:
+        inspect.signature(JOB_OPERATIONS[operation]).bind(**params)
+    except TypeError as e:
+        return f"Error: Invalid parameters for {operation}: {e}"
+
+    ensure_job_workers()
+    job_id = uuid.uuid4().hex[:12]
+    db = get_job_db()
+    db.execute(
+        "INSERT INTO jobs (id, operation, params, priority, status, created) VALUES (?, ?, ?, ?, 'queued', ?)",
+        (job_id, operation, json.dumps(params), priority, time.time())
+    )
+    db.commit()
+    enqueue_job(job_id, priority)
+    return json.dumps({"job_id": job_id, "status": "queued"})
+
+# Tool to poll a background job
+@mcp.tool()
+async def job_status(job_id: str) -> str:
+    """Returns the status and, once finished, the result of a background job."""
+    ensure_job_workers()
+    job = get_job(job_id)
+    if job is None:
+        return f"Error: Job {job_id} not found."
+    return json.dumps(job)
+
+# Tool to cancel a background job
+@mcp.tool()
+async def cancel_job(job_id: str) -> str:
+    """Cancels a queued or running job, killing its FFmpeg process if one is running."""
+    ensure_job_workers()
+    job = get_job(job_id)
+    if job is None:
+        return f"Error: Job {job_id} not found."
+    if job["status"] == "queued":
+        update_job(job_id, status="cancelled", result="Cancelled before start.", finished=time.time())
+        return f"Successfully cancelled job {job_id}"
+    if job["status"] == "running" and job_id in running_jobs:
+        running_jobs[job_id].cancel()
+        return f"Successfully cancelled job {job_id}"
+    return f"Error: Job {job_id} is already {job['status']}."
+
+# Tool to list background jobs
+@mcp.tool()
+async def list_jobs(status: str = None) -> str:
+    """Lists background jobs, newest first, optionally filtered by status."""
+    if status is not None and status not in JOB_STATUSES:
+        return f"Error: Invalid status. Must be one of {JOB_STATUSES}"
+    ensure_job_workers()
+    query = "SELECT * FROM jobs"
+    args = []
+    if status is not None:
+        query += " WHERE status = ?"
+        args.append(status)
+    rows = get_job_db().execute(query + " ORDER BY created DESC", args).fetchall()
+    return json.dumps([{**dict(row), "params": json.loads(row["params"])} for row in rows])
+
+BATCH_FAILURE_POLICIES = ["continue", "stop"]
+# Items processed concurrently by batch_apply; FFmpeg itself is still bounded by MAX_FFMPEG_PROCESSES
+BATCH_CONCURRENCY = int(os.environ.get("MEDIA_BATCH_CONCURRENCY", MAX_FFMPEG_PROCESSES))
+
+# Helper function to find the input and output parameters of a batchable operation
+def batch_params(operation: str) -> tuple:
+    """Returns (input parameter, output parameter) for an operation that maps one input file to one output."""
+    parameters = inspect.signature(JOB_OPERATIONS[operation]).parameters
+    input_param = next(iter(parameters))
+    output_param = next((name for name in parameters if name.startswith("output")), None)
+    if parameters[input_param].annotation is not str or output_param is None:
+        raise ValueError(f"Operation {operation} does not take a single input file and output.")
+    return input_param, output_param
+
+# Tool to apply one operation across many files
+@mcp.tool()
+@instrumented
+async def batch_apply(operation: str, params: Dict[str, Any], output_name: str, files: List[str] = None, pattern: str = None, failure_policy: str = "continue") -> str:
+    """Runs operation on every file in files or matching pattern (e.g. "*.mp4", top level of the media directory only); output_name may use {stem}, {ext}, {name} and {index}."""
+    if operation not in JOB_OPERATIONS:
+        return f"Error: Invalid operation. Must be one of {list(JOB_OPERATIONS.keys())}"
+    if failure_policy not in BATCH_FAILURE_POLICIES:
+        return f"Error: Invalid failure policy. Must be one of {BATCH_FAILURE_POLICIES}"
+    if (files is None) == (pattern is None):
+        return "Error: Provide exactly one of files or pattern."
+    try:
+        input_param, output_param = batch_params(operation)
+    except ValueError as e:
+        return f"Error: {e}"
+
+    if pattern is not None:
+        # Tools write outputs next to the media directory's top-level files only, so match those alone
+        if os.path.sep in pattern or "/" in pattern:
+            return "Error: Pattern cannot contain directory separators."
+        found = await asyncio.to_thread(walk_media_dir)
+        files = sorted(name for name in found if os.path.sep not in name and fnmatch.fnmatch(name, pattern))
+    if not files:
+        return "Error: No input files matched."
+
+    items = []
+    for index, input_file in enumerate(files):
+        name = os.path.basename(input_file)
+        stem, ext = os.path.splitext(name)
+        try:
+            output_file = output_name.format(stem=stem, ext=ext, name=name, index=index)
+        except (KeyError, IndexError, ValueError) as e:
+            return f"Error: Invalid output name {output_name}: {e}"
+        if os.path.sep in output_file or "/" in output_file:
+            return "Error: Output name cannot contain directory separators."
+        items.append({"input_file": input_file, "output_file": output_file})
+    outputs = [item["output_file"] for item in items]
+    if len(set(outputs)) != len(outputs):
+        return "Error: Output name produces duplicate output files; include {stem} or {index}."
+    if set(outputs) & set(files):
+        return "Error: Output name would overwrite an input file."
+    try:
+        inspect.signature(JOB_OPERATIONS[operation]).bind(**{**params, input_param: files[0], output_param: outputs[0]})
+    except TypeError as e:
+        return f"Error: Invalid parameters for {operation}: {e}"
+
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+    stop = asyncio.Event()
+
+    async def run_item(item: Dict[str, Any]) -> Dict[str, Any]:
+        async with slots:
+            if stop.is_set():
+                item["status"] = "skipped"
+                return item
+            in_batch.set(True)
+            started = time.monotonic()
+            try:
+                message = await JOB_OPERATIONS[operation](**{**params, input_param: item["input_file"], output_param: item["output_file"]})
+            except Exception as e:
+                message = f"Error: {e}"
+            item["seconds"] = round(time.monotonic() - started, 3)
+            item["status"] = "failed" if message.startswith("Error") else "succeeded"
+            item["message"] = message
+            if item["status"] == "failed" and failure_policy == "stop":
+                stop.set()
+            return item
+
+    started = time.monotonic()
+    done = 0
+    for finished in asyncio.as_completed([run_item(item) for item in items]):
+        await finished
+        done += 1
+        await report_progress({"percent": round(100 * done / len(items), 1), "items_done": done, "items_total": len(items)})
+    wall_seconds = time.monotonic() - started
+
+    counts = {status: sum(1 for item in items if item["status"] == status) for status in ["succeeded", "failed", "skipped"]}
+    item_seconds = sum(item.get("seconds", 0) for item in items)
+    return json.dumps({
+        "operation": operation,
+        **counts,
+        "wall_seconds": round(wall_seconds, 3),
+        "item_seconds": round(item_seconds, 3),
+        "speedup": round(item_seconds / wall_seconds, 2) if wall_seconds > 0 else None,
+        "items": items
+    })
 
 # Run the server
 if __name__ == "__main__":